@@ -0,0 +1,176 @@
+"""
+Admission control for the expensive upload endpoints.
+
+Every endpoint gets a cap on concurrently running pipelines and a bounded wait queue. The
+queue is ordered by size (page count measured at ingest), so a burst of large bundles does
+not hold up small documents. A request that finds the queue full, or waits longer than the
+maximum queueing time, is rejected with 429 and a Retry-After estimate instead of piling up
+LLM calls that would all time out together.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from app.metrics import Counter, Gauge
+
+# Pipelines running at the same time per endpoint (per worker)
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "4"))
+
+# Requests waiting for a slot per endpoint; further requests are rejected right away
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "16"))
+
+# Seconds a request may wait for a slot before it is rejected
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "30"))
+
+admission_in_flight = Gauge("admission_in_flight", "Pipelines running per endpoint")
+admission_queue_depth = Gauge("admission_queue_depth", "Requests waiting for a pipeline slot per endpoint")
+admission_admitted = Counter("admission_admitted_total", "Requests admitted per endpoint")
+admission_rejected = Counter(
+    "admission_rejected_total",
+    "Requests rejected per endpoint and reason (queue_full, timeout)"
+)
+
+
+class AdmissionRejected(Exception):
+    """The endpoint is at capacity; the client should retry after retry_after seconds."""
+
+    def __init__(self, endpoint: str, reason: str, retry_after: int):
+        super().__init__(f"{endpoint} is at capacity ({reason}), retry after {retry_after} s")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency cap with a bounded priority queue for one endpoint.
+
+    Lower priority values are admitted first; requests with the same priority are admitted
+    in arrival order.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        max_wait: float = ADMISSION_MAX_WAIT
+    ):
+        self.endpoint = endpoint
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.running = 0
+        self._queue: List[Tuple[float, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        # Moving average of the pipeline duration, for the Retry-After estimate
+        self._average_duration: Optional[float] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new request."""
+        duration = self._average_duration or self.max_wait
+        rounds = (self.waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, math.ceil(duration * rounds))
+
+    def _update_metrics(self) -> None:
+        admission_in_flight.set(self.running, endpoint=self.endpoint)
+        admission_queue_depth.set(self.waiting, endpoint=self.endpoint)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        admission_rejected.inc(endpoint=self.endpoint, reason=reason)
+        return AdmissionRejected(self.endpoint, reason, self.retry_after())
+
+    def _release(self, duration: Optional[float] = None) -> None:
+        self.running -= 1
+        if duration is not None:
+            if self._average_duration is None:
+                self._average_duration = duration
+            else:
+                self._average_duration = 0.8 * self._average_duration + 0.2 * duration
+
+        # Hand the slot to the waiting request with the lowest priority value
+        while self._queue and self.running < self.max_concurrency:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                self.running += 1
+                future.set_result(None)
+        self._update_metrics()
+
+    async def _acquire(self, priority: float) -> None:
+        if self.running < self.max_concurrency and not self.waiting:
+            self.running += 1
+            return
+        if self.waiting >= self.queue_size:
+            raise self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        self._update_metrics()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done() or future.cancelled():
+                future.cancel()
+                raise self._reject("timeout")
+            # The slot was handed over just as the wait timed out
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the request was cancelled, pass it on
+                self._release()
+            future.cancel()
+            raise
+        finally:
+            self._update_metrics()
+
+    @asynccontextmanager
+    async def admit(self, priority: float = 0) -> AsyncIterator[None]:
+        """
+        Wait for a pipeline slot and hold it for the duration of the block.
+
+        Args:
+            priority: Admission priority, lower first (e.g. the page count of the document)
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait exceeded max_wait
+        """
+        await self._acquire(priority)
+        admission_admitted.inc(endpoint=self.endpoint)
+        self._update_metrics()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def admission(endpoint: str) -> AdmissionController:
+    """The admission controller of an endpoint."""
+    if endpoint not in _controllers:
+        _controllers[endpoint] = AdmissionController(endpoint)
+    return _controllers[endpoint]
+
+
+def page_count(pdf_path: str) -> int:
+    """
+    Number of pages of an uploaded PDF, used as its admission priority. Unreadable files
+    count as 0; the pipeline reports the actual error.
+    """
+    import fitz  # PyMuPDF, imported on first use to keep worker startup fast
+
+    try:
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        return 0
@@ -0,0 +1,424 @@
+"""
+Sensitivity and breakpoint analysis of evaluation models.
+
+An evaluation model (the 'questions' and 'calculationOrder' of /parse-evaluation-components/)
+turns a bid's answers into an evaluation price, the same way calculateTotalSum does in the
+frontend:
+
+    total = (base + sum of adjustments) * (1 + sum of percentages)
+
+and the bid with the lowest total wins. Holding the other answers fixed, the total is
+linear in the base answer and piecewise constant in every range, map or percentage answer
+(an answer in a gap between ranges or outside all of them adjusts nothing).
+So for each criterion of a bid the points where its ranking against the other bids flips,
+and the smallest change that makes it win, follow directly from the ranges and mappings
+instead of from re-evaluating the model over a grid.
+"""
+import bisect
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+NUMBER_PATTERN = re.compile(r'^\s*[+-]?(Infinity|(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?)')
+
+
+def parse_number(value: Any) -> float:
+    """A response as a number, read like JavaScript's parseFloat (0 if unreadable)."""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_PATTERN.match(str(value))
+    return float(match.group(0).replace("Infinity", "inf")) if match else 0.0
+
+
+def mapping_key(value: Any) -> str:
+    """A response as a mapping key, converted like a JavaScript property key."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def find_range(ranges: List[Dict[str, Any]], value: float) -> Optional[Dict[str, Any]]:
+    """The first range containing the value, as the frontend picks it."""
+    return next((r for r in ranges if r["min"] <= value <= r["max"]), None)
+
+
+def range_segments(ranges: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Split the number line into the segments in which a range criterion gives the same
+    adjustment: the defined ranges (the first one wins where they overlap, as in the
+    frontend) and the gaps before, between and after them, where the adjustment is 0.
+
+    Returns:
+        Segments in ascending order, each with its 'min' and 'max' (None if unbounded),
+        whether they are included ('min_inclusive', 'max_inclusive') and the 'range' that
+        applies (None in a gap)
+    """
+    points = sorted({r["min"] for r in ranges} | {r["max"] for r in ranges})
+    pieces = [(None, points[0], False, False)]
+    for index, point in enumerate(points):
+        pieces.append((point, point, True, True))
+        pieces.append((point, points[index + 1] if index + 1 < len(points) else None, False, False))
+
+    segments: List[Dict[str, Any]] = []
+    for low, high, low_inclusive, high_inclusive in pieces:
+        segment = {"min": low, "max": high, "min_inclusive": low_inclusive, "max_inclusive": high_inclusive}
+        segment["range"] = find_range(ranges, segment_point(segment))
+        if segments and segments[-1]["range"] is segment["range"]:
+            segments[-1].update(max=high, max_inclusive=high_inclusive)
+        else:
+            segments.append(segment)
+    return segments
+
+
+def segment_point(segment: Dict[str, Any]) -> float:
+    """A value inside a segment: its lower bound if included, otherwise an inner point."""
+    low, high = segment["min"], segment["max"]
+    if low is not None and segment["min_inclusive"]:
+        return low
+    if low is None:
+        return high - 1
+    if high is None:
+        return low + 1
+    return (low + high) / 2
+
+
+def in_segment(segment: Dict[str, Any], value: float) -> bool:
+    low, high = segment["min"], segment["max"]
+    above_low = low is None or value > low or (segment["min_inclusive"] and value == low)
+    below_high = high is None or value < high or (segment["max_inclusive"] and value == high)
+    return above_low and below_high
+
+
+def closest_in_segment(segment: Dict[str, Any], value: float) -> Tuple[float, bool]:
+    """
+    The value of a segment closest to the given one, and whether it is in the segment: for
+    a bound that is not, the answer has to pass it (there is no closest value).
+    """
+    if in_segment(segment, value):
+        return value, True
+    if segment["min"] is not None and value <= segment["min"]:
+        return segment["min"], segment["min_inclusive"]
+    return segment["max"], segment["max_inclusive"]
+
+
+def decompose(
+    questions: Dict[str, Dict[str, Any]],
+    calculation_order: List[str],
+    responses: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    The parts of the total of one bid.
+
+    Returns:
+        Dictionary with the 'base' value, the 'base_question' that set it (the last answered
+        base question in the calculation order), the sum of the 'adjustments', the
+        percentage 'multiplier' and the 'contributions' of the other questions as
+        question id -> (operation, value)
+    """
+    parts = {"base": 0.0, "base_question": None, "adjustments": 0.0, "multiplier": 1.0, "contributions": {}}
+    for question_id in calculation_order:
+        question = questions.get(question_id)
+        if question is None or question_id not in responses:
+            continue
+        value = responses[question_id]
+        evaluation = question.get("evaluation", {})
+        operation, value_type = evaluation.get("operation"), evaluation.get("valueType")
+
+        if operation == "base" and value_type == "direct":
+            parts["base"], parts["base_question"] = parse_number(value), question_id
+            continue
+        if operation == "adjust" and value_type == "range" and evaluation.get("ranges"):
+            matching = find_range(evaluation["ranges"], parse_number(value))
+            contribution = matching["value"] if matching else 0
+        elif value_type == "map" and operation in ("adjust", "percent") and evaluation.get("mapping"):
+            contribution = evaluation["mapping"].get(mapping_key(value), 0) or 0
+        else:
+            continue
+        parts["adjustments" if operation == "adjust" else "multiplier"] += contribution
+        previous = parts["contributions"].get(question_id, (operation, 0))[1]
+        parts["contributions"][question_id] = (operation, previous + contribution)
+    return parts
+
+
+def calculate_total(questions: Dict[str, Dict[str, Any]], calculation_order: List[str], responses: Dict[str, Any]) -> float:
+    """Evaluation price of a bid, identical to calculateTotalSum in the frontend."""
+    parts = decompose(questions, calculation_order, responses)
+    return (parts["base"] + parts["adjustments"]) * parts["multiplier"]
+
+
+def without(parts: Dict[str, Any], question_id: str) -> Tuple[float, float, float]:
+    """Base, adjustments and multiplier of a bid without the contribution of one question."""
+    base, adjustments, multiplier = parts["base"], parts["adjustments"], parts["multiplier"]
+    operation, contribution = parts["contributions"].get(question_id, ("adjust", 0))
+    if operation == "adjust":
+        adjustments -= contribution
+    else:
+        multiplier -= contribution
+    return base, adjustments, multiplier
+
+
+class Competition:
+    """The totals of the other bids, sorted for ranking a candidate total against them."""
+
+    def __init__(self, others: Dict[str, float]):
+        self.others = others
+        self.bids = sorted(others, key=others.get)
+        self.totals = [others[bid] for bid in self.bids]
+        self.best = self.totals[0] if self.totals else math.inf
+
+    def rank(self, total: float) -> int:
+        """Rank of a total among the others (1 = best, i.e. lowest); ties share a rank."""
+        return 1 + bisect.bisect_left(self.totals, total)
+
+    def outcome(self, total: float) -> Dict[str, Any]:
+        return {
+            "total": _round(total),
+            "rank": self.rank(total),
+            # Bids with a strictly higher total, best first
+            "beats": self.bids[bisect.bisect_right(self.totals, total):],
+            "wins": total < self.best,
+        }
+
+
+def _round(value: float) -> float:
+    return round(value, 6)
+
+
+def analyze_base(
+    question_id: str,
+    questions: Dict[str, Dict[str, Any]],
+    calculation_order: List[str],
+    responses: Dict[str, Any],
+    parts: Dict[str, Any],
+    competition: Competition
+) -> Dict[str, Any]:
+    """
+    Breakpoints of a base (direct) criterion: total(b) = (b + adjustments) * multiplier is
+    linear in the answer b, so the bid passes another bid at exactly one value.
+    """
+    current = parse_number(responses.get(question_id, 0))
+    if question_id not in responses:
+        # Whether the answer would take effect depends on the base questions answered after it
+        parts = decompose(questions, calculation_order, {**responses, question_id: 0})
+    adjustments, multiplier = parts["adjustments"], parts["multiplier"]
+    result: Dict[str, Any] = {"kind": "linear", "current": current}
+    if parts["base_question"] != question_id or multiplier == 0:
+        # Overridden by a later base question, or multiplied away
+        result.update(breakpoints=[], to_win=None, effect="none")
+        return result
+
+    # Below the breakpoint the bid beats the other bid if the multiplier is positive
+    direction = "below" if multiplier > 0 else "above"
+    result["breakpoints"] = sorted(
+        ({"bid": bid, "at": _round(total / multiplier - adjustments), "wins": direction}
+         for bid, total in competition.others.items()),
+        key=lambda breakpoint: breakpoint["at"]
+    )
+
+    threshold = competition.best / multiplier - adjustments if competition.others else None
+    result["to_win"] = None if threshold is None else {
+        "value": _round(threshold),
+        "direction": direction,
+        "change": _round(threshold - current),
+        # Ties do not win, the answer has to pass the threshold
+        "already_winning": (current < threshold) if multiplier > 0 else (current > threshold),
+    }
+    return result
+
+
+def analyze_range(
+    question_id: str,
+    segments: List[Dict[str, Any]],
+    responses: Dict[str, Any],
+    parts: Dict[str, Any],
+    competition: Competition
+) -> Dict[str, Any]:
+    """
+    Breakpoints of a range criterion: the total is constant within each range and within
+    each gap between ranges (no adjustment), so the ranking can only flip at a bound.
+    """
+    current = parse_number(responses[question_id]) if question_id in responses else None
+
+    # The total without this criterion, plus the adjustment of each segment
+    base, adjustments, multiplier = without(parts, question_id)
+    outcomes = []
+    for segment in segments:
+        value = segment["range"]["value"] if segment["range"] else 0
+        outcomes.append({
+            **{key: segment[key] for key in ("min", "max", "min_inclusive", "max_inclusive")},
+            "value": value,
+            "in_range": segment["range"] is not None,
+            **competition.outcome((base + adjustments + value) * multiplier),
+        })
+
+    # Bounds between neighbouring segments where the rank changes; 'inclusive' tells
+    # whether the value 'at' itself already has the rank above
+    breakpoints = [
+        {"at": upper["min"], "inclusive": upper["min_inclusive"],
+         "rank_below": lower["rank"], "rank_above": upper["rank"]}
+        for lower, upper in zip(outcomes, outcomes[1:])
+        if lower["rank"] != upper["rank"]
+    ]
+
+    to_win = None
+    winning = [outcome for outcome in outcomes if outcome["wins"]]
+    if winning:
+        if current is None:
+            closest = winning[0]
+            value, inclusive = segment_point(closest), True
+        else:
+            closest = min(winning, key=lambda outcome: abs(closest_in_segment(outcome, current)[0] - current))
+            value, inclusive = closest_in_segment(closest, current)
+        to_win = {
+            # With 'inclusive' False the answer has to pass the value, not reach it
+            "value": value,
+            "inclusive": inclusive,
+            "range": {key: closest[key] for key in ("min", "max", "min_inclusive", "max_inclusive", "in_range")},
+            "change": None if current is None else _round(value - current),
+            "total": closest["total"],
+            "already_winning": current is not None and in_segment(closest, current),
+        }
+    return {"kind": "range", "current": current, "ranges": outcomes, "breakpoints": breakpoints, "to_win": to_win}
+
+
+def analyze_choice(
+    question_id: str,
+    questions: Dict[str, Dict[str, Any]],
+    responses: Dict[str, Any],
+    parts: Dict[str, Any],
+    competition: Competition
+) -> Dict[str, Any]:
+    """
+    Outcome of every alternative of a map or percentage criterion. Alternatives have no
+    order, so instead of breakpoints every alternative gets its total and rank.
+    """
+    evaluation = questions[question_id]["evaluation"]
+    current = mapping_key(responses[question_id]) if question_id in responses else None
+
+    # The total without this criterion, plus the adjustment or percentage of each alternative
+    base, adjustments, multiplier = without(parts, question_id)
+    alternatives = []
+    for alternative, value in evaluation["mapping"].items():
+        value = value or 0
+        if evaluation["operation"] == "percent":
+            total = (base + adjustments) * (multiplier + value)
+        else:
+            total = (base + adjustments + value) * multiplier
+        alternatives.append({"alternative": alternative, **competition.outcome(total)})
+    alternatives.sort(key=lambda alternative: alternative["total"])
+
+    winning = [alternative for alternative in alternatives if alternative["wins"]]
+    to_win = None
+    if winning:
+        # Keep the current answer if it wins, otherwise take the best alternative
+        chosen = next((alternative for alternative in winning if alternative["alternative"] == current), winning[0])
+        to_win = {
+            "value": chosen["alternative"],
+            "total": chosen["total"],
+            "already_winning": chosen["alternative"] == current,
+        }
+    return {"kind": "choice", "current": current, "alternatives": alternatives, "to_win": to_win}
+
+
+def analyze_criterion(
+    question_id: str,
+    questions: Dict[str, Dict[str, Any]],
+    calculation_order: List[str],
+    responses: Dict[str, Any],
+    parts: Dict[str, Any],
+    competition: Competition,
+    segments: Dict[str, List[Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    """
+    Sensitivity of one bid's total to one criterion, None if the criterion is not scored.
+    The segments of the range criteria (see range_segments) are the same for every bid.
+    """
+    evaluation = questions[question_id].get("evaluation", {})
+    operation, value_type = evaluation.get("operation"), evaluation.get("valueType")
+    if operation == "base" and value_type == "direct":
+        return analyze_base(question_id, questions, calculation_order, responses, parts, competition)
+    if operation == "adjust" and value_type == "range" and evaluation.get("ranges"):
+        return analyze_range(question_id, segments[question_id], responses, parts, competition)
+    if operation in ("adjust", "percent") and value_type == "map" and evaluation.get("mapping"):
+        return analyze_choice(question_id, questions, responses, parts, competition)
+    return None
+
+
+def analyze_sensitivity(
+    questions: List[Dict[str, Any]],
+    calculation_order: List[str],
+    bids: Dict[str, Dict[str, Any]],
+    targets: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Rank the bids and analyse, per bid and criterion, where the ranking flips and what it
+    takes to win.
+
+    Args:
+        questions: The questions of the evaluation model
+        calculation_order: The calculation order of the evaluation model
+        bids: Answers per bid, as question id -> answer
+        targets: Bids to analyse, all bids by default
+
+    Returns:
+        Dictionary with the 'totals', the 'ranking' (best first), the 'winner' (None on a
+        tie) and per analysed bid its 'total', 'rank' and per criterion the breakpoints
+        against the other bids and the change needed to win ('to_win')
+
+    Raises:
+        ValueError: If the model or the bids are malformed
+    """
+    if not bids:
+        raise ValueError("At least one bid is required")
+    by_id = {}
+    for question in questions:
+        if not isinstance(question, dict) or "id" not in question:
+            raise ValueError("Every question needs an 'id'")
+        by_id[question["id"]] = question
+    for ranged in by_id.values():
+        for r in ranged.get("evaluation", {}).get("ranges") or []:
+            if not all(isinstance(r.get(key), (int, float)) for key in ("min", "max", "value")):
+                raise ValueError(f"Question {ranged['id']} has a range without numeric min, max and value")
+    targets = list(bids) if targets is None else targets
+    unknown = [bid for bid in targets if bid not in bids]
+    if unknown:
+        raise ValueError(f"Unknown bids: {', '.join(unknown)}")
+
+    parts = {bid: decompose(by_id, calculation_order, responses) for bid, responses in bids.items()}
+    totals = {bid: (p["base"] + p["adjustments"]) * p["multiplier"] for bid, p in parts.items()}
+    segments = {
+        question_id: range_segments(question["evaluation"]["ranges"])
+        for question_id, question in by_id.items()
+        if question.get("evaluation", {}).get("valueType") == "range" and question["evaluation"].get("ranges")
+    }
+    ranking = sorted(totals, key=lambda bid: totals[bid])
+    winner = ranking[0] if len(ranking) == 1 or totals[ranking[0]] < totals[ranking[1]] else None
+
+    analysis = {}
+    for bid in targets:
+        competition = Competition({other: total for other, total in totals.items() if other != bid})
+        criteria = {}
+        for question_id in dict.fromkeys(calculation_order):
+            if question_id not in by_id:
+                continue
+            criterion = analyze_criterion(question_id, by_id, calculation_order, bids[bid], parts[bid], competition, segments)
+            if criterion is not None:
+                criteria[question_id] = criterion
+        analysis[bid] = {
+            "total": _round(totals[bid]),
+            "rank": competition.rank(totals[bid]),
+            "criteria": criteria,
+        }
+
+    return {
+        "totals": {bid: _round(total) for bid, total in totals.items()},
+        "ranking": ranking,
+        "winner": winner,
+        "bids": analysis,
+    }
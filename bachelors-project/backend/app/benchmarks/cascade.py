@@ -0,0 +1,171 @@
+"""
+Single-tier vs. cascaded section classification (step 1).
+
+Classifies every section of the sample corpus once with the single model and once with the
+two-tier cascade (CASCADE=1, see app/step1/llm_sections.py), and reports per mode the LLM
+calls and tokens per model, the estimated cost, the wall time, the escalation rate of the
+cascade, how often the cascade agrees with the single tier, and precision/recall on the
+labelled documents (app/benchmarks/expected_sections.json).
+
+Runs against the offline stand-in (app/fake_llm.py) by default, where the cheap model is
+FAKE_LLM_LITE_LATENCY_FACTOR times faster. Pass --backend gemini to measure the real models.
+Run from the backend directory:
+
+    python -m app.benchmarks.cascade
+    python -m app.benchmarks.cascade --threshold 0.9 --json cascade.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from app.benchmarks.llm_quality import EXPECTATIONS_PATH, score
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CORPUS_GLOB = os.path.join(BACKEND_DIR, "app", "uploads", "*.pdf")
+
+# USD per million (prompt, output) tokens; list prices at the time of writing, only used to
+# compare the modes with each other
+MODEL_PRICES = {
+    "gemini-2.0-flash-001": (0.10, 0.40),
+    "gemini-2.0-flash-lite-001": (0.075, 0.30),
+}
+
+
+def cost(tokens: Dict[str, Dict[str, float]]) -> float:
+    """Estimated cost in USD of the tokens used per model."""
+    total = 0.0
+    for model, usage in tokens.items():
+        prompt_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES["gemini-2.0-flash-001"])
+        total += (usage["prompt"] * prompt_price + usage["output"] * output_price) / 1_000_000
+    return total
+
+
+def usage_snapshot(models: List[str]) -> Dict[str, Dict[str, float]]:
+    from app.llm import llm_calls, llm_tokens
+
+    return {
+        model: {
+            "calls": llm_calls.total(model=model, outcome="ok") + llm_calls.total(model=model, outcome="error"),
+            "prompt": llm_tokens.total(model=model, kind="prompt"),
+            "output": llm_tokens.total(model=model, kind="output"),
+        }
+        for model in models
+    }
+
+
+async def run_mode(cascade: bool, pdf_paths: List[str], labels: Dict[str, Any]) -> Dict[str, Any]:
+    """Classify the corpus in one mode and measure it."""
+    from app.llm import DEFAULT_MODEL
+    from app.parsers.ocr_fallback import stream_sections_with_ocr
+    from app.step1.llm_sections import (
+        CASCADE_FIRST_MODEL, CASCADE_SECOND_MODEL, analyze_section_stream, section_cascade
+    )
+
+    os.environ["CASCADE"] = "1" if cascade else "0"
+    models = list(dict.fromkeys([DEFAULT_MODEL, CASCADE_FIRST_MODEL, CASCADE_SECOND_MODEL]))
+    before = usage_snapshot(models)
+    escalated_before = section_cascade.value(tier="2")
+    decided_before = escalated_before + section_cascade.value(tier="1")
+
+    verdicts: Dict[str, Dict[str, bool]] = {}
+    scores = {}
+    seconds = 0.0
+    for pdf_path in pdf_paths:
+        name = os.path.basename(pdf_path)
+        started = time.perf_counter()
+        analysis = await analyze_section_stream(stream_sections_with_ocr(pdf_path))
+        seconds += time.perf_counter() - started
+        verdicts[name] = {result["section"]: result["meets_criteria"] for result in analysis.get("all_sections", [])}
+        if name in labels:
+            scores[name] = score(
+                [result["section"] for result in analysis.get("matching_sections", [])],
+                labels[name]["matching"],
+                labels[name].get("optional", [])
+            )
+
+    after = usage_snapshot(models)
+    usage = {
+        model: {key: after[model][key] - before[model][key] for key in ("calls", "prompt", "output")}
+        for model in models
+    }
+    usage = {model: values for model, values in usage.items() if values["calls"]}
+    escalated = section_cascade.value(tier="2") - escalated_before
+    decided = section_cascade.value(tier="2") + section_cascade.value(tier="1") - decided_before
+
+    return {
+        "usage": {model: {key: int(value) for key, value in values.items()} for model, values in usage.items()},
+        "llm_calls": int(sum(values["calls"] for values in usage.values())),
+        "cost_usd": round(cost(usage), 6),
+        "seconds": round(seconds, 2),
+        "escalation_rate": round(escalated / decided, 3) if cascade and decided else None,
+        "scores": scores,
+        "verdicts": verdicts,
+    }
+
+
+def agreement(single: Dict[str, Dict[str, bool]], cascaded: Dict[str, Dict[str, bool]]) -> float:
+    """Share of sections that get the same verdict in both modes."""
+    pairs = [
+        (verdict, cascaded.get(document, {}).get(section))
+        for document, sections in single.items()
+        for section, verdict in sections.items()
+    ]
+    return round(sum(1 for a, b in pairs if a == b) / len(pairs), 3) if pairs else 1.0
+
+
+async def run_benchmark() -> Dict[str, Any]:
+    with open(EXPECTATIONS_PATH, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    pdf_paths = sorted(glob.glob(CORPUS_GLOB))
+
+    single = await run_mode(False, pdf_paths, labels)
+    cascaded = await run_mode(True, pdf_paths, labels)
+    return {
+        "single": single,
+        "cascade": cascaded,
+        "agreement": agreement(single["verdicts"], cascaded["verdicts"]),
+        "cost_saved": round(1 - cascaded["cost_usd"] / single["cost_usd"], 3) if single["cost_usd"] else None,
+        "time_saved": round(1 - cascaded["seconds"] / single["seconds"], 3) if single["seconds"] else None,
+    }
+
+
+def print_mode(name: str, result: Dict[str, Any]) -> None:
+    usage = ", ".join(
+        f"{model}: {values['calls']} calls {values['prompt']}+{values['output']} tokens"
+        for model, values in result["usage"].items()
+    )
+    line = f"{name:8} calls={result['llm_calls']:4} cost=${result['cost_usd']:.5f} time={result['seconds']:6.2f}s"
+    if result["escalation_rate"] is not None:
+        line += f" escalated={result['escalation_rate']:.1%}"
+    print(line)
+    print(f"         {usage}")
+    for document, document_score in result["scores"].items():
+        print(f"         {document}: precision={document_score['precision']:.3f} recall={document_score['recall']:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare single-tier and cascaded section classification")
+    parser.add_argument("--backend", choices=["gemini", "fake"], default="fake", help="LLM_BACKEND to run with")
+    parser.add_argument("--threshold", type=float, help="Confidence below which the cascade escalates")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    # Configure the app before it is imported
+    os.environ["LLM_BACKEND"] = args.backend
+    if args.threshold is not None:
+        os.environ["CASCADE_CONFIDENCE_THRESHOLD"] = str(args.threshold)
+    # Both modes classify the same sections, cached verdicts would hide the calls
+    os.environ["VERDICT_CACHE"] = "0"
+
+    report = asyncio.run(run_benchmark())
+    print_mode("single", report["single"])
+    print_mode("cascade", report["cascade"])
+    print(f"agreement={report['agreement']:.1%} cost saved={report['cost_saved']:.1%} time saved={report['time_saved']:.1%}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,95 @@
+"""
+Flat vs. hierarchy-aware section classification on the sample corpus.
+
+For every PDF in app/uploads, classifies all sections flat (one LLM call per section)
+and top-down (conservative and aggressive), then reports the LLM calls saved and the
+recall of the hierarchical runs measured against the flat run.
+
+The verdict cache is disabled, so every run makes its own LLM calls. Runs against Gemini
+by default (GOOGLE_API_KEY), or against the fake backend or a recorded cassette (see
+app/llm_cassette.py). Run from the backend directory:
+
+    python -m app.benchmarks.hierarchy_recall
+    python -m app.benchmarks.hierarchy_recall --backend fake
+    python -m app.benchmarks.hierarchy_recall --mode replay --cassette baseline --json hierarchy_recall.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+from typing import Any, Dict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CORPUS_GLOB = os.path.join(BACKEND_DIR, "app", "uploads", "*.pdf")
+
+
+async def compare_document(pdf_path: str) -> Dict[str, Any]:
+    """
+    Classify one document flat and hierarchically and compare the matching sections.
+    """
+    # Imported here, so the LLM settings from the command line apply
+    from app.parsers.pdfParserElias import extract_everything
+    from app.step1.llm_sections import analyze_pdf_sections, analyze_pdf_sections_hierarchical
+
+    parsed = {"subsections": extract_everything(pdf_path)}
+    flat = await analyze_pdf_sections(parsed)
+    if flat.get("status") != "success":
+        return {"error": flat.get("message")}
+
+    flat_matches = {result["section"] for result in flat["matching_sections"]}
+    report = {"sections": flat["total_sections"], "flat_matches": len(flat_matches)}
+    for mode, conservative in (("conservative", True), ("aggressive", False)):
+        hierarchical = await analyze_pdf_sections_hierarchical(parsed, conservative=conservative)
+        matches = {result["section"] for result in hierarchical["matching_sections"]}
+        lost = sorted(flat_matches - matches)
+        report[mode] = {
+            "llm_calls": hierarchical["hierarchy"]["llm_calls"],
+            "calls_saved": hierarchical["hierarchy"]["calls_saved"],
+            "matches": len(matches),
+            "recall_vs_flat": round(1 - len(lost) / len(flat_matches), 3) if flat_matches else 1.0,
+            "lost_sections": lost,
+        }
+    return report
+
+
+async def run_benchmark() -> Dict[str, Any]:
+    """Compare flat and hierarchical classification for every PDF in the sample corpus."""
+    report = {}
+    for pdf_path in sorted(glob.glob(CORPUS_GLOB)):
+        report[os.path.basename(pdf_path)] = await compare_document(pdf_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare flat and hierarchical section classification")
+    parser.add_argument("--mode", choices=["live", "record", "replay"], help="LLM_MODE to run with")
+    parser.add_argument("--cassette", help="Cassette name to record to or replay from (LLM_CASSETTE)")
+    parser.add_argument("--backend", choices=["gemini", "fake"], help="LLM_BACKEND to run with")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    # Configure the app before it is imported
+    if args.mode:
+        os.environ["LLM_MODE"] = args.mode
+    if args.cassette:
+        os.environ["LLM_CASSETTE"] = args.cassette
+    if args.backend:
+        os.environ["LLM_BACKEND"] = args.backend
+    # The runs would otherwise reuse each other's verdicts and hide their LLM calls
+    os.environ["VERDICT_CACHE"] = "0"
+
+    report = asyncio.run(run_benchmark())
+    for document, result in report.items():
+        if "error" in result:
+            print(f"{document}: ERROR {result['error']}")
+            continue
+        print(f"{document}: {result['sections']} sections, {result['flat_matches']} flat matches")
+        for mode in ("conservative", "aggressive"):
+            mode_result = result[mode]
+            print(f"    {mode:12} calls={mode_result['llm_calls']:4} saved={mode_result['calls_saved']:4} "
+                  f"recall={mode_result['recall_vs_flat']:.3f} lost={mode_result['lost_sections']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
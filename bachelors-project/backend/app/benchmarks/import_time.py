@@ -0,0 +1,169 @@
+"""
+Cold-start import-time benchmark.
+
+Imports each target module in a fresh interpreter started with
+`python -X importtime` and reports the cumulative import time of the module
+together with the third-party packages that dominate it.
+
+Run from the backend directory:
+
+    python -m app.benchmarks.import_time
+    python -m app.benchmarks.import_time --runs 5 --json import_times.json
+    python -m app.benchmarks.import_time --compare import_times.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Any
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules whose cold-start cost we track
+TARGET_MODULES = [
+    "app.main",
+    "app.parsers.pdfParserElias",
+    "app.parsers.docxParser",
+    "app.step1.llm_sections",
+    "app.step2.parse_sections",
+    "app.document_ai.document_processor",
+]
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parse the output of `python -X importtime`.
+
+    Args:
+        stderr: The stderr of the interpreter run
+
+    Returns:
+        List of entries with module name, nesting depth and self/cumulative time in microseconds
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            stripped = name.lstrip()
+            entries.append({
+                "module": stripped.strip(),
+                "depth": (len(name) - len(stripped)) // 2,
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+            })
+        except ValueError:
+            continue
+    return entries
+
+
+def measure_module(module: str) -> Dict[str, Any]:
+    """
+    Import a single module in a fresh interpreter and collect its import times.
+
+    Args:
+        module: Dotted name of the module to import
+
+    Returns:
+        Dictionary with the cumulative time of the module and the self time per top-level package
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"}
+
+    entries = parse_importtime(result.stderr)
+    cumulative_us = next(
+        (entry["cumulative_us"] for entry in reversed(entries) if entry["module"] == module),
+        sum(entry["self_us"] for entry in entries)
+    )
+
+    # Attribute self time to top-level packages (fitz, google, docx, ...)
+    packages: Dict[str, int] = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        packages[package] = packages.get(package, 0) + entry["self_us"]
+
+    return {"cumulative_us": cumulative_us, "packages": packages}
+
+
+def run_benchmark(modules: List[str], runs: int = 3, top: int = 5) -> Dict[str, Any]:
+    """
+    Measure the cold-start import time of each module over several runs.
+
+    Args:
+        modules: Dotted module names to measure
+        runs: Number of fresh interpreters per module
+        top: Number of heaviest packages to report per module
+
+    Returns:
+        Dictionary keyed by module with the median import time in milliseconds
+    """
+    report = {}
+    for module in modules:
+        samples = [measure_module(module) for _ in range(runs)]
+        errors = [sample["error"] for sample in samples if "error" in sample]
+        samples = [sample for sample in samples if "error" not in sample]
+        if not samples:
+            report[module] = {"error": errors[0]}
+            continue
+
+        packages: Dict[str, List[int]] = {}
+        for sample in samples:
+            for package, self_us in sample["packages"].items():
+                packages.setdefault(package, []).append(self_us)
+        heaviest = sorted(
+            ((package, statistics.median(times)) for package, times in packages.items()),
+            key=lambda item: item[1],
+            reverse=True
+        )[:top]
+
+        report[module] = {
+            "median_ms": round(statistics.median(s["cumulative_us"] for s in samples) / 1000, 1),
+            "min_ms": round(min(s["cumulative_us"] for s in samples) / 1000, 1),
+            "heaviest_packages_ms": {package: round(us / 1000, 1) for package, us in heaviest},
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any], baseline: Dict[str, Any] = None) -> None:
+    """Print the benchmark report, with the change against a baseline report if given."""
+    for module, result in report.items():
+        if "error" in result:
+            print(f"{module:40} ERROR: {result['error']}")
+            continue
+        line = f"{module:40} {result['median_ms']:9.1f} ms"
+        previous = (baseline or {}).get(module, {})
+        if "median_ms" in previous:
+            line += f"  ({result['median_ms'] - previous['median_ms']:+.1f} ms vs baseline)"
+        print(line)
+        for package, ms in result["heaviest_packages_ms"].items():
+            print(f"    {package:36} {ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold-start import time per module")
+    parser.add_argument("modules", nargs="*", default=TARGET_MODULES, help="Modules to measure")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per module")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Compare against a previously written JSON report")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.modules, runs=args.runs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
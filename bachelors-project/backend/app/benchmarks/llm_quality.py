@@ -0,0 +1,235 @@
+"""
+Quality per cost of the LLM steps on the labelled sample tenders.
+
+For every document in app/benchmarks/expected_sections.json, runs step 1 (section analysis)
+and step 2 (component extraction) as the upload endpoints do, optionally also the page-based
+LLM parser, and reports per step the LLM calls, tokens and wall time, and for the section
+analysis the precision and recall against the labelled sections. Sections listed as
+'optional' in the labels are neither counted as hits nor as false positives.
+
+Use it with cassettes (see app/llm_cassette.py) to compare prompt or batching changes on the
+same LLM answers: record once against Gemini, then replay as often as needed. Wall time in
+replay mode only includes the recorded LLM latency with LLM_REPLAY_LATENCY=1.
+
+Run from the backend directory:
+
+    python -m app.benchmarks.llm_quality --mode record --cassette baseline
+    python -m app.benchmarks.llm_quality --mode replay --cassette baseline --json quality.json
+    python -m app.benchmarks.llm_quality --mode replay --cassette baseline --compare quality.json
+    python -m app.benchmarks.llm_quality --backend fake
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+UPLOADS_DIR = os.path.join(BACKEND_DIR, "app", "uploads")
+EXPECTATIONS_PATH = os.path.join(BACKEND_DIR, "app", "benchmarks", "expected_sections.json")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BACKEND_DIR
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def normalize_title(title: str) -> str:
+    """Section titles compared independent of no-break spaces and repeated whitespace."""
+    return " ".join(title.replace("\u00a0", " ").split())
+
+
+def score(predicted: Iterable[str], matching: Iterable[str], optional: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Precision and recall of the predicted section titles against the labels.
+    """
+    predicted = {normalize_title(title) for title in predicted}
+    matching = {normalize_title(title) for title in matching}
+    optional = {normalize_title(title) for title in optional}
+
+    counted = predicted - optional
+    hits = counted & matching
+    return {
+        "precision": round(len(hits) / len(counted), 3) if counted else 1.0,
+        "recall": round(len(hits) / len(matching), 3) if matching else 1.0,
+        "false_positives": sorted(counted - matching),
+        "missed": sorted(matching - predicted),
+    }
+
+
+class StageMeter:
+    """LLM calls, tokens and wall time spent between start() and stop()."""
+
+    def start(self) -> "StageMeter":
+        from app.llm import llm_calls, llm_tokens
+
+        self._calls = sum(llm_calls.total(outcome=outcome) for outcome in ("ok", "error"))
+        self._tokens = {kind: llm_tokens.total(kind=kind) for kind in ("prompt", "output")}
+        self._started = time.perf_counter()
+        return self
+
+    def stop(self) -> Dict[str, Any]:
+        from app.llm import llm_calls, llm_tokens
+
+        return {
+            "llm_calls": int(sum(llm_calls.total(outcome=outcome) for outcome in ("ok", "error")) - self._calls),
+            "prompt_tokens": int(llm_tokens.total(kind="prompt") - self._tokens["prompt"]),
+            "output_tokens": int(llm_tokens.total(kind="output") - self._tokens["output"]),
+            "seconds": round(time.perf_counter() - self._started, 3),
+        }
+
+
+async def benchmark_document(pdf_path: str, labels: Dict[str, List[str]], llm_parse: bool) -> Dict[str, Any]:
+    """
+    Run the LLM steps on one document and measure them.
+    """
+    from app.parsers.ocr_fallback import stream_sections_with_ocr
+    from app.step1.llm_sections import analyze_section_stream
+    from app.step2.parse_sections import parse_evaluation_components
+
+    report: Dict[str, Any] = {}
+
+    meter = StageMeter().start()
+    analysis = await analyze_section_stream(stream_sections_with_ocr(pdf_path))
+    report["step1"] = meter.stop()
+    if analysis.get("status") != "success":
+        report["error"] = analysis.get("message")
+        return report
+    report["step1"].update(score(
+        [result["section"] for result in analysis["matching_sections"]],
+        labels["matching"],
+        labels.get("optional", [])
+    ))
+    report["step1"]["sections"] = analysis["total_sections"]
+    # Failed calls (e.g. prompts missing from the cassette) count as not matching
+    report["step1"]["errors"] = sum(1 for result in analysis["all_sections"] if result.get("analysis", "").startswith("Error"))
+
+    meter = StageMeter().start()
+    components = await parse_evaluation_components(analysis)
+    report["step2"] = meter.stop()
+    report["step2"]["components"] = len(components.get("questions", []))
+    report["step2"]["success"] = bool(components.get("success"))
+
+    if llm_parse:
+        from app.parsers.llm_parse import extract_sections_with_llm
+
+        meter = StageMeter().start()
+        parsed = await extract_sections_with_llm(pdf_path)
+        report["llm_parse"] = meter.stop()
+        report["llm_parse"].update(score(parsed["sections"], labels["matching"], labels.get("optional", [])))
+
+    return report
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    """Benchmark every labelled document and build the report."""
+    with open(args.expectations, "r", encoding="utf-8") as f:
+        expectations = json.load(f)
+
+    documents = {}
+    for name, labels in expectations.items():
+        pdf_path = os.path.join(UPLOADS_DIR, name)
+        if not os.path.exists(pdf_path):
+            documents[name] = {"error": f"{pdf_path} not found"}
+            continue
+        documents[name] = await benchmark_document(pdf_path, labels, args.llm_parse)
+        print_document(name, documents[name])
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "llm_mode": os.environ.get("LLM_MODE", "live"),
+            "llm_backend": os.environ.get("LLM_BACKEND", "gemini"),
+            "cassette": os.environ.get("LLM_CASSETTE", "default"),
+        },
+        "documents": documents,
+        "totals": totals(documents),
+    }
+
+
+def totals(documents: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Calls, tokens and time summed per step."""
+    result: Dict[str, Any] = {}
+    for step in ("step1", "step2", "llm_parse"):
+        reports = [document[step] for document in documents.values() if step in document]
+        if not reports:
+            continue
+        result[step] = {
+            key: round(sum(report[key] for report in reports), 3)
+            for key in ("llm_calls", "prompt_tokens", "output_tokens", "seconds")
+        }
+    return result
+
+
+def print_document(name: str, report: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+    """Print the measurements of one document, with the change against a baseline if given."""
+    if "error" in report:
+        print(f"{name}: ERROR {report['error']}")
+        return
+    print(name)
+    for step in ("step1", "step2", "llm_parse"):
+        if step not in report:
+            continue
+        result = report[step]
+        line = (f"    {step:9} calls={result['llm_calls']:4} tokens={result['prompt_tokens']:7}+{result['output_tokens']:<6} "
+                f"time={result['seconds']:7.2f}s")
+        if "precision" in result:
+            line += f"  precision={result['precision']:.3f} recall={result['recall']:.3f}"
+        if result.get("errors"):
+            line += f"  errors={result['errors']}"
+        baseline = (previous or {}).get(step)
+        if baseline:
+            line += f"  (calls {result['llm_calls'] - baseline['llm_calls']:+d}"
+            if "precision" in result and "precision" in baseline:
+                line += (f", precision {result['precision'] - baseline['precision']:+.3f}"
+                         f", recall {result['recall'] - baseline['recall']:+.3f}")
+            line += " vs baseline)"
+        print(line)
+        for key in ("false_positives", "missed"):
+            titles = result.get(key, [])
+            if titles:
+                print(f"              {key} ({len(titles)}): {titles[:5]}{' ...' if len(titles) > 5 else ''}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM calls, tokens, time and precision/recall on the labelled tenders")
+    parser.add_argument("--mode", choices=["live", "record", "replay"], help="LLM_MODE to run with")
+    parser.add_argument("--cassette", help="Cassette name to record to or replay from (LLM_CASSETTE)")
+    parser.add_argument("--backend", choices=["gemini", "fake"], help="LLM_BACKEND to run with")
+    parser.add_argument("--llm-parse", action="store_true", help="Also benchmark the page-based LLM parser")
+    parser.add_argument("--expectations", default=EXPECTATIONS_PATH, help="JSON file with the labelled sections")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Compare against a previously written JSON report")
+    args = parser.parse_args()
+
+    # Configure the app before it is imported
+    if args.mode:
+        os.environ["LLM_MODE"] = args.mode
+    if args.cassette:
+        os.environ["LLM_CASSETTE"] = args.cassette
+    if args.backend:
+        os.environ["LLM_BACKEND"] = args.backend
+    # Cached verdicts would hide the calls of the section analysis
+    os.environ.setdefault("VERDICT_CACHE", "0")
+
+    report = asyncio.run(run_benchmark(args))
+    print(f"totals: {json.dumps(report['totals'])}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nAgainst baseline {baseline.get('meta', {}).get('revision')}:")
+        for name, document in report["documents"].items():
+            print_document(name, document, baseline.get("documents", {}).get(name))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
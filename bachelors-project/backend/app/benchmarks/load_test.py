@@ -0,0 +1,305 @@
+"""
+End-to-end HTTP load test for the upload endpoints.
+
+Replays uploads of the sample corpus (app/uploads/*.pdf) against the FastAPI app with
+Poisson arrivals (an open loop, so a slow server does not slow down the arrivals) at a
+series of increasing rates. For every rate it reports throughput, p50/p95/p99 latency and
+error rate; the saturation point is the first rate at which the server no longer keeps up
+(p95 above the SLO, errors above the budget, or a backlog that takes longer than the SLO to drain).
+
+By default the app runs in-process (httpx ASGITransport) with the LLM replaced by the local
+stand-in in app/fake_llm.py (tune it with FAKE_LLM_LATENCY_MS / FAKE_LLM_JITTER_MS), and
+uploads, stored documents, evaluation models and the search index go to a temporary
+directory.
+
+Every upload gets distinct bytes (a comment with the request number appended after the
+end of the PDF), so the server cannot answer it from a stored evaluation model of an
+earlier request or share the pipeline run of a concurrent identical upload: the test
+measures full pipeline runs. With --identical-uploads the corpus is replayed as is, which
+measures the deduplicated workload instead; the report records which one was measured. With --base-url the requests go
+to a running server instead; start it with LLM_BACKEND=fake to keep the Gemini API out of it.
+
+Run from the backend directory:
+
+    python -m app.benchmarks.load_test
+    python -m app.benchmarks.load_test --endpoint /parse-evaluation-components/ --rates 0.5 1 2 4
+    python -m app.benchmarks.load_test --json load.json --compare load_previous.json
+    python -m app.benchmarks.load_test --base-url http://localhost:8000
+    python -m app.benchmarks.load_test --identical-uploads
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CORPUS_GLOB = os.path.join(BACKEND_DIR, "app", "uploads", "*.pdf")
+
+ENDPOINTS = ["/everything-scraper/", "/analyze-pdf-sections/", "/parse-evaluation-components/"]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of values (None for an empty list)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def load_corpus(pattern: str = CORPUS_GLOB) -> List[Dict[str, Any]]:
+    """Read the corpus into memory so disk reads do not skew the client side."""
+    corpus = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "rb") as f:
+            corpus.append({"name": os.path.basename(path), "content": f.read()})
+    if not corpus:
+        raise SystemExit(f"No PDFs found for {pattern}")
+    return corpus
+
+
+async def send_upload(
+    client,
+    endpoint: str,
+    document: Dict[str, Any],
+    request_number: int,
+    unique: bool = True
+) -> Dict[str, Any]:
+    """
+    Upload one document and time the request.
+
+    Every request uses a unique filename, as the server saves uploads under their filename.
+    Unless unique is False the content is unique too, as the server coalesces and reuses
+    results by content hash; PDF readers ignore anything after the final %%EOF.
+    """
+    filename = f"loadtest-{request_number}-{document['name']}"
+    content = document["content"]
+    if unique:
+        content += f"\n%load-test request {request_number}\n".encode("ascii")
+    start = time.perf_counter()
+    try:
+        response = await client.post(
+            endpoint,
+            files={"file": (filename, content, "application/pdf")}
+        )
+        ok = response.status_code == 200
+        if ok and endpoint == "/parse-evaluation-components/":
+            # The endpoint reports LLM failures in the body
+            ok = response.json().get("success", False)
+        error = None if ok else f"HTTP {response.status_code}"
+    except Exception as e:
+        ok, error = False, type(e).__name__
+    return {"latency": time.perf_counter() - start, "ok": ok, "error": error}
+
+
+async def run_rate(
+    client,
+    endpoint: str,
+    corpus: List[Dict[str, Any]],
+    rate: float,
+    duration: float,
+    seed: int,
+    unique: bool = True
+) -> Dict[str, Any]:
+    """
+    Offer Poisson arrivals at the given rate for the given duration and wait for all of them.
+
+    Args:
+        client: httpx.AsyncClient pointed at the app
+        endpoint: Upload endpoint under test
+        corpus: Documents to upload, picked at random per request
+        rate: Mean arrivals per second
+        duration: Length of the arrival window in seconds
+        seed: Seed for the arrival times and document choice
+        unique: Give every upload distinct bytes (False replays the corpus documents as is)
+
+    Returns:
+        Dictionary with the measurements of this rate
+    """
+    rng = random.Random(seed)
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = rng.expovariate(rate)
+    while next_arrival < duration:
+        delay = start + next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_upload(client, endpoint, rng.choice(corpus), len(tasks), unique)))
+        next_arrival += rng.expovariate(rate)
+
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    latencies = [result["latency"] for result in results if result["ok"]]
+    errors: Dict[str, int] = {}
+    for result in results:
+        if not result["ok"]:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "offered_rps": rate,
+        "requests": len(results),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round((len(results) - len(latencies)) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(max(latencies) if latencies else None),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def is_saturated(result: Dict[str, Any], slo_p95_ms: float, error_budget: float, duration: float) -> bool:
+    """Whether the server failed to keep up at this rate."""
+    if result["requests"] == 0:
+        return False
+    if result["error_rate"] > error_budget:
+        return True
+    if result["p95_ms"] is None or result["p95_ms"] > slo_p95_ms:
+        return True
+    # A backlog built up: draining the last arrivals took longer than the SLO allows
+    return result["elapsed_s"] > duration + slo_p95_ms / 1000
+
+
+def git_revision() -> Optional[str]:
+    """Short hash of the checked-out commit, to tell reports of different releases apart."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_load_test(args) -> Dict[str, Any]:
+    """Run all rates against the in-process app or a running server and build the report."""
+    import httpx
+
+    corpus = load_corpus(args.corpus)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=timeout)
+        scratch_dir = None
+    else:
+        # Configure the app before it is imported: fake LLM, throwaway uploads, models and index
+        scratch_dir = tempfile.TemporaryDirectory(prefix="load_test_")
+        os.environ.setdefault("LLM_BACKEND", "fake")
+        os.environ.setdefault("SEARCH_INDEX_DIR", os.path.join(scratch_dir.name, "search_index"))
+        os.environ.setdefault("DOCUMENT_STORE_DIR", os.path.join(scratch_dir.name, "documents"))
+        os.environ.setdefault("EVALUATION_MODEL_DIR", os.path.join(scratch_dir.name, "evaluation_models"))
+        # Every upload repeats a corpus document, cached verdicts would hide the LLM latency
+        os.environ.setdefault("VERDICT_CACHE", "0")
+        from app import main
+
+        main.UPLOAD_DIR = os.path.join(scratch_dir.name, "uploads")
+        os.makedirs(main.UPLOAD_DIR, exist_ok=True)
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=main.app), base_url="http://load-test", timeout=timeout
+        )
+
+    results = []
+    saturation_rps = None
+    try:
+        for index, rate in enumerate(args.rates):
+            result = await run_rate(
+                client, args.endpoint, corpus, rate, args.duration, args.seed + index, not args.identical_uploads
+            )
+            result["saturated"] = is_saturated(result, args.slo_p95_ms, args.error_budget, args.duration)
+            results.append(result)
+            print_rate(result)
+            if result["saturated"] and saturation_rps is None:
+                saturation_rps = rate
+                if not args.keep_going:
+                    break
+    finally:
+        await client.aclose()
+        if scratch_dir:
+            scratch_dir.cleanup()
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "target": args.base_url or "in-process",
+            "llm_backend": os.environ.get("LLM_BACKEND", "gemini"),
+            "fake_llm_latency_ms": float(os.environ.get("FAKE_LLM_LATENCY_MS", "800")),
+            "endpoint": args.endpoint,
+            "duration_s": args.duration,
+            "slo_p95_ms": args.slo_p95_ms,
+            "error_budget": args.error_budget,
+            "documents": len(corpus),
+            # 'unique': full pipeline runs; 'identical': concurrent and repeated uploads of
+            # the same document share or reuse one run
+            "uploads": "identical" if args.identical_uploads else "unique",
+        },
+        "rates": results,
+        "saturation_rps": saturation_rps,
+    }
+
+
+def print_rate(result: Dict[str, Any], previous: Dict[str, Any] = None) -> None:
+    """Print the measurements of one rate, with the p95 change against a baseline if given."""
+    def fmt(value):
+        return "-" if value is None else f"{value:9.1f}"
+
+    line = (f"{result['offered_rps']:6.2f} rps offered  {result['throughput_rps']:6.2f} rps served  "
+            f"p50={fmt(result['p50_ms'])} p95={fmt(result['p95_ms'])} p99={fmt(result['p99_ms'])} ms  "
+            f"errors={result['error_rate']:.2%}{'  SATURATED' if result['saturated'] else ''}")
+    if previous and previous.get("p95_ms") is not None and result["p95_ms"] is not None:
+        line += f"  (p95 {result['p95_ms'] - previous['p95_ms']:+.1f} ms vs baseline)"
+    print(line)
+
+
+def print_comparison(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print the rates of the report next to the same rates of a baseline report."""
+    previous_rates = {result["offered_rps"]: result for result in baseline.get("rates", [])}
+    print(f"\nAgainst baseline {baseline.get('meta', {}).get('revision')}:")
+    uploads = baseline.get("meta", {}).get("uploads", "identical")
+    if uploads != report["meta"]["uploads"]:
+        print(f"Warning: the baseline measured {uploads} uploads, this run {report['meta']['uploads']} uploads")
+    for result in report["rates"]:
+        print_rate(result, previous_rates.get(result["offered_rps"]))
+    print(f"saturation: {report['saturation_rps']} rps (baseline {baseline.get('saturation_rps')} rps)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the upload endpoints with Poisson arrivals")
+    parser.add_argument("--endpoint", default="/analyze-pdf-sections/", choices=ENDPOINTS)
+    parser.add_argument("--rates", type=float, nargs="+", default=[0.5, 1, 2, 4, 8],
+                        help="Arrival rates to test, in requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Arrival window per rate in seconds")
+    parser.add_argument("--slo-p95-ms", type=float, default=10000, help="p95 latency considered acceptable")
+    parser.add_argument("--error-budget", type=float, default=0.01, help="Error rate considered acceptable")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--corpus", default=CORPUS_GLOB, help="Glob of the PDFs to upload")
+    parser.add_argument("--base-url", help="Test a running server instead of the in-process app")
+    parser.add_argument("--identical-uploads", action="store_true",
+                        help="Replay the corpus documents unchanged, so identical uploads are deduplicated")
+    parser.add_argument("--keep-going", action="store_true", help="Keep testing rates past the saturation point")
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Compare against a previously written JSON report")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args))
+    print(f"saturation: {report['saturation_rps']} rps ({report['meta']['uploads']} uploads)")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
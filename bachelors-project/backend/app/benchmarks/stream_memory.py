@@ -0,0 +1,102 @@
+"""
+Peak-memory benchmark for the PDF section parser.
+
+Generates synthetic tender PDFs of increasing size and parses each one in a fresh
+interpreter, once collecting all sections (extract_everything) and once streaming
+them (iter_sections), reporting the peak resident set size of each run.
+
+Run from the backend directory:
+
+    python -m app.benchmarks.stream_memory
+    python -m app.benchmarks.stream_memory --pages 100 1000 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PARAGRAPH = (
+    "Anbudsgivaren ska beskriva hur uppdraget genomförs. Utvärderingen sker enligt "
+    "angiven modell där referenspoäng ger avdrag eller tillägg på anbudspriset."
+)
+
+MEASURE_SCRIPT = """
+import json, resource, sys
+from app.parsers.pdfParserElias import extract_everything, iter_sections
+
+def peak_kb():
+    # VmHWM is reset on exec, ru_maxrss may still include the parent's memory
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+import fitz
+mode, path = sys.argv[1], sys.argv[2]
+baseline = peak_kb()
+if mode == "list":
+    count = len(extract_everything(path)["content"])
+else:
+    count = sum(1 for _ in iter_sections(path))
+peak = peak_kb()
+print(json.dumps({"sections": count, "peak_kb": peak, "growth_kb": peak - baseline}))
+"""
+
+
+def generate_pdf(path: str, pages: int) -> None:
+    """
+    Write a PDF with one bold numbered heading and a few paragraphs per page.
+    """
+    import fitz
+
+    with fitz.open() as doc:
+        for number in range(1, pages + 1):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"{number} Avsnitt nummer {number}", fontname="hebo", fontsize=14)
+            y = 110
+            for _ in range(12):
+                page.insert_textbox(fitz.Rect(72, y, 520, y + 50), PARAGRAPH, fontname="helv", fontsize=10)
+                y += 55
+        doc.save(path, garbage=3, deflate=True)
+
+
+def measure(mode: str, path: str) -> dict:
+    """Parse the PDF in a fresh interpreter and return its section count and peak memory."""
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, mode, path],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure parser peak memory by document size")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--json", dest="json_path", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for pages in args.pages:
+            path = os.path.join(tmp_dir, f"synthetic_{pages}.pdf")
+            generate_pdf(path, pages)
+            for mode in ("list", "stream"):
+                result = {"pages": pages, "mode": mode, **measure(mode, path)}
+                report.append(result)
+                print(f"{pages:6} pages  {mode:6}  sections={result['sections']:6}  "
+                      f"peak={result['peak_kb'] / 1024:8.1f} MB  growth={result['growth_kb'] / 1024:8.1f} MB")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
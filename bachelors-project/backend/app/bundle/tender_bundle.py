@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import uuid
+import zipfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.parsers.docxParser import extract_sections_from_docx
+from app.parsers.ocr_fallback import extract_everything_with_ocr
+from app.search.section_index import index_document
+from app.step1.llm_sections import analyze_pdf_sections, SECTION_MAX_CONCURRENCY
+from app.step2.parse_sections import parse_evaluation_components
+
+logger = logging.getLogger(__name__)
+
+# Guard against zip bombs: total uncompressed size of a ZIP upload
+MAX_BUNDLE_BYTES = int(os.environ.get("MAX_BUNDLE_BYTES", str(200 * 1024 * 1024)))
+
+# When the same document is uploaded in several formats, parse the first one in this order
+FORMAT_PREFERENCE = ["pdf", "docx"]
+
+# Two documents with different names but this much overlap in section titles are duplicates
+DUPLICATE_TITLE_SIMILARITY = 0.8
+
+
+def detect_format(content: bytes) -> Optional[str]:
+    """
+    Detect the document format from its leading bytes rather than its file extension.
+
+    Returns:
+        "pdf", "docx", "zip" or None if the format is not supported
+    """
+    if content[:5] == b"%PDF-":
+        return "pdf"
+    if content[:4] == b"PK\x03\x04":
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                if "word/document.xml" in archive.namelist():
+                    return "docx"
+            return "zip"
+        except zipfile.BadZipFile:
+            return None
+    return None
+
+
+def expand_uploads(files: List[Tuple[str, bytes]]) -> List[Tuple[str, bytes]]:
+    """
+    Flatten uploaded files, replacing ZIP archives by the files they contain.
+
+    Args:
+        files: (filename, content) pairs as uploaded
+
+    Returns:
+        (filename, content) pairs of the individual documents
+    """
+    expanded = []
+    for filename, content in files:
+        if detect_format(content) != "zip":
+            expanded.append((os.path.basename(filename), content))
+            continue
+
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            total_size = sum(info.file_size for info in archive.infolist())
+            if total_size > MAX_BUNDLE_BYTES:
+                raise ValueError(f"{filename} expands to {total_size} bytes, the limit is {MAX_BUNDLE_BYTES}")
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                # Skip directories and macOS resource forks
+                if info.is_dir() or not name or info.filename.startswith("__MACOSX/") or name.startswith("._"):
+                    continue
+                expanded.append((name, archive.read(info)))
+    return expanded
+
+
+def normalize_stem(filename: str) -> str:
+    """
+    Normalise a filename so that e.g. 'Kravspecifikation.pdf' and 'kravspecifikation.docx' compare equal.
+    """
+    stem = os.path.splitext(filename)[0].lower()
+    return re.sub(r"[\W_]+", "", stem)
+
+
+def title_similarity(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """
+    Jaccard similarity of the normalised section titles of two parsed documents.
+    """
+    def titles(parsed):
+        return {" ".join(section["section"].lower().split()) for section in parsed.get("content", [])}
+
+    titles_a, titles_b = titles(a), titles(b)
+    if not titles_a or not titles_b:
+        return 0.0
+    return len(titles_a & titles_b) / len(titles_a | titles_b)
+
+
+def group_documents(documents: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Group uploaded documents that are the same document in another format.
+
+    Byte-identical files and files with the same normalised name end up in one group,
+    ordered by FORMAT_PREFERENCE.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    seen_hashes: Dict[str, str] = {}
+    for document in documents:
+        key = seen_hashes.setdefault(document["sha256"], normalize_stem(document["filename"]))
+        groups.setdefault(key, []).append(document)
+
+    for group in groups.values():
+        group.sort(key=lambda document: FORMAT_PREFERENCE.index(document["format"]))
+    return list(groups.values())
+
+
+async def parse_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parse a single document with the parser for its detected format.
+    """
+    if document["format"] == "pdf":
+        return await extract_everything_with_ocr(document["path"])
+    return await asyncio.to_thread(extract_sections_from_docx, document["path"])
+
+
+async def parse_group(group: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Parse one document of a group of format duplicates.
+
+    The preferred format is parsed first. The next format is only tried if it fails or
+    yields no sections (e.g. a PDF without bold numbered headings).
+
+    Returns:
+        The document that was used and its parsed data, or (None, None) if all formats failed
+    """
+    for document in group:
+        try:
+            parsed = await parse_document(document)
+        except Exception as e:
+            logger.warning(f"Failed to parse {document['filename']}: {str(e)}")
+            document["error"] = str(e)
+            continue
+        if parsed.get("content"):
+            return document, parsed
+    return None, None
+
+
+def save_documents(upload_dir: str, files: List[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+    """
+    Write the documents of a bundle to their own upload directory.
+
+    Returns:
+        One entry per file with filename, detected format, path and content hash
+    """
+    bundle_dir = os.path.join(upload_dir, "bundles", uuid.uuid4().hex)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    documents = []
+    for index, (filename, content) in enumerate(files):
+        document = {
+            "filename": filename,
+            "format": detect_format(content),
+            "sha256": hashlib.sha256(content).hexdigest(),
+        }
+        if document["format"] in FORMAT_PREFERENCE:
+            document["path"] = os.path.join(bundle_dir, f"{index}_{filename}")
+            with open(document["path"], "wb") as buffer:
+                buffer.write(content)
+        documents.append(document)
+    return documents
+
+
+async def analyze_tender_bundle(upload_dir: str, files: List[Tuple[str, bytes]]) -> Dict[str, Any]:
+    """
+    Full pipeline over all documents of one procurement.
+
+    All documents are parsed concurrently, duplicates (the same document as PDF and DOCX)
+    are parsed only once, every section of every document is classified through one shared
+    LLM concurrency budget and a single component extraction runs over the combined
+    matching sections.
+
+    Args:
+        upload_dir: Directory to store the uploaded documents in
+        files: (filename, content) pairs, ZIP archives are expanded
+
+    Returns:
+        Dictionary with the per-document parse status, the section analysis and the
+        evaluation components
+    """
+    # Unpacking and writing the files blocks, keep it off the event loop
+    documents = await asyncio.to_thread(lambda: save_documents(upload_dir, expand_uploads(files)))
+
+    supported = [document for document in documents if document["format"] in FORMAT_PREFERENCE]
+    for document in documents:
+        if document["format"] not in FORMAT_PREFERENCE:
+            document["status"] = "unsupported"
+
+    # Parse one document per group of format duplicates, all groups concurrently
+    groups = group_documents(supported)
+    parsed_groups = await asyncio.gather(*(parse_group(group) for group in groups))
+
+    parsed_documents = []
+    for group, (used, parsed) in zip(groups, parsed_groups):
+        for document in group:
+            if document is used:
+                continue
+            document["status"] = f"duplicate_of:{used['filename']}" if used else "failed"
+        if used is None:
+            continue
+
+        # Documents with different names but (almost) the same sections are duplicates as well
+        duplicate = next(
+            (other for other, other_parsed in parsed_documents
+             if title_similarity(parsed, other_parsed) >= DUPLICATE_TITLE_SIMILARITY),
+            None
+        )
+        if duplicate:
+            used["status"] = f"duplicate_of:{duplicate['filename']}"
+            continue
+
+        used["status"] = "parsed"
+        used["sections"] = len(parsed["content"])
+        parsed_documents.append((used, parsed))
+
+    # Combine the sections of all documents, remembering where each one came from
+    combined_sections = [
+        {**section, "document": document["filename"]}
+        for document, parsed in parsed_documents
+        for section in parsed["content"]
+    ]
+
+    # One semaphore for the whole bundle, so a large bundle cannot exceed the LLM concurrency budget
+    semaphore = asyncio.Semaphore(SECTION_MAX_CONCURRENCY)
+    analysis_results = await analyze_pdf_sections({"subsections": {"content": combined_sections}}, semaphore)
+
+    # Prefix the section titles with their document so the extraction can tell them apart
+    matching_sections = [
+        {**section, "section": f"{section['document']} / {section['section']}"}
+        for section in analysis_results.get("matching_sections", [])
+    ]
+    components_results = await parse_evaluation_components({"matching_sections": matching_sections})
+
+    return {
+        "documents": [
+            {key: value for key, value in document.items() if key != "path"}
+            for document in documents
+        ],
+        "analysis": analysis_results,
+        "components": components_results
+    }
+
+
+def index_bundle(bundle_results: Dict[str, Any]) -> None:
+    """
+    Add the analysed sections of every parsed bundle document to the search index.
+
+    Meant to run as a background task after the response, so errors are logged instead of raised.
+    """
+    all_sections = bundle_results["analysis"].get("all_sections", [])
+    for document in bundle_results["documents"]:
+        if document.get("status") != "parsed":
+            continue
+        sections = [section for section in all_sections if section.get("document") == document["filename"]]
+        try:
+            index_document(document["sha256"], document["filename"], sections)
+        except Exception as e:
+            logger.error(f"Failed to index {document['filename']}: {str(e)}")
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable
+
+from fastapi import Request
+
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks whether the client is still connected
+DISCONNECT_POLL_INTERVAL = float(os.environ.get("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+requests_cancelled = Counter(
+    "requests_cancelled_total",
+    "Requests whose pending work was cancelled because the client disconnected"
+)
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the response was ready."""
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[Any], endpoint: str) -> Any:
+    """
+    Run the work of a request, cancelling it as soon as the client disconnects.
+
+    Cancellation propagates into the pending section tasks, so LLM calls that have not
+    started yet are never made. Calls already running in a worker thread cannot be
+    interrupted and finish in the background; their verdicts still end up in the cache, so
+    a retry of the same document resumes where the cancelled request stopped.
+
+    Args:
+        request: The incoming request
+        work: Coroutine producing the response content
+        endpoint: Endpoint name used as metrics label
+
+    Returns:
+        The result of the work
+
+    Raises:
+        ClientDisconnected: If the client disconnected before the work finished
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.exception("Cancelled work for %s failed while shutting down", endpoint)
+
+    requests_cancelled.inc(endpoint=endpoint)
+    logger.info("Client disconnected, cancelled %s", endpoint)
+    raise ClientDisconnected()
@@ -1,5 +1,3 @@
-from google.cloud import documentai_v1 as documentai
-from google.api_core.client_options import ClientOptions
 import os
 import traceback
 
@@ -10,9 +8,93 @@ PROCESSOR_ID = "139c61c15adcc30e"
 
 def initialize_document_ai_client():
     """Initialize and return a Document AI client for the EU region"""
+    # The Google Cloud client stack is heavy, so it is only imported once OCR is actually used
+    from google.cloud import documentai_v1 as documentai
+    from google.api_core.client_options import ClientOptions
+
     options = ClientOptions(api_endpoint=f"{LOCATION}-documentai.googleapis.com")
     return documentai.DocumentProcessorServiceClient(client_options=options)
 
+def ocr_document(document_content):
+    """
+    Send PDF bytes to the Document AI OCR processor.
+
+    Args:
+        document_content: The raw bytes of the PDF to process
+
+    Returns:
+        The processed Document AI document
+    """
+    from google.cloud import documentai_v1 as documentai
+
+    # Initialize Document AI client
+    client = initialize_document_ai_client()
+
+    # The full resource name of the processor
+    name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
+
+    # Configure the process request
+    raw_document = documentai.RawDocument(
+        content=document_content,
+        mime_type="application/pdf"
+    )
+
+    # Create the request
+    request = documentai.ProcessRequest(
+        name=name,
+        raw_document=raw_document
+    )
+
+    # Process the document
+    result = client.process_document(request=request)
+    return result.document
+
+def extract_paragraphs(document):
+    """
+    Extract all non-empty paragraphs of a processed document in reading order.
+
+    Args:
+        document: A Document AI document
+
+    Returns:
+        list: Paragraphs with text, page number (1-based), confidence and bounding box
+    """
+    all_paragraphs = []
+    for page in document.pages:
+        for paragraph in page.paragraphs:
+            para_text = get_text(paragraph.layout.text_anchor, document.text).strip()
+            if para_text:  # Skip empty paragraphs
+                bounding_box = None
+                if hasattr(paragraph.layout, 'bounding_poly') and paragraph.layout.bounding_poly:
+                    bounding_box = {
+                        "vertices": [
+                            {"x": vertex.x, "y": vertex.y} 
+                            for vertex in paragraph.layout.bounding_poly.vertices
+                        ]
+                    }
+                
+                all_paragraphs.append({
+                    "text": para_text,
+                    "page": page.page_number,
+                    "confidence": paragraph.layout.confidence,
+                    "bounding_box": bounding_box
+                })
+    return all_paragraphs
+
+def ocr_pdf_paragraphs(pdf_content):
+    """
+    OCR a (small) PDF given as bytes and return its paragraphs.
+
+    Unlike process_document, errors are raised to the caller.
+
+    Args:
+        pdf_content: The raw bytes of the PDF
+
+    Returns:
+        list: Paragraphs as returned by extract_paragraphs
+    """
+    return extract_paragraphs(ocr_document(pdf_content))
+
 def process_document(file_path):
     """
     Process a document using Google Document AI OCR and extract hierarchical sections
@@ -24,31 +106,11 @@ def process_document(file_path):
         dict: Structured data extracted from the document with hierarchical sections
     """
     try:
-        # Initialize Document AI client
-        client = initialize_document_ai_client()
-        
-        # The full resource name of the processor
-        name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
-
         # Read the file
         with open(file_path, "rb") as doc_file:
             document_content = doc_file.read()
 
-        # Configure the process request
-        raw_document = documentai.RawDocument(
-            content=document_content,
-            mime_type="application/pdf"
-        )
-        
-        # Create the request
-        request = documentai.ProcessRequest(
-            name=name,
-            raw_document=raw_document
-        )
-
-        # Process the document
-        result = client.process_document(request=request)
-        document = result.document
+        document = ocr_document(document_content)
 
         # Extract document metadata
         metadata = {
@@ -58,26 +120,7 @@ def process_document(file_path):
         }
 
         # Extract all paragraphs in order
-        all_paragraphs = []
-        for page in document.pages:
-            for paragraph in page.paragraphs:
-                para_text = get_text(paragraph.layout.text_anchor, document.text).strip()
-                if para_text:  # Skip empty paragraphs
-                    bounding_box = None
-                    if hasattr(paragraph.layout, 'bounding_poly') and paragraph.layout.bounding_poly:
-                        bounding_box = {
-                            "vertices": [
-                                {"x": vertex.x, "y": vertex.y} 
-                                for vertex in paragraph.layout.bounding_poly.vertices
-                            ]
-                        }
-                    
-                    all_paragraphs.append({
-                        "text": para_text,
-                        "page": page.page_number,
-                        "confidence": paragraph.layout.confidence,
-                        "bounding_box": bounding_box
-                    })
+        all_paragraphs = extract_paragraphs(document)
 
         # Extract hierarchical sections
         hierarchical_sections = extract_hierarchical_sections(all_paragraphs)
@@ -0,0 +1,241 @@
+"""
+Pipeline stages of stored documents, computed on demand and memoized.
+
+A document is uploaded once (POST /documents) and its stages are requested separately:
+'sections' (parsing, with OCR for pages without a text layer), 'analysis' (LLM
+classification of the sections) and 'components' (evaluation components of the matching
+sections). Each stage is computed the first time it is requested and stored on disk; a
+later stage reads the stored result of the one before it instead of redoing it.
+
+Stored results are named after the version of the stage and of the stages before it, plus
+the stage's options. Bumping a version in STAGE_VERSIONS therefore recomputes that stage and
+the stages after it, while the earlier ones are kept.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.document_store import DOCUMENT_ID_PATTERN, document_path
+from app.evaluation_models import store_model
+from app.parsers.ocr_fallback import extract_everything_with_ocr
+from app.single_flight import single_flight
+from app.step1.llm_sections import analyze_pdf_sections, analyze_pdf_sections_hierarchical, failed_sections
+from app.step2.parse_sections import parse_evaluation_components
+from app.token_budget import budget_exhausted
+
+# Stored stage results, one directory per document
+DOCUMENT_STAGE_DIR = os.environ.get("DOCUMENT_STAGE_DIR", "app/store/stages")
+
+# Stages in pipeline order; each one is computed from the result of the one before it
+STAGES = ("sections", "analysis", "components")
+
+# Bump a stage's version when a change to its parser, prompts or rules changes its output
+STAGE_VERSIONS = {
+    "sections": "1",
+    "analysis": "1",
+    "components": "2",
+}
+
+# Options each stage accepts; a stage also gets the options of the stages before it
+STAGE_OPTIONS = {
+    "sections": (),
+    "analysis": ("hierarchical",),
+    "components": ("map_reduce",),
+}
+
+
+def stage_options(stage: str, options: Dict[str, Any]) -> Dict[str, bool]:
+    """The options that affect a stage (its own and those of the stages before it)."""
+    names = [name for earlier in STAGES[:STAGES.index(stage) + 1] for name in STAGE_OPTIONS[earlier]]
+    return {name: bool(options.get(name, False)) for name in names}
+
+
+def stage_version(stage: str) -> str:
+    """Version of a stage including the stages before it, e.g. '1.1' for 'analysis'."""
+    return ".".join(STAGE_VERSIONS[earlier] for earlier in STAGES[:STAGES.index(stage) + 1])
+
+
+def _stage_filename(stage: str, options: Dict[str, Any]) -> str:
+    flags = "".join(f"-{name}={int(value)}" for name, value in sorted(stage_options(stage, options).items()))
+    return f"{stage}-v{stage_version(stage)}{flags}.json"
+
+
+def _parse_stage_filename(filename: str) -> Optional[Tuple[str, str, Dict[str, bool]]]:
+    """Stage, version and options of a stored result, None for other files."""
+    if not filename.endswith(".json") or "-v" not in filename:
+        return None
+    stage, rest = filename[:-len(".json")].split("-v", 1)
+    version, *flags = rest.split("-")
+    options = {name: value == "1" for name, value in (flag.split("=", 1) for flag in flags if "=" in flag)}
+    return stage, version, options
+
+
+def _stored_results(document_id: str) -> List[Tuple[str, str, str, Dict[str, bool]]]:
+    """Filename, stage, version and options of the stored results of a document."""
+    directory = _document_dir(document_id)
+    if not os.path.isdir(directory):
+        return []
+    return [
+        (filename, *parsed)
+        for filename in sorted(os.listdir(directory))
+        if (parsed := _parse_stage_filename(filename)) and parsed[0] in STAGES
+    ]
+
+
+def _document_dir(document_id: str) -> str:
+    return os.path.join(DOCUMENT_STAGE_DIR, document_id)
+
+
+def _write_json(path: str, content: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False)
+    os.replace(temporary_path, path)
+
+
+def register_document(document_id: str, filename: str, pages: int) -> Dict[str, Any]:
+    """
+    Record the name and page count of a stored document. The name of the first upload is
+    kept, the same content uploaded under another name is the same document.
+    """
+    info = document_info(document_id)
+    if info is None:
+        info = {"document_id": document_id, "filename": filename, "pages": pages}
+        _write_json(os.path.join(_document_dir(document_id), "document.json"), info)
+    return info
+
+
+def document_info(document_id: str) -> Optional[Dict[str, Any]]:
+    """Name and page count of a registered document, or None if the ID is malformed or unknown."""
+    if not DOCUMENT_ID_PATTERN.match(document_id) or document_path(document_id) is None:
+        return None
+    try:
+        with open(os.path.join(_document_dir(document_id), "document.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_stage(document_id: str, stage: str, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The stored result of a stage for the current versions, or None."""
+    try:
+        with open(os.path.join(_document_dir(document_id), _stage_filename(stage, options)), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_stage(document_id: str, stage: str, options: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """Store the result of a stage, removing the results of earlier versions of the stage."""
+    directory = _document_dir(document_id)
+    _write_json(os.path.join(directory, _stage_filename(stage, options)), result)
+    for filename, stored_stage, version, _ in _stored_results(document_id):
+        if stored_stage == stage and version != stage_version(stage):
+            os.remove(os.path.join(directory, filename))
+
+
+def invalidate_stage(document_id: str, stage: str) -> List[str]:
+    """
+    Remove the stored results of a stage and the stages after it, with any options.
+
+    Returns:
+        The names of the removed results
+    """
+    stages = STAGES[STAGES.index(stage):]
+    removed = [filename for filename, stored_stage, _, _ in _stored_results(document_id) if stored_stage in stages]
+    for filename in removed:
+        os.remove(os.path.join(_document_dir(document_id), filename))
+    return removed
+
+
+def stage_status(document_id: str) -> Dict[str, Any]:
+    """
+    Current version of every stage and the options it has been computed with for that version.
+    """
+    stored = _stored_results(document_id)
+    return {
+        stage: {
+            "version": stage_version(stage),
+            "computed": [
+                options for _, stored_stage, version, options in stored
+                if stored_stage == stage and version == stage_version(stage)
+            ],
+        }
+        for stage in STAGES
+    }
+
+
+def is_complete(stage: str, result: Dict[str, Any]) -> bool:
+    """
+    Whether a stage result may be stored: failed results, analyses with sections that could
+    not be classified, components with extraction errors and results cut short by a token
+    budget are recomputed the next time instead.
+    """
+    if result.get("partial"):
+        return False
+    if stage == "analysis":
+        return result.get("status") == "success" and not failed_sections(result)
+    if stage == "components":
+        return bool(result.get("success")) and not result.get("errors")
+    return True
+
+
+async def _compute(document_id: str, stage: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    path = document_path(document_id)
+    if stage == "sections":
+        return await extract_everything_with_ocr(path)
+
+    if stage == "analysis":
+        sections, _ = await get_stage(document_id, "sections", options)
+        if options.get("hierarchical"):
+            return await analyze_pdf_sections_hierarchical({"subsections": sections})
+        return await analyze_pdf_sections({"subsections": sections})
+
+    analysis, _ = await get_stage(document_id, "analysis", options)
+    results = await parse_evaluation_components(analysis, bool(options.get("map_reduce")))
+    failed = failed_sections(analysis)
+    if failed:
+        results["failed_sections"] = failed
+    if analysis.get("partial") or budget_exhausted() or failed or results.get("errors"):
+        results["partial"] = True
+    elif results.get("success"):
+        # Also served by /evaluation-models/ and reused by /parse-evaluation-components/
+        model_options = {
+            "hierarchical": bool(options.get("hierarchical")),
+            "pipelined": False,
+            "map_reduce": bool(options.get("map_reduce")),
+        }
+        results["model_id"] = await asyncio.to_thread(store_model, document_id, model_options, results)
+    return results
+
+
+async def get_stage(document_id: str, stage: str, options: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    The result of a stage of a stored document, computed (with the stages before it that
+    are not stored yet) if needed. Concurrent requests for the same result share one run.
+
+    Args:
+        document_id: ID of the document in the document store
+        stage: One of STAGES
+        options: Stage options, see STAGE_OPTIONS; unknown options are ignored
+
+    Returns:
+        The result and whether it was stored already
+    """
+    options = stage_options(stage, options or {})
+    result = await asyncio.to_thread(load_stage, document_id, stage, options)
+    if result is not None:
+        return result, True
+
+    async def compute():
+        result = await _compute(document_id, stage, options)
+        if budget_exhausted():
+            result["partial"] = True
+        if is_complete(stage, result):
+            await asyncio.to_thread(store_stage, document_id, stage, options, result)
+        return result
+
+    key = f"document-stage:{document_id}:{_stage_filename(stage, options)}"
+    return await single_flight.run(key, compute, f"documents/{stage}"), False
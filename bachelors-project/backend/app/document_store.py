@@ -0,0 +1,57 @@
+import os
+import re
+import shutil
+import uuid
+from typing import Optional
+
+from app.hashing import sha256_file
+
+# Uploaded documents by content hash, so they can be looked up again after the request
+DOCUMENT_STORE_DIR = os.environ.get("DOCUMENT_STORE_DIR", "app/store/documents")
+
+DOCUMENT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def store_document(path: str) -> str:
+    """
+    Add an uploaded file to the document store.
+
+    The file is hard-linked into the store where possible (copied otherwise), so storing a
+    document twice costs nothing.
+
+    Args:
+        path: Path to the uploaded file
+
+    Returns:
+        The document ID (SHA-256 of the file contents)
+    """
+    # Linked (or copied) before hashing: the upload path may be replaced by a later upload,
+    # the linked file keeps the content that is hashed
+    os.makedirs(DOCUMENT_STORE_DIR, exist_ok=True)
+    temporary_path = os.path.join(DOCUMENT_STORE_DIR, f".{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(path, temporary_path)
+    except OSError:
+        shutil.copyfile(path, temporary_path)
+    try:
+        document_id = sha256_file(temporary_path)
+        stored_path = os.path.join(DOCUMENT_STORE_DIR, document_id)
+        if os.path.exists(stored_path):
+            os.remove(temporary_path)
+        else:
+            os.replace(temporary_path, stored_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return document_id
+
+
+def document_path(document_id: str) -> Optional[str]:
+    """
+    Path of a stored document, or None if the ID is malformed or unknown.
+    """
+    if not DOCUMENT_ID_PATTERN.match(document_id):
+        return None
+    path = os.path.join(DOCUMENT_STORE_DIR, document_id)
+    return path if os.path.isfile(path) else None
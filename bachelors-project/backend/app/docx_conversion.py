@@ -0,0 +1,94 @@
+"""
+Background PDF to DOCX conversion jobs.
+
+A conversion can take minutes for a large PDF, so the upload endpoint only starts a job and
+the client polls its status. Jobs are identified by the document ID (the content hash of the
+PDF): converting a document again returns the finished or running job, and the result is
+cached on disk by app/parsers/pdf2docx.py. PDFs whose text layer already gives the section
+structure are not converted unless forced.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional, Set
+
+from app.parsers.pdf2docx import conversion_info, convert_to_cache, docx_conversions, text_layer_structure
+
+logger = logging.getLogger(__name__)
+
+# Conversions running at the same time per worker; each already spreads over several processes
+PDF2DOCX_MAX_JOBS = int(os.environ.get("PDF2DOCX_MAX_JOBS", "1"))
+
+_jobs: Dict[str, Dict[str, Any]] = {}
+# Running tasks are referenced here so they are not garbage collected mid-conversion
+_tasks: Set[asyncio.Task] = set()
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def job_status(document_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Status of the conversion of a document: 'checking' (judging whether it needs one),
+    'queued', 'running', 'done', 'skipped' or 'failed', with the timing once done. None if
+    it was never requested.
+    """
+    if document_id in _jobs:
+        return dict(_jobs[document_id])
+    # Converted before, possibly by another worker or before a restart
+    info = conversion_info(document_id)
+    if info is not None:
+        return {**info, "document_id": document_id, "status": "done"}
+    return None
+
+
+async def _convert(document_id: str, pdf_path: str) -> None:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(PDF2DOCX_MAX_JOBS)
+
+    job = _jobs[document_id]
+    async with _semaphore:
+        job["status"] = "running"
+        try:
+            result = await asyncio.to_thread(convert_to_cache, pdf_path, document_id)
+        except Exception as e:
+            logger.exception(f"Converting {pdf_path} to DOCX failed")
+            job.update(status="failed", error=str(e))
+            return
+    job.update(status="done", **{key: value for key, value in result.items() if key != "path"})
+
+
+async def submit_conversion(document_id: str, pdf_path: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Start converting a document unless it is converted, being converted or does not need it.
+
+    Args:
+        document_id: ID of the document in the document store
+        pdf_path: Path to the PDF
+        force: Convert even if the text layer already gives the section structure
+
+    Returns:
+        The job status (see job_status)
+    """
+    status = job_status(document_id)
+    if status and status["status"] in ("checking", "queued", "running", "done"):
+        return status
+
+    # Registered before the first await, so a concurrent request for the same document
+    # returns this job instead of starting a second conversion
+    _jobs[document_id] = {"document_id": document_id, "status": "queued" if force else "checking"}
+    if not force:
+        try:
+            structure = await asyncio.to_thread(text_layer_structure, pdf_path)
+        except BaseException as e:
+            _jobs[document_id] = {"document_id": document_id, "status": "failed", "error": str(e)}
+            raise
+        if structure["structured"]:
+            docx_conversions.inc(outcome="skipped")
+            _jobs[document_id] = {"document_id": document_id, "status": "skipped", "structure": structure}
+            return job_status(document_id)
+
+    _jobs[document_id] = {"document_id": document_id, "status": "queued"}
+    task = asyncio.create_task(_convert(document_id, pdf_path))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_status(document_id)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Optional
+
+# Extracted evaluation models, stored as immutable artifacts named after the SHA-256 of their
+# contents, plus an index from (document, pipeline version, options) to the artifact
+EVALUATION_MODEL_DIR = os.environ.get("EVALUATION_MODEL_DIR", "app/store/evaluation_models")
+
+# Bump when a change to the parser, prompts, rules or merging changes the extracted models,
+# so documents are extracted again instead of being served the old model
+PIPELINE_VERSION = "2"
+
+MODEL_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def source_key(document_id: str, options: Dict[str, Any]) -> str:
+    """Index key of the model extracted from a document with the given pipeline options."""
+    payload = json.dumps([document_id, PIPELINE_VERSION, options], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _index_path(key: str) -> str:
+    return os.path.join(EVALUATION_MODEL_DIR, "by-source", key)
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+    os.replace(temporary_path, path)
+
+
+def model_path(model_id: str) -> Optional[str]:
+    """
+    Path of a stored evaluation model, or None if the ID is malformed or unknown.
+    """
+    if not MODEL_ID_PATTERN.match(model_id):
+        return None
+    path = os.path.join(EVALUATION_MODEL_DIR, f"{model_id}.json")
+    return path if os.path.isfile(path) else None
+
+
+def store_model(document_id: str, options: Dict[str, Any], results: Dict[str, Any]) -> str:
+    """
+    Store the evaluation model extracted from a document.
+
+    Only what the frontend needs to render and calculate the model is kept (no run
+    statistics), so the same model always gets the same ID.
+
+    Args:
+        document_id: ID of the document in the document store
+        options: The pipeline options the model was extracted with
+        results: Output of parse_evaluation_components
+
+    Returns:
+        The model ID (SHA-256 of the stored artifact)
+    """
+    artifact = {
+        "success": True,
+        "questions": results["questions"],
+        "calculationOrder": results["calculationOrder"],
+        "document_id": document_id,
+        "pipeline_version": PIPELINE_VERSION,
+    }
+    content = json.dumps(artifact, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    model_id = hashlib.sha256(content).hexdigest()
+
+    path = os.path.join(EVALUATION_MODEL_DIR, f"{model_id}.json")
+    if not os.path.exists(path):
+        _write_atomic(path, content)
+    _write_atomic(_index_path(source_key(document_id, options)), model_id.encode("ascii"))
+    return model_id
+
+
+def find_model(document_id: str, options: Dict[str, Any]) -> Optional[str]:
+    """
+    ID of the model extracted from a document by the current pipeline version, or None.
+    """
+    try:
+        with open(_index_path(source_key(document_id, options)), "r", encoding="ascii") as f:
+            model_id = f.read().strip()
+    except OSError:
+        return None
+    return model_id if model_path(model_id) else None
+
+
+def load_model(model_id: str) -> Dict[str, Any]:
+    """The stored evaluation model with its 'model_id'."""
+    with open(model_path(model_id), "r", encoding="utf-8") as f:
+        model = json.load(f)
+    model["model_id"] = model_id
+    return model
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches an ETag (weak comparison, as RFC 9110 requires
+    for If-None-Match).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
@@ -0,0 +1,102 @@
+"""
+Local stand-in for the Gemini API, used for load tests and benchmarks (LLM_BACKEND=fake).
+
+Answers are deterministic and derived from the prompt; only the latency is random. Nothing
+leaves the machine and no API key is needed.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+from typing import Any, Dict
+
+# Mean and standard deviation of the injected latency per call, in milliseconds
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "800"))
+FAKE_LLM_JITTER_MS = float(os.environ.get("FAKE_LLM_JITTER_MS", "300"))
+
+# Latency of the cheap models ("lite" in the name) relative to the others
+FAKE_LLM_LITE_LATENCY_FACTOR = float(os.environ.get("FAKE_LLM_LITE_LATENCY_FACTOR", "0.4"))
+
+# Share of calls that fail, to exercise the error paths
+FAKE_LLM_ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", "0"))
+
+# A section is judged relevant if its title or text mentions one of these
+RELEVANT_TERMS = ("utvärdering", "pris", "poäng", "avdrag", "mervärde", "viktning")
+
+CANNED_COMPONENTS = [
+    {
+        "id": "anbudspris",
+        "content": "Anbudspris",
+        "type": "inputbox",
+        "alternatives": [""],
+        "evaluation": {"operation": "base", "valueType": "direct"}
+    },
+    {
+        "id": "referenspoang",
+        "content": "Referenspoäng",
+        "type": "slider",
+        "alternatives": ["55 - 64", "35 - 54", "15 - 34", "0 - 14"],
+        "evaluation": {
+            "operation": "adjust",
+            "valueType": "range",
+            "ranges": [
+                {"min": 55, "max": 64, "value": -600000},
+                {"min": 35, "max": 54, "value": -300000},
+                {"min": 15, "max": 34, "value": 300000},
+                {"min": 0, "max": 14, "value": 600000}
+            ]
+        }
+    }
+]
+
+
+def fake_response(prompt: str) -> str:
+    """
+    Deterministic answer to a prompt of the section analysis, component extraction or page
+    analysis (LLM parser) step.
+    """
+    if "komponenter" in prompt:
+        return json.dumps(CANNED_COMPONENTS, ensure_ascii=False)
+
+    # Page window prompts of the LLM parser expect JSON with the relevant numbered sections
+    if "Sidans text:" in prompt:
+        text = re.sub(r'\[Sida \d+\]\n?', "", prompt.split("Sidans text:", 1)[1])
+        sections = {}
+        parts = re.split(r'^(\d+(?:\.\d+)*\.?[ \t]+\S[^\n]*)$', text, flags=re.MULTILINE)
+        for title, body in zip(parts[1::2], parts[2::2]):
+            if any(term in f"{title}{body}".lower() for term in RELEVANT_TERMS):
+                sections[title.strip()] = body.strip()
+        meets_criteria = any(term in text.lower() for term in RELEVANT_TERMS)
+        return json.dumps({"meets_criteria": meets_criteria, "sections": sections}, ensure_ascii=False)
+
+    # First tier of the cascade: JSON verdict, unsure when only the text mentions one term
+    if '"confidence"' in prompt and "Avsnitt:" in prompt:
+        subject = prompt.split("Avsnitt:", 1)[1].lower()
+        title, _, text = subject.partition("innehåll:")
+        hits = sum(text.count(term) for term in RELEVANT_TERMS)
+        if any(term in title for term in RELEVANT_TERMS) or hits >= 2:
+            return json.dumps({"verdict": "YES", "confidence": 0.95})
+        if hits == 1:
+            return json.dumps({"verdict": "YES", "confidence": 0.55})
+        return json.dumps({"verdict": "NO", "confidence": 0.9})
+
+    # Section and chapter prompts: judge the part after the criteria list
+    for marker in ("Avsnitt:", "Kapitel:"):
+        if marker in prompt:
+            subject = prompt.split(marker, 1)[1].lower()
+            return "YES" if any(term in subject for term in RELEVANT_TERMS) else "NO"
+    return "NO"
+
+
+async def generate_content(prompt: str, generation_config: Dict[str, Any], model_name: str) -> str:
+    """
+    Drop-in replacement for app.llm.generate_content with injected latency.
+    """
+    latency_ms = max(random.gauss(FAKE_LLM_LATENCY_MS, FAKE_LLM_JITTER_MS), 0)
+    if "lite" in model_name:
+        latency_ms *= FAKE_LLM_LITE_LATENCY_FACTOR
+    await asyncio.sleep(latency_ms / 1000)
+    if FAKE_LLM_ERROR_RATE and random.random() < FAKE_LLM_ERROR_RATE:
+        raise RuntimeError("Fake LLM: injected error")
+    return fake_response(prompt)
@@ -0,0 +1,19 @@
+import hashlib
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Content hash of a file, used as a stable document ID.
+
+    Args:
+        path: Path to the file
+        chunk_size: Number of bytes read at a time
+
+    Returns:
+        Hex-encoded SHA-256 digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.metrics import Counter
+
+# Model used by the section analysis and component extraction steps
+DEFAULT_MODEL = "gemini-2.0-flash-001"
+
+# "gemini" sends prompts to the Gemini API, "fake" answers them locally (see app/fake_llm.py)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini").lower()
+
+# "live" calls the backend, "record" also appends every call to the cassette and "replay"
+# answers from the cassette without calling the backend (see app/llm_cassette.py)
+LLM_MODE = os.environ.get("LLM_MODE", "live").lower()
+
+# In replay mode, wait as long as the recorded call took (for wall-time comparisons)
+LLM_REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "0").lower() not in ("0", "false", "no")
+
+llm_calls = Counter("llm_calls_total", "LLM calls by model and outcome")
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by model and kind (prompt, output)")
+
+# google.generativeai pulls in the whole Google API client stack (grpc, protobuf, ...),
+# so it is only imported and configured the first time a prompt is actually sent.
+_genai = None
+_dotenv_loaded = False
+
+
+def get_api_key() -> Optional[str]:
+    """
+    Return the Gemini API key, loading the .env file on first use.
+
+    Returns:
+        The value of GOOGLE_API_KEY, or None if it is not set
+    """
+    global _dotenv_loaded
+    if LLM_MODE == "replay":
+        return "replay"
+    if LLM_BACKEND == "fake":
+        return "fake"
+    if not _dotenv_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _dotenv_loaded = True
+    return os.environ.get("GOOGLE_API_KEY")
+
+
+def get_genai():
+    """
+    Import and configure the google.generativeai module on first use.
+
+    Returns:
+        The configured google.generativeai module
+    """
+    global _genai
+    if _genai is None:
+        from google import generativeai as genai
+
+        genai.configure(api_key=get_api_key())
+        _genai = genai
+    return _genai
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) when the backend reports none."""
+    return max(len(text) // 4, 1) if text else 0
+
+
+async def call_model(
+    prompt: str,
+    generation_config: Dict[str, Any],
+    model_name: str
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Send a prompt to the configured backend.
+
+    Returns:
+        The response text and the token usage ('prompt_tokens', 'output_tokens')
+    """
+    if LLM_BACKEND == "fake":
+        from app import fake_llm
+
+        text = await fake_llm.generate_content(prompt, generation_config, model_name)
+        return text, {"prompt_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(text)}
+
+    # The first call imports and configures the SDK, which blocks
+    genai = _genai or await asyncio.to_thread(get_genai)
+    model = genai.GenerativeModel(
+        model_name=model_name,
+        generation_config=generation_config
+    )
+    response = await asyncio.to_thread(model.generate_content, prompt)
+    usage_metadata = getattr(response, "usage_metadata", None)
+    usage = {
+        "prompt_tokens": getattr(usage_metadata, "prompt_token_count", 0) or estimate_tokens(prompt),
+        "output_tokens": getattr(usage_metadata, "candidates_token_count", 0) or estimate_tokens(response.text),
+    }
+    return response.text, usage
+
+
+async def generate_content(
+    prompt: str,
+    generation_config: Dict[str, Any],
+    model_name: str = DEFAULT_MODEL
+) -> str:
+    """
+    Send a single prompt to Gemini without blocking the event loop.
+
+    With LLM_MODE=record the call is also written to the cassette, with LLM_MODE=replay it
+    is answered from the cassette instead. The call is booked on the token budgets of the
+    current request (see app/token_budget.py).
+
+    Args:
+        prompt: The full prompt text
+        generation_config: Generation settings passed to the model
+        model_name: Name of the Gemini model to use
+
+    Returns:
+        The text of the model response
+
+    Raises:
+        TokenBudgetExceeded: If the call could exceed a token budget; nothing is sent
+    """
+    from app.llm_cassette import get_cassette
+    from app.token_budget import reserve_tokens
+
+    # Hold the worst case on the token budgets of the request (raises TokenBudgetExceeded)
+    reservation = await reserve_tokens(estimate_tokens(prompt) + generation_config.get("max_output_tokens", 0))
+    usage = None
+    try:
+        if LLM_MODE == "replay":
+            interaction = get_cassette().replay(prompt, generation_config, model_name)
+            if LLM_REPLAY_LATENCY:
+                await asyncio.sleep(interaction["latency_ms"] / 1000)
+            text, usage = interaction["response"], interaction["usage"]
+        else:
+            started = time.perf_counter()
+            text, usage = await call_model(prompt, generation_config, model_name)
+            if LLM_MODE == "record":
+                latency_ms = (time.perf_counter() - started) * 1000
+                get_cassette().record(prompt, generation_config, model_name, text, usage, latency_ms)
+    except asyncio.CancelledError:
+        llm_calls.inc(model=model_name, outcome="cancelled")
+        raise
+    except Exception:
+        llm_calls.inc(model=model_name, outcome="error")
+        raise
+    finally:
+        reservation.settle(model_name, usage)
+    llm_calls.inc(model=model_name, outcome="ok")
+    llm_tokens.inc(usage["prompt_tokens"], model=model_name, kind="prompt")
+    llm_tokens.inc(usage["output_tokens"], model=model_name, kind="output")
+    return text
+
+
+PAGE_ANALYSIS_PROMPT = """
+Texten kan omfatta flera sidor; varje sida inleds med en markering [Sida N]. Början av texten kan upprepa slutet av föregående utdrag.
+Svara endast med JSON på formatet:
+{"meets_criteria": true/false, "sections": {"<rubrik>": "<avsnittets text>"}}
+där "sections" innehåller de avsnitt i texten (med rubrik och text, utan sidmarkeringar) som uppfyller kriterierna. Ange rubriken exakt som den står i dokumentet, även för ett avsnitt som börjar före eller fortsätter efter texten.
+"""
+
+
+async def process_pdf_window(pages: List[int], window_text: str) -> Dict[str, Any]:
+    """
+    Ask the LLM whether a window of pages meets the section criteria, and which sections in
+    it do.
+
+    Args:
+        pages: Page numbers (1-based) the window covers
+        window_text: The text of the window, every page introduced by a [Sida N] marker
+
+    Returns:
+        Dictionary with 'pages', 'content', 'meets_criteria' and 'sections' (title -> text)
+    """
+    # Imported here, app.step1 imports this module
+    from app.step1.llm_sections import SECTION_ANALYSIS_CRITERIA
+
+    result = {"pages": pages, "content": window_text, "meets_criteria": False, "sections": {}}
+    if not re.sub(r'\[Sida \d+\]', "", window_text).strip():
+        return result
+
+    generation_config = {
+        "temperature": 0.2,
+        "top_p": 0.95,
+        "max_output_tokens": 4096,
+    }
+    system_prompt = "Språk: Svenska. Du är en expert dokumentanalysator. Utvärdera om följande text ur ett upphandlingsdokument innehåller något som uppfyller kriterierna."
+    user_message = f"Kriterier: {SECTION_ANALYSIS_CRITERIA}\n{PAGE_ANALYSIS_PROMPT}\nSidans text: {window_text}"
+
+    try:
+        response_text = await generate_content(f"{system_prompt}\n\n{user_message}", generation_config)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    try:
+        parsed = json.loads(json_match.group(0)) if json_match else None
+    except json.JSONDecodeError:
+        parsed = None
+    if isinstance(parsed, dict):
+        result["meets_criteria"] = bool(parsed.get("meets_criteria"))
+        if isinstance(parsed.get("sections"), dict):
+            result["sections"] = parsed["sections"]
+    else:
+        # Not JSON, fall back to the YES/NO check of the section analysis
+        result["meets_criteria"] = "yes" in response_text.lower() or "true" in response_text.lower()
+    result["analysis"] = response_text
+    return result
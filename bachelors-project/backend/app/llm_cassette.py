@@ -0,0 +1,156 @@
+"""
+Record/replay of LLM calls ("cassettes"), so pipeline runs can be repeated offline.
+
+LLM_MODE=record sends prompts to the configured backend as usual and appends every prompt
+and response (with token usage and latency) to the cassette. LLM_MODE=replay answers the
+same prompts from the cassette without any API access; a prompt that is not on the cassette
+(e.g. because the prompt was changed) fails with CassetteMissError instead of silently
+calling the API.
+
+A cassette is a JSON lines file, LLM_CASSETTE_DIR/<LLM_CASSETTE>.jsonl. The first line is a
+header with the format version; every other line is one interaction. Use a new cassette name
+for every recording you want to keep (e.g. per prompt revision), so runs stay comparable.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Directory and name of the cassette used by LLM_MODE=record/replay
+LLM_CASSETTE_DIR = os.environ.get("LLM_CASSETTE_DIR", "app/benchmarks/cassettes")
+LLM_CASSETTE = os.environ.get("LLM_CASSETTE", "default")
+
+# Bumped when the layout of the interactions changes; older cassettes must be re-recorded
+CASSETTE_FORMAT_VERSION = 1
+
+
+class CassetteMissError(LookupError):
+    """A prompt was sent in replay mode that is not on the cassette."""
+
+
+def interaction_key(prompt: str, generation_config: Dict[str, Any], model_name: str) -> str:
+    """Key of an interaction: the model, its settings and the full prompt."""
+    payload = json.dumps([model_name, generation_config, prompt], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cassette_path(name: str = LLM_CASSETTE, directory: str = LLM_CASSETTE_DIR) -> str:
+    return os.path.join(directory, f"{name}.jsonl")
+
+
+class Cassette:
+    """
+    The interactions of one cassette file.
+
+    The same prompt can be recorded more than once (e.g. a retried section); replay returns
+    the recorded responses in order and repeats the last one when they run out.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._interactions: Dict[str, List[Dict[str, Any]]] = {}
+        self._replayed: Dict[str, int] = {}
+        self._loaded = False
+
+    def load(self) -> None:
+        """Read the cassette file (once); a missing file is an empty cassette."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    lines = [line for line in f if line.strip()]
+            except FileNotFoundError:
+                return
+            if not lines:
+                return
+
+            header = json.loads(lines[0])
+            if header.get("format_version") != CASSETTE_FORMAT_VERSION:
+                raise ValueError(
+                    f"Cassette {self.path} has format version {header.get('format_version')}, "
+                    f"expected {CASSETTE_FORMAT_VERSION}; record it again"
+                )
+            for line in lines[1:]:
+                interaction = json.loads(line)
+                self._interactions.setdefault(interaction["key"], []).append(interaction)
+
+    def __len__(self) -> int:
+        self.load()
+        return sum(len(interactions) for interactions in self._interactions.values())
+
+    def replay(self, prompt: str, generation_config: Dict[str, Any], model_name: str) -> Dict[str, Any]:
+        """
+        The recorded interaction for a prompt.
+
+        Returns:
+            Dictionary with 'response', 'usage' ('prompt_tokens', 'output_tokens') and 'latency_ms'
+
+        Raises:
+            CassetteMissError: If the prompt was not recorded
+        """
+        self.load()
+        key = interaction_key(prompt, generation_config, model_name)
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                raise CassetteMissError(
+                    f"Prompt {key[:12]} is not on cassette {self.path} "
+                    f"(starts with {prompt[:80]!r}); record the cassette again"
+                )
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+        return interactions[min(index, len(interactions) - 1)]
+
+    def record(
+        self,
+        prompt: str,
+        generation_config: Dict[str, Any],
+        model_name: str,
+        response: str,
+        usage: Dict[str, int],
+        latency_ms: float
+    ) -> None:
+        """Append an interaction to the cassette file."""
+        self.load()
+        interaction = {
+            "key": interaction_key(prompt, generation_config, model_name),
+            "model": model_name,
+            "generation_config": generation_config,
+            "prompt": prompt,
+            "response": response,
+            "usage": usage,
+            "latency_ms": round(latency_ms, 1),
+        }
+        with self._lock:
+            self._interactions.setdefault(interaction["key"], []).append(interaction)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", encoding="utf-8") as f:
+                if is_new:
+                    f.write(json.dumps({
+                        "format_version": CASSETTE_FORMAT_VERSION,
+                        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    }) + "\n")
+                f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Cassette:
+    """The cassette selected by LLM_CASSETTE_DIR and LLM_CASSETTE."""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette(cassette_path())
+        logger.info("Using LLM cassette %s", _cassette.path)
+    return _cassette
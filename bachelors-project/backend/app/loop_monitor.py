@@ -0,0 +1,173 @@
+"""
+Event loop lag monitor and blocking call detector.
+
+A task on the event loop sleeps for LOOP_MONITOR_INTERVAL seconds at a time and records how
+much later than that it woke up; that lag is how long every other callback had to wait. A
+watchdog thread checks the task's heartbeat, and when the loop has not come back for more
+than LOOP_BLOCK_THRESHOLD seconds it takes a stack sample of the event loop thread, which
+shows the code that is blocking it (e.g. synchronous file I/O or PDF parsing in an async
+handler).
+
+Lag is exported as a histogram, blocking calls as counters labelled with the innermost
+frame of the backend's own code in the sample; the full stack is logged.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+from app.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Set LOOP_MONITOR=0 to disable the monitor
+LOOP_MONITOR = os.environ.get("LOOP_MONITOR", "1").lower() not in ("0", "false", "no")
+
+# Seconds between two lag measurements
+LOOP_MONITOR_INTERVAL = float(os.environ.get("LOOP_MONITOR_INTERVAL", "0.1"))
+
+# Seconds the loop may be blocked before a stack sample is taken
+LOOP_BLOCK_THRESHOLD = float(os.environ.get("LOOP_BLOCK_THRESHOLD", "0.1"))
+
+# Seconds before the stack of the same blocking site is logged again
+LOOP_BLOCK_LOG_INTERVAL = float(os.environ.get("LOOP_BLOCK_LOG_INTERVAL", "60"))
+
+# Distinct blocking sites used as metric labels; further sites are counted as 'other'
+LOOP_BLOCK_MAX_SITES = int(os.environ.get("LOOP_BLOCK_MAX_SITES", "50"))
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+loop_lag = Histogram("event_loop_lag_seconds", "Delay of event loop callbacks behind schedule", LAG_BUCKETS)
+loop_lag_max = Gauge("event_loop_lag_max_seconds", "Largest event loop lag since the worker started")
+loop_blocked = Counter("event_loop_blocked_total", "Event loop stalls over the threshold by blocking site")
+loop_blocked_seconds = Counter("event_loop_blocked_seconds_total", "Seconds the event loop was blocked by blocking site")
+
+# Frames in these files are the backend's own code; the innermost one names the blocking site
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(APP_DIR)
+
+
+def blocking_site(frames: traceback.StackSummary) -> str:
+    """
+    Name of the code blocking the loop in a stack sample: the innermost frame of the
+    backend's own code, or the innermost frame if there is none (e.g. a library callback).
+    """
+    own = [
+        frame for frame in frames
+        if os.path.abspath(frame.filename).startswith(APP_DIR) and os.path.abspath(frame.filename) != os.path.abspath(__file__)
+    ]
+    frame = own[-1] if own else frames[-1]
+    filename = os.path.abspath(frame.filename)
+    if filename.startswith(BACKEND_DIR):
+        filename = os.path.relpath(filename, BACKEND_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{frame.lineno} {frame.name}"
+
+
+class LoopMonitor:
+    """Measures the lag of one event loop and samples the stack when it is blocked."""
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._heartbeat = time.monotonic()
+        # The current stall: heartbeat it started at, blocking site and stack
+        self._stall: Optional[Dict[str, Any]] = None
+        self._sites: set = set()
+        self._logged: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._loop_thread_id: Optional[int] = None
+
+    def start(self) -> None:
+        """Start measuring the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop monitor started (interval {self.interval} s, threshold {self.threshold} s)")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _measure(self) -> None:
+        while True:
+            started = time.monotonic()
+            self._heartbeat = started
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - started - self.interval, 0.0)
+            loop_lag.observe(lag)
+            if lag > loop_lag_max.value():
+                loop_lag_max.set(lag)
+
+            stall = self._stall
+            if stall is not None and stall["heartbeat"] == started:
+                self._stall = None
+                loop_blocked_seconds.inc(lag, site=stall["site"])
+                logger.warning(f"Event loop was blocked for {lag:.3f} s by {stall['site']}")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 4):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            stall = self._stall
+            if blocked_for < self.threshold or (stall is not None and stall["heartbeat"] == heartbeat):
+                continue
+            self._sample(heartbeat, blocked_for)
+
+    def _sample(self, heartbeat: float, blocked_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        frames = traceback.extract_stack(frame)
+        site = blocking_site(frames)
+
+        # Keep the number of label values bounded
+        if site not in self._sites and len(self._sites) >= LOOP_BLOCK_MAX_SITES:
+            label = "other"
+        else:
+            self._sites.add(site)
+            label = site
+        self._stall = {"heartbeat": heartbeat, "site": label}
+        loop_blocked.inc(site=label)
+
+        now = time.monotonic()
+        if now - self._logged.get(site, -LOOP_BLOCK_LOG_INTERVAL) >= LOOP_BLOCK_LOG_INTERVAL:
+            self._logged[site] = now
+            logger.warning(
+                f"Event loop blocked for more than {blocked_for:.3f} s by {site}:\n"
+                + "".join(traceback.format_list(frames))
+            )
+
+
+_monitor: Optional[LoopMonitor] = None
+
+
+def start_loop_monitor() -> Optional[LoopMonitor]:
+    """Start monitoring the running event loop, unless disabled with LOOP_MONITOR=0."""
+    global _monitor
+    if not LOOP_MONITOR or _monitor is not None:
+        return _monitor
+    _monitor = LoopMonitor()
+    _monitor.start()
+    return _monitor
+
+
+async def stop_loop_monitor() -> None:
+    global _monitor
+    if _monitor is not None:
+        await _monitor.stop()
+        _monitor = None
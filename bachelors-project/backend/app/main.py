@@ -1,14 +1,43 @@
 import os
-from fastapi import FastAPI, UploadFile, File, Request
+import asyncio
+import logging
+import uuid
+from fastapi import FastAPI, UploadFile, File, Request, BackgroundTasks, Query, Response, Body
+from typing import List, Optional
 from app.parsers.pdfParser import extract_sections_and_subsections
-from app.parsers.pdfParserElias import extract_everything
+from app.parsers.ocr_fallback import extract_everything_with_ocr, stream_sections_with_ocr
+from app.parsers.outline import outline_targets
 import shutil
 from fastapi.responses import StreamingResponse
 from fastapi.responses import JSONResponse
 from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.step1.llm_sections import analyze_pdf_sections
+from app.step1.llm_sections import analyze_section_stream, analyze_pdf_sections_hierarchical, failed_sections
+from app.step1.verdict_cache import prune_verdicts, verdict_cache_enabled
 from app.step2.parse_sections import parse_evaluation_components
+from app.bundle.tender_bundle import analyze_tender_bundle, index_bundle
+from app.search.section_index import index_file, search
+from app.pipeline import run_pipelined
+from app.warmup import warm_up
+from app.profiling import ProfilingMiddleware, profile_path, profile_stage, is_authorized
+from app.document_store import document_path, store_document
+from app.render.highlight import DEFAULT_ZOOM, highlighted_page, parse_regions
+from app.cancellation import ClientDisconnected, cancel_on_disconnect
+from app.metrics import render_metrics
+from app.single_flight import single_flight
+from app.admission import AdmissionRejected, admission, page_count
+from app.evaluation_models import etag_matches, find_model, load_model, model_path, store_model
+from app.docx_conversion import job_status, submit_conversion
+from app.parsers.pdf2docx import cached_docx_path
+from app.token_budget import request_tokens
+from app.analysis.sensitivity import analyze_sensitivity
+from app.loop_monitor import start_loop_monitor, stop_loop_monitor
+from app.document_stages import (
+    STAGES, document_info, get_stage, invalidate_stage, load_stage, register_document, stage_status
+)
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -20,6 +49,42 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Profiles requests that carry a valid X-Profile header (see app/profiling.py)
+app.add_middleware(ProfilingMiddleware)
+
+@app.on_event("startup")
+async def warm_up_dependencies():
+    """
+    Optionally import the heavy parser and LLM dependencies at startup.
+
+    Off by default so workers become ready quickly; set WARM_UP_ON_STARTUP=1 to
+    move the import cost from the first request to worker startup instead.
+    """
+    if os.environ.get("WARM_UP_ON_STARTUP", "").lower() in ("1", "true", "yes"):
+        await asyncio.to_thread(warm_up)
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    """
+    Measure the event loop lag and sample the stack of calls that block it (see
+    app/loop_monitor.py); set LOOP_MONITOR=0 to disable.
+    """
+    start_loop_monitor()
+
+@app.on_event("startup")
+async def prune_verdict_cache():
+    """
+    Remove step 1 verdicts not used for VERDICT_CACHE_MAX_AGE_DAYS, in the background so
+    startup does not wait for it.
+    """
+    if verdict_cache_enabled():
+        # Referenced so the task is not garbage collected while it runs
+        app.state.verdict_pruning = asyncio.create_task(asyncio.to_thread(prune_verdicts))
+
+@app.on_event("shutdown")
+async def stop_event_loop_monitor():
+    await stop_loop_monitor()
+
 @app.get("/")
 def read_root():
     return {"message": "FastAPI Backend is Running!"}
@@ -31,6 +96,23 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 # Elias -----------------------------------------------
 
+def save_upload(file: UploadFile, file_path: str):
+    """
+    Saves an uploaded file. The file is written next to its destination and then moved in
+    place, so a request still reading an earlier upload with the same name is not disturbed.
+    Blocking, the async endpoints run it in a worker thread.
+    """
+    temporary_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    with open(temporary_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    os.replace(temporary_path, file_path)
+
+
+
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
 
 
 @app.post("/upload/")
@@ -38,29 +120,45 @@ async def upload_pdf(file: UploadFile = File(...)):
     file_path = os.path.join(UPLOAD_DIR, file.filename) 
 
     # Save uploaded file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await asyncio.to_thread(save_upload, file, file_path)
 
     # Parse the file
-    subsections = extract_sections_and_subsections(file_path)
+    subsections = await asyncio.to_thread(extract_sections_and_subsections, file_path)
     
     return {"subsections": subsections}
 
 
 
 @app.post("/everything-scraper/")
-async def upload_p(file: UploadFile = File(...)):
+async def upload_p(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Uploads a PDF file, extracts all structured content (sections, subsections, text, and tables),
     and returns the extracted data as a JSON response.
     """
     # Save the uploaded file
     file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await asyncio.to_thread(save_upload, file, file_path)
+    # Keep the document so the section spans can be rendered later
+    document_id = await asyncio.to_thread(store_document, file_path)
+    # The stored copy is read, the upload path may be overwritten by the next upload
+    stored_path = document_path(document_id)
 
-    # Process the PDF and extract structured content
-    extracted_data = extract_everything(file_path)
+    async def extract():
+        # Small documents are admitted first when the endpoint is busy
+        pages = await asyncio.to_thread(page_count, stored_path)
+        async with admission("everything-scraper").admit(pages):
+            # Process the PDF and extract structured content (pages without a text layer are OCR:ed)
+            extracted_data = await extract_everything_with_ocr(stored_path)
+        # Add the sections to the cross-tender search index after responding
+        background_tasks.add_task(index_file, stored_path, file.filename, extracted_data["content"], document_id)
+        return extracted_data
+
+    try:
+        # Identical uploads in flight share one extraction
+        extracted_data = await single_flight.run(f"everything-scraper:{document_id}", extract, "everything-scraper")
+    except AdmissionRejected as e:
+        return too_busy_response(e)
+    extracted_data["document_id"] = document_id
 
     return extracted_data
 
@@ -71,56 +169,569 @@ async def upload_p(file: UploadFile = File(...)):
 
 # AMMAR -----------------------------------------------
 
+async def classify_upload(file_path: str, hierarchical: bool = False, pages: Optional[List[int]] = None):
+    """
+    Parses an uploaded PDF (optionally only the given pages) and classifies its sections,
+    either flat or top-down along the section numbering (pruning irrelevant chapters).
+    """
+    if hierarchical:
+        parsed_data = await extract_everything_with_ocr(file_path, pages=pages)
+        with profile_stage("analyze"):
+            return await analyze_pdf_sections_hierarchical({"subsections": parsed_data})
+
+    # Sections are streamed, so the LLM starts on the first section while the rest is still parsed
+    with profile_stage("parse+analyze"):
+        return await analyze_section_stream(stream_sections_with_ocr(file_path, pages=pages))
+
+async def analyze_upload(file_path: str, hierarchical: bool = False):
+    """
+    Classifies the sections of an uploaded PDF. If the PDF has an outline pointing to relevant
+    sections, only those pages are parsed; the whole document is parsed when there is no such
+    outline or nothing on the targeted pages matches.
+    """
+    with profile_stage("outline"):
+        targets = await asyncio.to_thread(outline_targets, file_path)
+    if targets:
+        analysis_results = await classify_upload(file_path, hierarchical, targets["pages"])
+        if analysis_results.get("matching_count"):
+            analysis_results["outline"] = targets
+            return analysis_results
+        logger.info("Nothing matched on the outline pages of %s, parsing the whole document", file_path)
+
+    return await classify_upload(file_path, hierarchical)
+
+def too_busy_response(rejection: AdmissionRejected):
+    # Rejected before any work was done, the client can safely retry the same upload later
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(rejection)},
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+def client_disconnected_response():
+    # Nobody reads this response; 499 (nginx' "client closed request") marks it in the access log
+    return JSONResponse(status_code=499, content={"error": "Client disconnected"})
+
 @app.post("/analyze-pdf-sections/")
-async def analyze_pdf_sections_endpoint(file: UploadFile = File(...)):
+async def analyze_pdf_sections_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    hierarchical: bool = False
+):
     """
     Analyzes PDF sections using LLM to identify sections that match specific criteria.
     """
     file_path = os.path.join(UPLOAD_DIR, file.filename) 
 
     # Save uploaded file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await asyncio.to_thread(save_upload, file, file_path)
 
     try:
-        # Parse the file to get subsections
-        parsed_data = extract_everything(file_path)
-        
-        # Process sections to find those that match criteria
-        analysis_results = await analyze_pdf_sections({"subsections": parsed_data})
+        # Keep the document so the spans of the matching sections can be rendered later
+        document_id = await asyncio.to_thread(store_document, file_path)
+        # The stored copy is analysed, the upload path may be overwritten by the next upload
+        stored_path = document_path(document_id)
+
+        async def analyze():
+            # Small documents are admitted first when the endpoint is busy
+            pages = await asyncio.to_thread(page_count, stored_path)
+            async with admission("analyze-pdf-sections").admit(pages):
+                # Parse the file and process sections to find those that match criteria,
+                # within the token budgets of the request
+                with request_tokens(request.headers.get("x-api-key"), file.filename) as usage:
+                    analysis_results = await analyze_upload(stored_path, hierarchical)
+                analysis_results["usage"] = usage.summary()
+            background_tasks.add_task(
+                index_file, stored_path, file.filename, analysis_results.get("all_sections", []), document_id
+            )
+            return analysis_results
+
+        # Identical uploads in flight share one analysis; it is cancelled once all clients left
+        analysis_results = await cancel_on_disconnect(
+            request,
+            single_flight.run(f"analyze-pdf-sections:{document_id}:{hierarchical}", analyze, "analyze-pdf-sections"),
+            "analyze-pdf-sections"
+        )
+        analysis_results["document_id"] = document_id
         
         return analysis_results
+    except ClientDisconnected:
+        return client_disconnected_response()
+    except AdmissionRejected as e:
+        return too_busy_response(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"Analysis failed: {str(e)}"}
         )
 
+async def extract_components(
+    file_path: str,
+    filename: str,
+    background_tasks: BackgroundTasks,
+    hierarchical: bool = False,
+    pipelined: bool = False,
+    map_reduce: bool = False,
+    document_id: Optional[str] = None
+):
+    """
+    Analyzes the sections of an uploaded PDF and extracts the evaluation components.
+
+    Returns:
+        The analysis results and the component results
+    """
+    if pipelined and not hierarchical:
+        with profile_stage("outline"):
+            targets = await asyncio.to_thread(outline_targets, file_path)
+        with profile_stage("pipeline"):
+            if targets:
+                analysis_results, components_results = await run_pipelined(
+                    stream_sections_with_ocr(file_path, pages=targets["pages"]), map_reduce=map_reduce
+                )
+            if not targets or not analysis_results.get("matching_count"):
+                analysis_results, components_results = await run_pipelined(
+                    stream_sections_with_ocr(file_path), map_reduce=map_reduce
+                )
+        background_tasks.add_task(index_file, file_path, filename, analysis_results.get("all_sections", []), document_id)
+        return analysis_results, components_results
+
+    # Parse the file and process sections to find those that match criteria
+    analysis_results = await analyze_upload(file_path, hierarchical)
+    background_tasks.add_task(index_file, file_path, filename, analysis_results.get("all_sections", []), document_id)
+    
+    # Extract evaluation components from matching sections
+    with profile_stage("components"):
+        return analysis_results, await parse_evaluation_components(analysis_results, map_reduce)
+
+async def extract_evaluation_model(
+    file_path: str,
+    filename: str,
+    background_tasks: BackgroundTasks,
+    document_id: str,
+    options: dict,
+    api_key: Optional[str] = None
+):
+    """
+    Extracts the evaluation components of an uploaded PDF and stores them as an evaluation model.
+
+    Incomplete models are returned marked as partial but not stored, so the next upload
+    extracts them again: those from a partial analysis (token budget exhausted), from an
+    analysis in which sections could not be classified, or with extraction errors.
+    """
+    # Small documents are admitted first when the endpoint is busy
+    pages = await asyncio.to_thread(page_count, file_path)
+    async with admission("parse-evaluation-components").admit(pages):
+        with request_tokens(api_key, filename) as usage:
+            analysis_results, results = await extract_components(
+                file_path, filename, background_tasks, document_id=document_id, **options
+            )
+    results["usage"] = usage.summary()
+    failed = failed_sections(analysis_results)
+    if failed:
+        results["failed_sections"] = failed
+    if usage.exhausted or failed or results.get("errors"):
+        results["partial"] = True
+    elif results.get("success"):
+        results["model_id"] = await asyncio.to_thread(store_model, document_id, options, results)
+    return results
+
 @app.post("/parse-evaluation-components/")
-async def parse_evaluation_components_endpoint(file: UploadFile = File(...)):
+async def parse_evaluation_components_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    hierarchical: bool = False,
+    pipelined: bool = False,
+    map_reduce: bool = False
+):
     """
     Full pipeline: parses PDF, analyzes sections, and extracts evaluation components in one step.
+
+    With pipelined=true, component extraction starts on micro-batches of matching sections
+    while the remaining sections are still being analyzed (ignored when hierarchical=true).
+    With map_reduce=true, components are extracted per matching section and merged afterwards.
     """
     file_path = os.path.join(UPLOAD_DIR, file.filename) 
 
     # Save uploaded file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await asyncio.to_thread(save_upload, file, file_path)
 
     try:
-        # Parse the file to get subsections
-        parsed_data = extract_everything(file_path)
-        
-        # Process sections to find those that match criteria
-        analysis_results = await analyze_pdf_sections({"subsections": parsed_data})
-        
-        # Extract evaluation components from matching sections
-        components_results = await parse_evaluation_components(analysis_results)
-        
-        return components_results
+        document_id = await asyncio.to_thread(store_document, file_path)
+        options = {"hierarchical": hierarchical, "pipelined": pipelined, "map_reduce": map_reduce}
+
+        # The pipeline reads the stored copy, the upload path may be overwritten by the next
+        # upload, and the model is stored under this document's hash.
+        # A document extracted before by the same pipeline version costs no parsing or LLM work
+        model_id = await asyncio.to_thread(find_model, document_id, options)
+        if model_id:
+            return await asyncio.to_thread(load_model, model_id)
+
+        # Identical uploads in flight share one pipeline run. Pending section analysis and LLM
+        # calls are cancelled once every client waiting for them has gone away.
+        return await cancel_on_disconnect(
+            request,
+            single_flight.run(
+                f"parse-evaluation-components:{document_id}:{hierarchical}:{pipelined}:{map_reduce}",
+                lambda: extract_evaluation_model(
+                    document_path(document_id),
+                    file.filename,
+                    background_tasks,
+                    document_id,
+                    options,
+                    request.headers.get("x-api-key")
+                ),
+                "parse-evaluation-components"
+            ),
+            "parse-evaluation-components"
+        )
+    except ClientDisconnected:
+        return client_disconnected_response()
+    except AdmissionRejected as e:
+        return too_busy_response(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"Component extraction failed: {str(e)}"}
         )
 
+@app.post("/analyze-tender-bundle/")
+async def analyze_tender_bundle_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...)
+):
+    """
+    Full pipeline over all documents of one procurement (e.g. Anbudsinbjudan, Kravspecifikation
+    and Utvärderingsmodell), uploaded as several files and/or ZIP archives.
+    """
+    try:
+        uploads = [(file.filename, await file.read()) for file in files]
+
+        async def analyze():
+            # Page counts are only known after unpacking, so bundles are prioritised by upload size
+            async with admission("analyze-tender-bundle").admit(sum(len(content) for _, content in uploads)):
+                # Every document of the bundle also has its own token budget
+                with request_tokens(request.headers.get("x-api-key")) as usage:
+                    bundle_results = await analyze_tender_bundle(UPLOAD_DIR, uploads)
+                bundle_results["usage"] = usage.summary()
+                return bundle_results
+
+        bundle_results = await cancel_on_disconnect(request, analyze(), "analyze-tender-bundle")
+        background_tasks.add_task(index_bundle, bundle_results)
+        return bundle_results
+    except ClientDisconnected:
+        return client_disconnected_response()
+    except AdmissionRejected as e:
+        return too_busy_response(e)
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": str(e)}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Bundle analysis failed: {str(e)}"}
+        )
+
+@app.post("/convert-pdf-to-docx/")
+async def convert_pdf_to_docx_endpoint(file: UploadFile = File(...), force: bool = False):
+    """
+    Starts converting an uploaded PDF to DOCX in the background. Poll /conversions/{document_id}
+    for the status and download the result from /conversions/{document_id}/docx.
+
+    PDFs whose text layer already gives the section structure are not converted (status
+    'skipped') unless force=true.
+    """
+    file_path = os.path.join(UPLOAD_DIR, file.filename)
+    await asyncio.to_thread(save_upload, file, file_path)
+
+    try:
+        document_id = await asyncio.to_thread(store_document, file_path)
+        # The job reads the stored copy, the upload path may be overwritten by the next upload
+        status = await submit_conversion(document_id, document_path(document_id), force)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Conversion failed: {str(e)}"}
+        )
+    status_code = 202 if status["status"] in ("checking", "queued", "running") else 200
+    return JSONResponse(status_code=status_code, content=status)
+
+@app.get("/conversions/{document_id}")
+def get_conversion_status(document_id: str):
+    """
+    Status of the DOCX conversion of a document ('queued', 'running', 'done', 'skipped' or
+    'failed'), with the pages and the conversion time per page once done.
+    """
+    status = job_status(document_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": "Conversion not found"})
+    return status
+
+@app.get("/conversions/{document_id}/docx")
+def get_converted_docx(document_id: str):
+    """
+    The DOCX converted from a document. Conversions are keyed by the content hash of the PDF
+    and never change, so the response is cacheable forever.
+    """
+    path = cached_docx_path(document_id)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "Converted document not found"})
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        filename=f"{document_id}.docx",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.post("/documents", status_code=201)
+async def create_document(response: Response, file: UploadFile = File(...)):
+    """
+    Stores an uploaded PDF as a document resource. Its pipeline stages are computed on
+    demand by /documents/{document_id}/sections, /analysis and /components.
+    """
+    file_path = os.path.join(UPLOAD_DIR, file.filename)
+    await asyncio.to_thread(save_upload, file, file_path)
+
+    try:
+        document_id = await asyncio.to_thread(store_document, file_path)
+        pages = await asyncio.to_thread(page_count, document_path(document_id))
+        info = await asyncio.to_thread(register_document, document_id, file.filename, pages)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Storing the document failed: {str(e)}"}
+        )
+    response.headers["Location"] = f"/documents/{document_id}"
+    return {**info, "stages": await asyncio.to_thread(stage_status, document_id)}
+
+@app.get("/documents/{document_id}")
+async def get_document(document_id: str):
+    """
+    A stored document with the version of every stage and the options it has been computed with.
+    """
+    info = await asyncio.to_thread(document_info, document_id)
+    if info is None:
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+    return {**info, "stages": await asyncio.to_thread(stage_status, document_id)}
+
+async def document_stage_response(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    document_id: str,
+    stage: str,
+    options: dict
+):
+    """
+    The result of a stage of a stored document. Stored results are returned right away;
+    otherwise the stage (and the stages before it that are not stored) is computed under
+    admission control and the token budgets of the request.
+    """
+    info = await asyncio.to_thread(document_info, document_id)
+    if info is None:
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+
+    # Stored results skip the admission queue
+    result = await asyncio.to_thread(load_stage, document_id, stage, options)
+    if result is not None:
+        return {**result, "document_id": document_id, "stage": {"name": stage, "options": options, "stored": True}}
+
+    try:
+        async def compute():
+            # Small documents are admitted first when the endpoint is busy
+            async with admission(f"documents/{stage}").admit(info["pages"]):
+                with request_tokens(request.headers.get("x-api-key"), info["filename"]) as usage:
+                    result, stored = await get_stage(document_id, stage, options)
+            if not stored:
+                result = {**result, "usage": usage.summary()}
+            return result, stored
+
+        # Pending LLM calls are cancelled once every client waiting for them has gone away
+        result, stored = await cancel_on_disconnect(request, compute(), f"documents/{stage}")
+    except ClientDisconnected:
+        return client_disconnected_response()
+    except AdmissionRejected as e:
+        return too_busy_response(e)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Computing {stage} failed: {str(e)}"}
+        )
+
+    if not stored and stage in ("sections", "analysis"):
+        # Add the sections (with their verdicts once analysed) to the cross-tender search index
+        sections = result.get("content") if stage == "sections" else result.get("all_sections")
+        background_tasks.add_task(index_file, document_path(document_id), info["filename"], sections or [], document_id)
+    return {**result, "document_id": document_id, "stage": {"name": stage, "options": options, "stored": stored}}
+
+@app.get("/documents/{document_id}/sections")
+async def get_document_sections(document_id: str, request: Request, background_tasks: BackgroundTasks):
+    """
+    Sections, subsections, text and tables of a stored document (as /everything-scraper/).
+    """
+    return await document_stage_response(request, background_tasks, document_id, "sections", {})
+
+@app.get("/documents/{document_id}/analysis")
+async def get_document_analysis(
+    document_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    hierarchical: bool = False
+):
+    """
+    LLM classification of the sections of a stored document (as /analyze-pdf-sections/),
+    computed from its stored sections.
+    """
+    options = {"hierarchical": hierarchical}
+    return await document_stage_response(request, background_tasks, document_id, "analysis", options)
+
+@app.get("/documents/{document_id}/components")
+async def get_document_components(
+    document_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    hierarchical: bool = False,
+    map_reduce: bool = False
+):
+    """
+    Evaluation components of a stored document (as /parse-evaluation-components/), computed
+    from its stored analysis. The model is also stored as an evaluation model ('model_id').
+    """
+    options = {"hierarchical": hierarchical, "map_reduce": map_reduce}
+    return await document_stage_response(request, background_tasks, document_id, "components", options)
+
+@app.delete("/documents/{document_id}/{stage}")
+async def invalidate_document_stage(document_id: str, stage: str):
+    """
+    Removes the stored results of a stage and of the stages computed from it, so they are
+    computed again on the next request.
+    """
+    if stage not in STAGES:
+        return JSONResponse(status_code=404, content={"error": f"Unknown stage, expected one of {', '.join(STAGES)}"})
+    if await asyncio.to_thread(document_info, document_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+    removed = await asyncio.to_thread(invalidate_stage, document_id, stage)
+    return {"document_id": document_id, "removed": removed, "stages": await asyncio.to_thread(stage_status, document_id)}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    Metrics of this worker in the Prometheus text format.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/search")
+async def search_sections_endpoint(q: str, limit: int = 10, verdict: Optional[bool] = None):
+    """
+    Full-text search over the sections of every previously uploaded tender.
+
+    Args:
+        q: Swedish free-text query, e.g. "prisavdrag referenspoäng"
+        limit: Maximum number of hits
+        verdict: Only return sections that step 1 did (true) or did not (false) match
+    """
+    return await asyncio.to_thread(search, q, max(1, min(limit, 100)), verdict)
+
+@app.get("/documents/{document_id}/pages/{page}/highlight")
+async def highlight_page_endpoint(
+    document_id: str,
+    page: int,
+    zoom: float = DEFAULT_ZOOM,
+    bbox: List[str] = Query(default=[])
+):
+    """
+    Low-resolution render of a page with regions highlighted, e.g. the spans of the
+    matching sections returned by /analyze-pdf-sections/.
+
+    Args:
+        document_id: The document_id returned when the document was analyzed
+        page: 1-based page number
+        zoom: Scale factor, 1.0 = 72 dpi
+        bbox: Regions to highlight as 'x0,y0,x1,y1' in PDF points, repeatable
+    """
+    pdf_path = document_path(document_id)
+    if pdf_path is None:
+        return JSONResponse(status_code=404, content={"error": "Document not found"})
+    try:
+        regions = parse_regions(bbox)
+        image = await asyncio.to_thread(highlighted_page, document_id, pdf_path, page, zoom, regions)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    # The document is content-addressed, so a render never changes
+    return Response(
+        content=image,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.get("/evaluation-models/{model_id}")
+async def get_evaluation_model(model_id: str, request: Request):
+    """
+    An evaluation model extracted by /parse-evaluation-components/ (its 'model_id').
+
+    Models are named after the hash of their contents and never change, so the response is
+    cacheable forever and revalidation with If-None-Match is answered with 304.
+    """
+    path = model_path(model_id)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "Evaluation model not found"})
+
+    headers = {"ETag": f'"{model_id}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    content = await asyncio.to_thread(read_bytes, path)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+@app.post("/sensitivity-analysis/")
+async def sensitivity_analysis_endpoint(payload: dict = Body(...)):
+    """
+    Ranks bids under an evaluation model and works out, per bid and criterion, where the
+    ranking against the other bids flips and the smallest change that makes the bid win.
+
+    Body:
+        model_id: A stored evaluation model, or 'questions' and 'calculationOrder' inline
+        bids: Answers per bid, e.g. {"Vi": {"anbudspris": 4200000, "referenspoang": 40}, ...}
+        targets: Optional list of bids to analyse, all bids by default
+    """
+    model = payload
+    if payload.get("model_id"):
+        if model_path(payload["model_id"]) is None:
+            return JSONResponse(status_code=404, content={"error": "Evaluation model not found"})
+        model = await asyncio.to_thread(load_model, payload["model_id"])
+    try:
+        return analyze_sensitivity(
+            model.get("questions") or [],
+            model.get("calculationOrder") or [],
+            payload.get("bids") or {},
+            payload.get("targets")
+        )
+    except (ValueError, TypeError, AttributeError) as e:
+        return JSONResponse(status_code=400, content={"error": f"Invalid evaluation model or bids: {str(e)}"})
+
+@app.get("/profiles/{profile_id}")
+async def get_profile_summary(profile_id: str, request: Request):
+    """
+    Per-stage timing and memory of a profiled request. Requires the X-Profile header.
+    """
+    return profile_file_response(profile_id, "summary.json", request)
+
+@app.get("/profiles/{profile_id}/cpu")
+async def get_profile_cpu(profile_id: str, request: Request):
+    """
+    CPU samples of a profiled request in folded-stack format (e.g. for flamegraph.pl or
+    speedscope). Requires the X-Profile header.
+    """
+    return profile_file_response(profile_id, "cpu.folded", request)
+
+def profile_file_response(profile_id: str, filename: str, request: Request):
+    if not is_authorized(request.headers.get("x-profile")):
+        return JSONResponse(status_code=403, content={"error": "Profiling is not enabled for this caller"})
+    path = profile_path(profile_id, filename)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "Profile not found"})
+    return FileResponse(path, filename=f"{profile_id}-{filename}")
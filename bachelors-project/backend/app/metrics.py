@@ -0,0 +1,122 @@
+"""
+Minimal in-process metrics in the Prometheus text exposition format, served at /metrics.
+
+Each worker process keeps its own values; scrape every worker (or aggregate in Prometheus).
+"""
+import threading
+from typing import Dict, List, Tuple
+
+_lock = threading.Lock()
+_metrics: List["Metric"] = []
+
+
+class Metric:
+    """A named metric with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        with _lock:
+            _metrics.append(self)
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def value(self, **labels) -> float:
+        with _lock:
+            return self.values.get(self._key(labels), 0.0)
+
+    def total(self, **labels) -> float:
+        """Sum over all label sets that include the given labels."""
+        wanted = set(self._key(labels))
+        with _lock:
+            return sum(value for key, value in self.values.items() if wanted <= set(key))
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            labels = ",".join(f'{name}="{label}"' for name, label in key)
+            lines.append(f"{self.name}{{{labels}}} {value:g}" if labels else f"{self.name} {value:g}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. the number of cancelled requests."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down, e.g. the number of requests in flight."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with _lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets, e.g. event loop lag in seconds.
+    value() and total() give the number of observations.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...]):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self.bucket_counts: Dict[Tuple[Tuple[str, str], ...], List[int]] = {}
+        self.sums: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            counts = self.bucket_counts.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = self.values.get(key, 0.0) + 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted((key, list(self.bucket_counts[key]), count, self.sums[key]) for key, count in self.values.items())
+        for key, counts, count, total in items:
+            labels = [f'{name}="{label}"' for name, label in key]
+            bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, counts + [count]):
+                bucket_labels = ",".join(labels + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {bucket_count:g}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total:g}")
+            lines.append(f"{self.name}_count{suffix} {count:g}")
+        return "\n".join(lines)
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text format."""
+    with _lock:
+        metrics = list(_metrics)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
@@ -1,4 +1,3 @@
-import docx
 import re
 from typing import Dict, List, Any, Tuple
 import logging
@@ -17,6 +16,8 @@ def extract_sections_from_docx(docx_path: str) -> Dict[str, List[Dict[str, str]]
         Dict: A dictionary with "content" key containing a list of sections with their titles and text
     """
     try:
+        import docx  # python-docx, imported on first use to keep worker startup fast
+
         doc = docx.Document(docx_path)
         extracted_data = {"content": []}
         
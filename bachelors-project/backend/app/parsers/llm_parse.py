@@ -1,149 +1,305 @@
-import fitz  # PyMuPDF
 import asyncio
-import json
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import os
-from app.llm import process_pdf_page
+from app.llm import estimate_tokens, process_pdf_window
 
-async def extract_text_from_page(page) -> str:
+# Token budget of the page text sent in one LLM call: short pages are packed into one
+# window, longer pages are split over several
+LLM_PARSE_WINDOW_TOKENS = int(os.environ.get("LLM_PARSE_WINDOW_TOKENS", "3000"))
+
+# Tokens at the end of a window repeated at the start of the next one, so a section that
+# crosses the boundary is seen with its heading in both
+LLM_PARSE_OVERLAP_TOKENS = int(os.environ.get("LLM_PARSE_OVERLAP_TOKENS", "300"))
+
+# Maximum number of window analysis calls in flight per document
+LLM_PARSE_MAX_CONCURRENCY = int(os.environ.get("LLM_PARSE_MAX_CONCURRENCY", "4"))
+
+# Characters per token, the same estimate as app.llm.estimate_tokens
+CHARS_PER_TOKEN = 4
+
+# Shortest repeated text taken as window overlap when merging a section's parts
+MIN_OVERLAP_CHARS = 20
+
+PAGE_MARKER_PATTERN = re.compile(r'\[Sida \d+\]\n?')
+
+def read_page_texts(pdf_path: str) -> List[str]:
+    """
+    Extract the text of every page of a PDF. Blocking, run it in a worker thread.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        List with the text of each page
+    """
+    import fitz  # PyMuPDF, imported on first use to keep worker startup fast
+
+    with fitz.open(pdf_path) as doc:
+        return [page.get_text() for page in doc]
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    Split text into pieces of at most max_chars, preferably at a line break or a space.
+    """
+    pieces = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = start + max_chars
+        cut = text.rfind("\n", start + max_chars // 2, end)
+        if cut == -1:
+            cut = text.rfind(" ", start + max_chars // 2, end)
+        if cut != -1:
+            end = cut
+        pieces.append(text[start:end])
+        start = end
+    pieces.append(text[start:])
+    return pieces
+
+def overlap_tail(text: str, max_chars: int) -> str:
+    """The last max_chars of a text, starting at a word boundary."""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space != -1 else tail
+
+def build_windows(
+    page_texts: List[str],
+    window_tokens: int = LLM_PARSE_WINDOW_TOKENS,
+    overlap_tokens: int = LLM_PARSE_OVERLAP_TOKENS
+) -> List[Dict[str, Any]]:
+    """
+    Pack the pages of a document into token-budgeted windows.
+
+    Consecutive pages are packed into a window until the next one would exceed the budget;
+    a page longer than the budget is split over several windows. Every window after the
+    first starts with the last overlap_tokens of the previous one. Each page (part) is
+    introduced by a [Sida N] marker. Pages without text are left out.
+
+    Args:
+        page_texts: Text of each page
+        window_tokens: Token budget of the page text of one window
+        overlap_tokens: Tokens repeated from the end of the previous window
+
+    Returns:
+        List of windows with the 'pages' (1-based) they cover and their 'text'
+    """
+    max_chars = max(window_tokens - overlap_tokens, 1) * CHARS_PER_TOKEN
+    segments = [
+        (page_number, piece)
+        for page_number, page_text in enumerate(page_texts, start=1)
+        if page_text.strip()
+        for piece in split_text(page_text.strip(), max_chars)
+    ]
+
+    windows: List[Dict[str, Any]] = []
+    current: List[Tuple[int, str]] = []
+    current_tokens = 0
+    previous: Optional[Tuple[int, str]] = None
+
+    def flush():
+        text = "\n".join(f"[Sida {page_number}]\n{piece}" for page_number, piece in current)
+        if previous and overlap_tokens > 0:
+            page_number, piece = previous
+            text = f"[Sida {page_number}]\n{overlap_tail(piece, overlap_tokens * CHARS_PER_TOKEN)}\n{text}"
+        windows.append({
+            "pages": sorted({page_number for page_number, _ in current}),
+            "text": text,
+        })
+
+    for page_number, piece in segments:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > window_tokens - overlap_tokens:
+            flush()
+            previous = current[-1]
+            current, current_tokens = [], 0
+        current.append((page_number, piece))
+        current_tokens += tokens
+    if current:
+        flush()
+    return windows
+
+def normalize_heading(title: str) -> str:
+    """Section heading compared independent of case, whitespace and a continuation mark."""
+    title = " ".join(title.split()).lower()
+    title = re.sub(r'\s*\((forts\.?|fortsättning)\)$', "", title)
+    return title.rstrip(" .:")
+
+def join_overlapping(first: str, second: str) -> str:
+    """
+    Join two parts of a section, dropping the text the second repeats from the end of the
+    first (the window overlap).
+    """
+    first, second = first.strip(), second.strip()
+    if second in first:
+        return first
+    if first in second:
+        return second
+    longest = min(len(first), len(second), 2 * LLM_PARSE_OVERLAP_TOKENS * CHARS_PER_TOKEN)
+    for length in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return first + second[length:]
+    return f"{first}\n{second}"
+
+def reconcile_sections(window_sections: List[Dict[str, Any]]) -> Dict[str, str]:
     """
-    Extract text content from a single PDF page.
-    
+    Merge the sections found in consecutive windows into one entry per section.
+
+    A section that crosses a window boundary is reported by both windows under the same
+    heading, usually with the overlap text in both parts; the parts are joined in window
+    order without repeating the overlap. Only the same heading in the next window is
+    joined: a heading that recurs further on (e.g. "Allmänt" in another chapter) is a
+    different section and kept as its own entry, numbered "(2)", "(3)", ... after the first.
+
     Args:
-        page: A PyMuPDF page object
-        
+        window_sections: Sections (heading -> text) found in each window, in document order,
+            with an empty dictionary for windows whose sections are not used
+
     Returns:
-        String containing all text from the page
+        Dictionary of section heading (as first seen) -> merged text
     """
-    return page.get_text()
+    entries: List[List[str]] = []
+    # Normalized heading -> entry, for the sections of the previous window
+    previous: Dict[str, List[str]] = {}
+    for sections in window_sections:
+        current: Dict[str, List[str]] = {}
+        for section_title, section_content in sections.items():
+            # Skip anything but string headings with string content
+            if not isinstance(section_title, str) or not isinstance(section_content, str):
+                continue
+            key = normalize_heading(section_title)
+            if not key:
+                continue
+            entry = current.get(key) or previous.get(key)
+            if entry is not None:
+                entry[1] = join_overlapping(entry[1], section_content)
+            else:
+                entry = [section_title.strip(), section_content.strip()]
+                entries.append(entry)
+            current[key] = entry
+        previous = current
 
-async def process_pdf_with_llm(pdf_path: str) -> Dict[str, Any]:
+    merged: Dict[str, str] = {}
+    for title, content in entries:
+        unique_title, repeat = title, 1
+        while unique_title in merged:
+            repeat += 1
+            unique_title = f"{title} ({repeat})"
+        merged[unique_title] = content
+    return merged
+
+def sections_from_text(content: str) -> Dict[str, str]:
+    """
+    Extract numbered sections ("1 Title", "1.1 Subtitle") from text with a pattern, for
+    windows the LLM returned no sections for.
     """
-    Process a PDF document by splitting it into pages and analyzing each page with LLM.
-    
+    content = PAGE_MARKER_PATTERN.sub("", content)
+    sections: Dict[str, str] = {}
+
+    # Look for patterns like "1 Title" or "1.1 Subtitle"
+    section_pattern = r'(\d+(\.\d+)?)\s+([^\n]+)'
+    for match in re.finditer(section_pattern, content):
+        full_title = f"{match.group(1)} {match.group(3)}"
+
+        # Extract content following this section title until the next section title
+        start_pos = match.end()
+        next_match = re.search(section_pattern, content[start_pos:])
+        if next_match:
+            section_content = content[start_pos:start_pos + next_match.start()].strip()
+        else:
+            section_content = content[start_pos:].strip()
+
+        if full_title in sections:
+            sections[full_title] += f"\n{section_content}"
+        else:
+            sections[full_title] = section_content
+    return sections
+
+async def process_pdf_with_llm(pdf_path: str, semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """
+    Process a PDF document by packing its pages into token-budgeted windows and analyzing
+    each window with the LLM.
+
     Args:
         pdf_path: Path to the PDF file
-        
+        semaphore: Limits the window calls in flight; one per document if not given
+
     Returns:
-        Dictionary containing sections that match the criteria
-    """
-    # Open the PDF
-    doc = fitz.open(pdf_path)
-    
-    # Extract text from each page in parallel
-    tasks = [extract_text_from_page(page) for page in doc]
-    page_texts = await asyncio.gather(*tasks)
-    
-    # Process each page with LLM in parallel
-    page_tasks = []
-    for page_num, page_text in enumerate(page_texts):
-        # Process this page with the LLM
-        page_tasks.append(process_pdf_page(page_num + 1, page_text))
-    
-    # Wait for all LLM processing to complete
-    page_results = await asyncio.gather(*page_tasks)
-    
-    # Filter for pages that meet criteria
-    matching_pages = [result for result in page_results if result["meets_criteria"]]
-    
-    # Organize results
+        Dictionary with the 'matching_windows', 'total_pages' and 'all_windows'
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_PARSE_MAX_CONCURRENCY)
+
+    # Text extraction blocks, keep it off the event loop
+    page_texts = await asyncio.to_thread(read_page_texts, pdf_path)
+    windows = build_windows(page_texts)
+
+    async def analyze(window: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await process_pdf_window(window["pages"], window["text"])
+
+    window_results = await asyncio.gather(*(analyze(window) for window in windows))
+
     return {
-        "matching_pages": matching_pages,
+        "matching_windows": [result for result in window_results if result["meets_criteria"]],
         "total_pages": len(page_texts),
-        "all_pages": page_results  # Include all pages for debugging
+        "all_windows": window_results  # Include all windows for debugging
     }
 
 async def extract_sections_with_llm(pdf_path: str) -> Dict[str, Any]:
     """
     Higher-level function to extract sections from a PDF using LLM analysis.
-    
+
     Args:
         pdf_path: Path to the PDF file
-        
+
     Returns:
         Dictionary containing structured content from the PDF
     """
-    # Process the PDF with LLM
     results = await process_pdf_with_llm(pdf_path)
-    
-    # Combine all sections from matching pages
-    all_sections = {}
-    
-    # First, try to extract sections from LLM output
-    for page_result in results["matching_pages"]:
-        page_sections = page_result.get("sections", {})
-        
-        # Merge sections from this page with existing sections
-        for section_title, section_content in page_sections.items():
-            # Skip if section_title is not a string
-            if not isinstance(section_title, str):
-                continue
-                
-            # Skip if section_content is not a string
-            if not isinstance(section_content, str):
-                continue
-                
-            if section_title in all_sections:
-                all_sections[section_title] += f"\n{section_content}"
-            else:
-                all_sections[section_title] = section_content
-    
+    matching_windows = results["matching_windows"]
+
+    # Sections the LLM found, merged across window boundaries; windows that do not match
+    # take part as empty, so only sections of neighbouring windows are joined
+    all_windows = results["all_windows"]
+    all_sections = reconcile_sections([
+        result.get("sections", {}) if result["meets_criteria"] else {} for result in all_windows
+    ])
+
     # If no sections were found, fall back to manual extraction
     if not all_sections:
-        # Extract sections manually from the content
-        for page_result in results["matching_pages"]:
-            page_content = page_result["content"]
-            
-            # Look for patterns like "1 Title" or "1.1 Subtitle"
-            section_pattern = r'(\d+(\.\d+)?)\s+([^\n]+)'
-            section_matches = re.finditer(section_pattern, page_content)
-            
-            for match in section_matches:
-                section_num = match.group(1)
-                section_title = match.group(3)
-                full_title = f"{section_num} {section_title}"
-                
-                # Extract content following this section title until the next section title
-                start_pos = match.end()
-                next_match = re.search(section_pattern, page_content[start_pos:])
-                
-                if next_match:
-                    end_pos = start_pos + next_match.start()
-                    section_content = page_content[start_pos:end_pos].strip()
-                else:
-                    section_content = page_content[start_pos:].strip()
-                
-                # Add or append to existing section
-                if full_title in all_sections:
-                    all_sections[full_title] += f"\n{section_content}"
-                else:
-                    all_sections[full_title] = section_content
-    
+        all_sections = reconcile_sections([
+            sections_from_text(result["content"]) if result["meets_criteria"] else {} for result in all_windows
+        ])
+
     return {
         "sections": all_sections,
         "analysis_summary": {
             "total_pages": results["total_pages"],
-            "matching_pages": len(results["matching_pages"])
+            "windows": len(results["all_windows"]),
+            "matching_windows": len(matching_windows),
+            "matching_pages": len({page for result in matching_windows for page in result["pages"]})
         }
     }
 
 if __name__ == "__main__":
     # Example usage
     pdf_path = "backend/uploads/Kravspecifikation.pdf"
-    
+
     async def test():
         result = await extract_sections_with_llm(pdf_path)
-        
+
         print(f"\nAnalysis Summary:")
         print(f"Total Pages: {result['analysis_summary']['total_pages']}")
+        print(f"Windows: {result['analysis_summary']['windows']}")
         print(f"Matching Pages: {result['analysis_summary']['matching_pages']}")
-        
+
         print("\nExtracted Sections:")
         for title, content in result["sections"].items():
             print(f"\n{title}")
             print("-" * len(title))
             print(f"{content[:200]}..." if len(content) > 200 else content)
-    
+
     # Run the async test function
-    asyncio.run(test()) 
\ No newline at end of file
+    asyncio.run(test())
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from app.parsers.pdfParserElias import extract_everything, iter_sections
+from app.profiling import profile_stage
+
+logger = logging.getLogger(__name__)
+
+# Pages whose text blocks cover less than this fraction of the page area are
+# considered to have no usable text layer (scanned annexes, photographed tables)
+TEXT_COVERAGE_THRESHOLD = float(os.environ.get("OCR_TEXT_COVERAGE_THRESHOLD", "0.01"))
+
+# Flagged pages are sent to OCR in small sub-PDFs of at most this many pages
+OCR_PAGES_PER_REQUEST = int(os.environ.get("OCR_PAGES_PER_REQUEST", "5"))
+
+# Maximum number of OCR requests in flight per document
+OCR_MAX_CONCURRENCY = int(os.environ.get("OCR_MAX_CONCURRENCY", "4"))
+
+# Number of parsed sections buffered between the parser thread and the consumer
+SECTION_STREAM_BUFFER = 8
+
+# An OCR engine takes the bytes of a PDF and returns its paragraphs as
+# dictionaries with "text" and a 1-based "page" number within that PDF
+OcrEngine = Callable[[bytes], List[Dict[str, Any]]]
+
+
+def document_ai_engine(pdf_content: bytes) -> List[Dict[str, Any]]:
+    """OCR engine backed by Google Document AI."""
+    from app.document_ai.document_processor import ocr_pdf_paragraphs
+
+    return ocr_pdf_paragraphs(pdf_content)
+
+
+def local_ocr_engine(pdf_content: bytes) -> List[Dict[str, Any]]:
+    """
+    Local OCR stand-in using PyMuPDF's Tesseract integration.
+
+    Requires a local Tesseract installation (TESSDATA_PREFIX) but no network access,
+    which makes it suitable for tests and offline development.
+    """
+    import fitz
+
+    paragraphs = []
+    with fitz.open(stream=pdf_content, filetype="pdf") as doc:
+        for page_num, page in enumerate(doc, 1):
+            textpage = page.get_textpage_ocr(language="swe+eng", full=True)
+            for block in page.get_text("blocks", textpage=textpage):
+                text = block[4].strip()
+                if text:
+                    paragraphs.append({"text": text, "page": page_num})
+    return paragraphs
+
+
+OCR_ENGINES = {
+    "documentai": document_ai_engine,
+    "local": local_ocr_engine,
+}
+
+
+def get_ocr_engine(name: Optional[str] = None) -> OcrEngine:
+    """
+    Return the OCR engine selected by name or by the OCR_BACKEND environment variable.
+
+    Args:
+        name: "documentai" (default) or "local"
+    """
+    name = name or os.environ.get("OCR_BACKEND", "documentai")
+    if name not in OCR_ENGINES:
+        raise ValueError(f"Unknown OCR backend: {name}")
+    return OCR_ENGINES[name]
+
+
+def text_coverage(page) -> float:
+    """
+    Fraction of the page area covered by text blocks in the page's text layer.
+    """
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    text_area = 0.0
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        if block_type == 0 and text.strip():
+            text_area += (x1 - x0) * (y1 - y0)
+    return min(text_area / page_area, 1.0)
+
+
+def find_pages_without_text(
+    doc,
+    threshold: float = TEXT_COVERAGE_THRESHOLD,
+    pages: Optional[List[int]] = None
+) -> List[int]:
+    """
+    Find pages whose text-layer coverage is below the threshold.
+
+    Blank pages (no text and no images) are not flagged, there is nothing to recognise.
+
+    Args:
+        doc: An open PyMuPDF document
+        threshold: Minimum fraction of the page area that must be covered by text
+        pages: Optional 1-based page numbers to check, all pages by default
+
+    Returns:
+        Sorted list of 1-based page numbers that need OCR
+    """
+    if pages is None:
+        pages = range(1, doc.page_count + 1)
+    flagged = []
+    for page_num in sorted(set(pages)):
+        if not 1 <= page_num <= doc.page_count:
+            continue
+        page = doc.load_page(page_num - 1)
+        if text_coverage(page) < threshold and page.get_images(full=False):
+            flagged.append(page_num)
+    return flagged
+
+
+def build_sub_pdf(doc, page_numbers: List[int]) -> bytes:
+    """
+    Copy the given pages of a document into a new, small PDF.
+
+    Args:
+        doc: An open PyMuPDF document
+        page_numbers: 1-based page numbers to copy, in order
+
+    Returns:
+        The bytes of the new PDF
+    """
+    import fitz
+
+    with fitz.open() as sub_doc:
+        for page_num in page_numbers:
+            sub_doc.insert_pdf(doc, from_page=page_num - 1, to_page=page_num - 1)
+        return sub_doc.tobytes(garbage=3, deflate=True)
+
+
+def prepare_ocr_batches(pdf_path: str, threshold: float, pages: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Flag pages without a text layer and cut them into sub-PDFs for OCR.
+
+    Returns:
+        List of batches with the original page numbers and the sub-PDF bytes
+    """
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        flagged = find_pages_without_text(doc, threshold, pages)
+        batches = []
+        for i in range(0, len(flagged), OCR_PAGES_PER_REQUEST):
+            page_numbers = flagged[i:i + OCR_PAGES_PER_REQUEST]
+            batches.append({
+                "pages": page_numbers,
+                "pdf": build_sub_pdf(doc, page_numbers)
+            })
+    return batches
+
+
+async def ocr_pages_without_text(
+    pdf_path: str,
+    ocr_engine: Optional[OcrEngine] = None,
+    threshold: float = TEXT_COVERAGE_THRESHOLD,
+    pages: Optional[List[int]] = None
+) -> Dict[int, List[str]]:
+    """
+    OCR only the pages of a PDF that lack a usable text layer.
+
+    Sub-PDFs are sent to the OCR engine concurrently. A failing batch is logged and
+    skipped, its pages then keep whatever text layer they have.
+
+    Args:
+        pdf_path: Path to the PDF file
+        ocr_engine: OCR engine to use, defaults to get_ocr_engine()
+        threshold: Text coverage threshold below which a page is OCR:ed
+        pages: Optional 1-based page numbers to consider, all pages by default
+
+    Returns:
+        Mapping of original 1-based page number to recognised paragraphs in reading order
+    """
+    batches = await asyncio.to_thread(prepare_ocr_batches, pdf_path, threshold, pages)
+    if not batches:
+        return {}
+
+    ocr_engine = ocr_engine or get_ocr_engine()
+    semaphore = asyncio.Semaphore(OCR_MAX_CONCURRENCY)
+
+    async def run_batch(batch):
+        async with semaphore:
+            return await asyncio.to_thread(ocr_engine, batch["pdf"])
+
+    results = await asyncio.gather(*(run_batch(batch) for batch in batches), return_exceptions=True)
+
+    ocr_pages: Dict[int, List[str]] = {}
+    for batch, paragraphs in zip(batches, results):
+        if isinstance(paragraphs, Exception):
+            logger.warning(f"OCR failed for pages {batch['pages']} of {pdf_path}: {str(paragraphs)}")
+            continue
+        for paragraph in paragraphs:
+            # Map the page number within the sub-PDF back to the original document
+            page_num = batch["pages"][paragraph["page"] - 1]
+            ocr_pages.setdefault(page_num, []).append(paragraph["text"])
+    return ocr_pages
+
+
+def ocr_enabled() -> bool:
+    """OCR fallback is on unless OCR_FALLBACK=0."""
+    return os.environ.get("OCR_FALLBACK", "1").lower() not in ("0", "false", "no")
+
+
+async def extract_everything_with_ocr(
+    pdf_path: str,
+    ocr_engine: Optional[OcrEngine] = None,
+    threshold: float = TEXT_COVERAGE_THRESHOLD,
+    pages: Optional[List[int]] = None
+) -> Dict[str, Any]:
+    """
+    Run extract_everything, using OCR for the pages that have no text layer.
+
+    Set OCR_FALLBACK=0 to disable OCR entirely.
+
+    Args:
+        pdf_path: Path to the PDF file
+        ocr_engine: OCR engine to use, defaults to get_ocr_engine()
+        threshold: Text coverage threshold below which a page is OCR:ed
+        pages: Optional 1-based page numbers to parse (see app/parsers/outline.py)
+
+    Returns:
+        The extract_everything output, with "ocr_pages" listing the pages that were OCR:ed
+    """
+    ocr_pages = {}
+    if ocr_enabled():
+        with profile_stage("ocr"):
+            ocr_pages = await ocr_pages_without_text(pdf_path, ocr_engine, threshold, pages)
+
+    with profile_stage("parse"):
+        extracted_data = await asyncio.to_thread(extract_everything, pdf_path, ocr_pages, pages)
+    extracted_data["ocr_pages"] = sorted(ocr_pages)
+    return extracted_data
+
+
+async def iterate_in_thread(iterator: Iterator[Any], buffer_size: int = SECTION_STREAM_BUFFER) -> AsyncIterator[Any]:
+    """
+    Run a blocking iterator in a worker thread and consume it asynchronously.
+
+    The buffer is bounded, so the producer thread pauses while the consumer is busy
+    instead of building up the whole result in memory.
+
+    Args:
+        iterator: A blocking iterator, e.g. iter_sections(...)
+        buffer_size: Maximum number of items waiting to be consumed
+
+    Yields:
+        The items of the iterator in order
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+    done = object()
+    stopped = False
+
+    def produce():
+        try:
+            for item in iterator:
+                if stopped:
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put((item, None)), loop).result()
+        except Exception as e:
+            asyncio.run_coroutine_threadsafe(queue.put((done, e)), loop).result()
+            return
+        asyncio.run_coroutine_threadsafe(queue.put((done, None)), loop).result()
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error:
+                    raise error
+                break
+            yield item
+    finally:
+        # Let the producer finish (or stop early) so its thread is not left blocked on a full queue
+        stopped = True
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+
+
+async def stream_sections_with_ocr(
+    pdf_path: str,
+    ocr_engine: Optional[OcrEngine] = None,
+    threshold: float = TEXT_COVERAGE_THRESHOLD,
+    pages: Optional[List[int]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming counterpart of extract_everything_with_ocr.
+
+    Pages without a text layer are OCR:ed first, then sections are yielded as soon as
+    they are parsed so that the LLM stage can start on them right away.
+
+    Yields:
+        Dictionaries with 'section' (heading line) and 'text' (content)
+    """
+    ocr_pages = {}
+    if ocr_enabled():
+        with profile_stage("ocr"):
+            ocr_pages = await ocr_pages_without_text(pdf_path, ocr_engine, threshold, pages)
+
+    async for section in iterate_in_thread(iter_sections(pdf_path, ocr_pages, pages)):
+        yield section
@@ -0,0 +1,98 @@
+"""
+Outline (bookmark) driven targeting of the pages worth parsing.
+
+Tender PDFs, especially merged bundles, often carry a bookmark outline. The sections that
+matter (Utvärdering, Pris, Tilldelningskriterier, ...) are usually a few pages out of
+hundreds, so when outline titles match the criteria vocabulary only their page ranges are
+parsed and classified. Without an outline, or without a matching title, the caller parses
+the whole document as before.
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def outline_fast_path_enabled() -> bool:
+    """Outline targeting is on unless OUTLINE_FAST_PATH=0."""
+    return os.environ.get("OUTLINE_FAST_PATH", "1").lower() not in ("0", "false", "no")
+
+
+def matches_criteria(title: str) -> bool:
+    # Imported here, app.step1 pulls in the LLM client
+    from app.step1.llm_sections import CRITERIA_TERMS
+
+    title = " ".join(title.lower().split())
+    return any(term in title for term in CRITERIA_TERMS)
+
+
+def entry_page_ranges(toc: List[List[Any]], page_count: int) -> List[Tuple[str, int, int]]:
+    """
+    The 1-based page range of every outline entry whose title matches the criteria.
+
+    An entry ends where the next entry on the same or a higher level starts. That page is
+    included, since the entry's text usually continues on it above the next heading.
+
+    Args:
+        toc: Outline as returned by doc.get_toc(): [level, title, page] per entry
+        page_count: Number of pages in the document
+
+    Returns:
+        List of (title, first page, last page)
+    """
+    ranges = []
+    for index, (level, title, page) in enumerate(toc):
+        if page < 1 or not matches_criteria(title):
+            continue
+        end = page_count
+        for next_level, _, next_page in toc[index + 1:]:
+            if next_level <= level and next_page >= 1:
+                end = max(page, min(next_page, page_count))
+                break
+        ranges.append((title, page, end))
+    return ranges
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge overlapping or adjacent page ranges."""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def outline_targets(pdf_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Find the pages of a PDF that its outline points to as relevant.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        Dictionary with the matching outline 'entries' (titles), the merged page 'ranges'
+        and the 'pages' to parse (1-based), or None if the document has no outline, no
+        entry matches, or the fast path is disabled
+    """
+    if not outline_fast_path_enabled():
+        return None
+
+    import fitz  # PyMuPDF, imported on first use to keep worker startup fast
+
+    with fitz.open(pdf_path) as doc:
+        toc = doc.get_toc(simple=True)
+        page_count = doc.page_count
+    if not toc:
+        return None
+
+    entries = entry_page_ranges(toc, page_count)
+    if not entries:
+        return None
+
+    ranges = merge_ranges([(start, end) for _, start, end in entries])
+    return {
+        "entries": [title for title, _, _ in entries],
+        "ranges": [list(page_range) for page_range in ranges],
+        "pages": [page for start, end in ranges for page in range(start, end + 1)],
+        "page_count": page_count,
+    }
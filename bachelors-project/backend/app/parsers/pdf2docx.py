@@ -1,22 +1,193 @@
 import os
-from pdf2docx import Converter
+import json
 import logging
-from typing import Optional
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from app.document_store import DOCUMENT_ID_PATTERN
+from app.hashing import sha256_file
+from app.metrics import Counter
 
 logger = logging.getLogger(__name__)
 
+# Converted documents by content hash of the PDF, so a document is only converted once
+PDF2DOCX_CACHE_DIR = os.environ.get("PDF2DOCX_CACHE_DIR", "app/store/docx")
+
+# Processes one conversion is spread over; pdf2docx parses a page range in each
+PDF2DOCX_PROCESSES = int(os.environ.get("PDF2DOCX_PROCESSES", str(os.cpu_count() or 1)))
+
+# Shorter documents are converted in a single process, starting the workers costs more
+PDF2DOCX_PARALLEL_MIN_PAGES = int(os.environ.get("PDF2DOCX_PARALLEL_MIN_PAGES", "8"))
+
+# A text layer is structured enough to skip the conversion when no page needs OCR and the
+# parser finds at least this many sections, together covering this share of the pages
+PDF2DOCX_SKIP_MIN_SECTIONS = int(os.environ.get("PDF2DOCX_SKIP_MIN_SECTIONS", "3"))
+PDF2DOCX_SKIP_MIN_COVERAGE = float(os.environ.get("PDF2DOCX_SKIP_MIN_COVERAGE", "0.8"))
+
+docx_conversions = Counter(
+    "docx_conversions_total",
+    "PDF to DOCX conversions by outcome (converted, cached, skipped, failed)"
+)
+docx_conversion_pages = Counter("docx_conversion_pages_total", "Pages converted from PDF to DOCX")
+docx_conversion_seconds = Counter("docx_conversion_seconds_total", "Seconds spent converting PDF to DOCX")
+
+def cached_docx_path(document_id: str) -> Optional[str]:
+    """
+    Path of the cached conversion of a document, or None if the ID is malformed or the
+    document has not been converted.
+    """
+    if not DOCUMENT_ID_PATTERN.match(document_id):
+        return None
+    path = os.path.join(PDF2DOCX_CACHE_DIR, f"{document_id}.docx")
+    return path if os.path.isfile(path) else None
+
+def conversion_info(document_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Pages and timing of the cached conversion of a document, or None if there is none.
+    """
+    if cached_docx_path(document_id) is None:
+        return None
+    try:
+        with open(os.path.join(PDF2DOCX_CACHE_DIR, f"{document_id}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def text_layer_structure(pdf_path: str) -> Dict[str, Any]:
+    """
+    Judge whether the text layer of a PDF already gives the section structure, in which case
+    converting it to DOCX gains nothing.
+
+    Args:
+        pdf_path: Path to the PDF file
+
+    Returns:
+        Dictionary with the 'pages', the pages that would need OCR ('pages_without_text'),
+        the number of 'sections' the parser finds, the share of the pages with text the
+        sections cover ('coverage') and the verdict ('structured')
+    """
+    import fitz  # PyMuPDF, imported on first use to keep worker startup fast
+    from app.parsers.ocr_fallback import find_pages_without_text
+    from app.parsers.pdfParserElias import iter_sections
+
+    with fitz.open(pdf_path) as doc:
+        pages = doc.page_count
+        pages_without_text = find_pages_without_text(doc)
+        pages_with_text = {
+            page_num for page_num in range(1, pages + 1)
+            if doc.load_page(page_num - 1).get_text().strip()
+        }
+
+    sections = 0
+    covered = set()
+    for section in iter_sections(pdf_path):
+        sections += 1
+        covered.update(span["page"] for span in section["spans"])
+
+    coverage = len(covered & pages_with_text) / len(pages_with_text) if pages_with_text else 0.0
+    return {
+        "pages": pages,
+        "pages_without_text": pages_without_text,
+        "sections": sections,
+        "coverage": round(coverage, 3),
+        "structured": (
+            not pages_without_text
+            and sections >= PDF2DOCX_SKIP_MIN_SECTIONS
+            and coverage >= PDF2DOCX_SKIP_MIN_COVERAGE
+        ),
+    }
+
+def convert_to_cache(pdf_path: str, document_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Convert a PDF to DOCX into the cache, unless it is cached already. Blocking and CPU
+    heavy, run it in a worker thread.
+
+    Documents of PDF2DOCX_PARALLEL_MIN_PAGES pages or more are converted with pdf2docx'
+    multiprocessing support, which parses page ranges in PDF2DOCX_PROCESSES processes.
+
+    Args:
+        pdf_path: Path to the PDF file
+        document_id: SHA-256 of the PDF if already known
+
+    Returns:
+        Dictionary with the 'document_id', the 'path' of the DOCX, whether it was 'cached'
+        and the 'pages', 'processes', 'seconds' and 'seconds_per_page' of the conversion
+    """
+    document_id = document_id or sha256_file(pdf_path)
+    info = conversion_info(document_id)
+    if info is not None:
+        docx_conversions.inc(outcome="cached")
+        return {**info, "document_id": document_id, "path": cached_docx_path(document_id), "cached": True}
+
+    # Converted next to its destination and moved in place, so readers never see half a file
+    os.makedirs(PDF2DOCX_CACHE_DIR, exist_ok=True)
+    docx_path = os.path.join(PDF2DOCX_CACHE_DIR, f"{document_id}.docx")
+    # Unique per conversion, concurrent conversions of the same document must not share it
+    fd, temporary_path = tempfile.mkstemp(dir=PDF2DOCX_CACHE_DIR, suffix=".tmp.docx")
+    os.close(fd)
+
+    # pdf2docx is imported on first use, it pulls in PyMuPDF and OpenCV
+    from pdf2docx import Converter
+
+    started = time.perf_counter()
+    try:
+        converter = Converter(pdf_path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+    try:
+        pages = len(converter.fitz_doc)
+        # pdf2docx uses no more processes than there are cores
+        processes = min(PDF2DOCX_PROCESSES, os.cpu_count() or 1) if pages >= PDF2DOCX_PARALLEL_MIN_PAGES else 1
+        converter.convert(temporary_path, multi_processing=processes > 1, cpu_count=processes)
+    except Exception:
+        docx_conversions.inc(outcome="failed")
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    finally:
+        converter.close()
+    seconds = time.perf_counter() - started
+
+    info = {
+        "pages": pages,
+        "processes": processes,
+        "seconds": round(seconds, 3),
+        # pdf2docx has no per-page hook, so the page time is the mean over the document
+        "seconds_per_page": round(seconds / pages, 3) if pages else 0.0,
+    }
+    fd, temporary_info_path = tempfile.mkstemp(dir=PDF2DOCX_CACHE_DIR, suffix=".tmp.json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    os.replace(temporary_info_path, os.path.join(PDF2DOCX_CACHE_DIR, f"{document_id}.json"))
+    os.replace(temporary_path, docx_path)
+
+    docx_conversions.inc(outcome="converted")
+    docx_conversion_pages.inc(pages)
+    docx_conversion_seconds.inc(seconds)
+    logger.info(
+        f"Converted {pdf_path} to DOCX: {pages} pages in {seconds:.1f} s "
+        f"({info['seconds_per_page']:.2f} s/page, {processes} processes)"
+    )
+    return {**info, "document_id": document_id, "path": docx_path, "cached": False}
+
 def convert_pdf_to_docx(pdf_path: str, output_path: Optional[str] = None) -> str:
     """
     Convert a PDF file to DOCX format.
-    
+
+    The conversion is cached by the content hash of the PDF, so converting the same
+    document again only copies the cached file.
+
     Args:
         pdf_path (str): Path to the input PDF file
-        output_path (Optional[str]): Path for the output DOCX file. If None, 
-                                    will use the same name as the PDF but with .docx extension
-    
+        output_path (Optional[str]): Path for the output DOCX file. If None, the cached
+                                    conversion is returned without copying it
+
     Returns:
         str: Path to the converted DOCX file
-    
+
     Raises:
         FileNotFoundError: If the input PDF file doesn't exist
         Exception: For any other errors during conversion
@@ -25,25 +196,21 @@ def convert_pdf_to_docx(pdf_path: str, output_path: Optional[str] = None) -> str
         # Check if input file exists
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
-        
-        # Generate output path if not provided
+
+        logger.info(f"Converting PDF to DOCX: {pdf_path}")
+        docx_path = convert_to_cache(pdf_path)["path"]
         if output_path is None:
-            output_path = os.path.splitext(pdf_path)[0] + '.docx'
-        
+            return docx_path
+
         # Create directory for output file if it doesn't exist
         output_dir = os.path.dirname(output_path)
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
-        
-        # Convert PDF to DOCX
-        logger.info(f"Converting PDF to DOCX: {pdf_path} -> {output_path}")
-        cv = Converter(pdf_path)
-        cv.convert(output_path)
-        cv.close()
-        
+        shutil.copyfile(docx_path, output_path)
+
         logger.info(f"Conversion completed successfully")
         return output_path
-    
+
     except FileNotFoundError as e:
         logger.error(f"File not found error: {str(e)}")
         raise
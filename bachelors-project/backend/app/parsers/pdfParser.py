@@ -1,9 +1,9 @@
-import fitz  # PyMuPDF for text and images
-import pdfplumber  # For table extraction
 import re
 
 def extract_sections_and_subsections(pdf_path):
     """Extracts EVERYTHING from the PDF: all text, sections, subsections, numbers, tables, and structure."""
+    import fitz  # PyMuPDF, imported on first use to keep worker startup fast
+
     doc = fitz.open(pdf_path)
     extracted_data = {"content": []}  # Store everything in a structured order
     current_title = None  # Track the current section or subsection
@@ -1,61 +1,178 @@
-import fitz  # PyMuPDF for text and images
-import pdfplumber  # For table extraction
 import re
 
-def extract_everything(pdf_path):
-    """Extracts EVERYTHING from the PDF: all text, sections, subsections, numbers, tables, and structure."""
-    doc = fitz.open(pdf_path)
-    extracted_data = {"content": []}  # Store everything in a structured order
+# Define a threshold for font size (adjust if necessary)
+FONT_THRESHOLD = 12
+
+# OCR output carries no font information, so only short lines matching the
+# heading pattern are treated as headings on OCR:ed pages
+OCR_HEADING_MAX_LENGTH = 80
+
+# Compile a regex pattern that captures headings like:
+# "1 Title", "1.5 Subtitle", "1.5.1 Another Subtitle", etc.
+heading_pattern = re.compile(r'^(\d+(?:\.\d+)*)(\s+.*)$')
+
+def text_layer_lines(page):
+    """
+    Yields (line_text, is_heading, bbox) for every line in the text layer of a PyMuPDF page.
+    """
+    blocks = page.get_text("dict")["blocks"]
+    for block in blocks:
+        if "lines" in block:
+            for line in block["lines"]:
+                # Combine text from all spans in the line
+                line_text = " ".join(span["text"].strip() for span in line["spans"])
+                if not line_text:
+                    continue
+
+                # Determine if any span is bold and get the maximum font size in this line
+                is_bold = any("Bold" in span["font"] for span in line["spans"])
+                max_font_size = max(span["size"] for span in line["spans"])
+
+                # A heading matches our heading pattern and meets style criteria
+                is_heading = bool(heading_pattern.match(line_text)) and is_bold and max_font_size >= FONT_THRESHOLD
+                yield line_text, is_heading, line["bbox"]
+
+def ocr_lines(paragraphs):
+    """
+    Yields (line_text, is_heading, bbox) for the OCR:ed paragraphs of a page. OCR output
+    carries no positions, so bbox is None.
+    """
+    for text in paragraphs:
+        line_text = " ".join(text.split())
+        is_heading = bool(heading_pattern.match(line_text)) and len(line_text) <= OCR_HEADING_MAX_LENGTH
+        yield line_text, is_heading, None
+
+def add_to_spans(spans, page_num, bbox):
+    """
+    Extends the spans of a section with one line: the bounding box of the section on each
+    page it covers is the union of its lines on that page (None on OCR:ed pages).
+    """
+    if not spans or spans[-1]["page"] != page_num:
+        spans.append({"page": page_num, "bbox": list(bbox) if bbox else None})
+    elif bbox and spans[-1]["bbox"]:
+        current = spans[-1]["bbox"]
+        spans[-1]["bbox"] = [
+            min(current[0], bbox[0]), min(current[1], bbox[1]),
+            max(current[2], bbox[2]), max(current[3], bbox[3])
+        ]
+
+def round_spans(spans):
+    for span in spans:
+        if span["bbox"]:
+            span["bbox"] = [round(value, 1) for value in span["bbox"]]
+    return spans
+
+# MuPDF keeps every object it has parsed cached on the open document, so while streaming
+# the document is reopened after this many pages to keep memory flat on huge PDFs
+REOPEN_INTERVAL = 200
+
+def iter_sections(pdf_path, ocr_pages=None, pages=None):
+    """
+    Yields the sections of a PDF one at a time, as soon as the next heading closes them.
+
+    Pages are loaded one by one and released before moving on, so memory stays flat
+    regardless of the number of pages.
+
+    Args:
+        pdf_path: Path to the PDF file
+        ocr_pages: Optional mapping of 1-based page number to recognised paragraphs. These
+                   pages use the OCR text instead of their (missing) text layer.
+        pages: Optional 1-based page numbers to parse, e.g. the ranges an outline points to.
+               A section never continues across a gap between the pages.
+
+    Yields:
+        Dictionaries with 'section' (heading line), 'text' (content) and 'spans' (the page
+        and bounding box, in PDF points, of the section on every page it covers)
+    """
+    import fitz  # PyMuPDF, imported on first use to keep worker startup fast
+
     current_title = None  # Track the current section or subsection
     current_content = []  # Store content under the current section
+    current_spans = []  # Pages and bounding boxes of the current section
+    ocr_pages = ocr_pages or {}
+
+    doc = fitz.open(pdf_path)
+    try:
+        if pages is None:
+            page_indexes = range(doc.page_count)
+        else:
+            page_indexes = sorted({page - 1 for page in pages if 1 <= page <= doc.page_count})
+
+        # Iterate over pages
+        previous_index = None
+        for count, page_index in enumerate(page_indexes):
+            page_num = page_index + 1
+            if count and count % REOPEN_INTERVAL == 0:
+                doc.close()
+                doc = fitz.open(pdf_path)
+
+            if previous_index is not None and page_index != previous_index + 1:
+                # Skipped pages: close the open section, text before the next heading is orphaned
+                if current_title:
+                    yield {
+                        "section": current_title,
+                        "text": "\n".join(current_content).strip(),
+                        "spans": round_spans(current_spans)
+                    }
+                current_title = None
+                current_content = []
+                current_spans = []
+            previous_index = page_index
+
+            if page_num in ocr_pages:
+                # Splice the recognised paragraphs in where the page's text would have been
+                lines = ocr_lines(ocr_pages[page_num])
+            else:
+                lines = text_layer_lines(doc.load_page(page_index))
+
+            for line_text, is_heading, bbox in lines:
+                # Skip very short lines (could be headers, footers, or page numbers)
+                if len(line_text) < 5:
+                    continue
+
+                # If the line is a heading, treat it as a new section
+                if is_heading:
+                    # Emit the previous section if it exists
+                    if current_title:
+                        yield {
+                            "section": current_title,
+                            "text": "\n".join(current_content).strip(),
+                            "spans": round_spans(current_spans)
+                        }
+                        current_content = []
+                        current_spans = []
+                    current_title = line_text
+                    add_to_spans(current_spans, page_num, bbox)
+                elif current_title:
+                    # Otherwise, if we're inside a section, add this line as content
+                    current_content.append(line_text)
+                    add_to_spans(current_spans, page_num, bbox)
+
+            # Drop the page (and its text dict) before loading the next one
+            lines = None
+    finally:
+        doc.close()
 
-    # Define a threshold for font size (adjust if necessary)
-    font_threshold = 12
-
-    # Compile a regex pattern that captures headings like:
-    # "1 Title", "1.5 Subtitle", "1.5.1 Another Subtitle", etc.
-    heading_pattern = re.compile(r'^(\d+(?:\.\d+)*)(\s+.*)$')
-
-    # Iterate over pages
-    for page_num, page in enumerate(doc, 1):
-        blocks = page.get_text("dict")["blocks"]
-        for block in blocks:
-            if "lines" in block:
-                for line in block["lines"]:
-                    # Combine text from all spans in the line
-                    line_text = " ".join(span["text"].strip() for span in line["spans"])
-                    # Skip very short lines (could be headers, footers, or page numbers)
-                    if len(line_text) < 5:
-                        continue
-
-                    # Determine if any span is bold and get the maximum font size in this line
-                    is_bold = any("Bold" in span["font"] for span in line["spans"])
-                    max_font_size = max(span["size"] for span in line["spans"])
-
-                    # If the line matches our heading pattern and meets style criteria, treat it as a new section
-                    if heading_pattern.match(line_text) and is_bold and max_font_size >= font_threshold:
-                        # Save the previous section if it exists
-                        if current_title:
-                            extracted_data["content"].append({
-                                "section": current_title,
-                                "text": "\n".join(current_content).strip()
-                            })
-                            current_content = []
-                        current_title = line_text
-                    elif current_title:
-                        # Otherwise, if we're inside a section, add this line as content
-                        current_content.append(line_text)
-
-    # Save any remaining section before finishing
+    # Emit any remaining section before finishing
     if current_title:
-        extracted_data["content"].append({
+        yield {
             "section": current_title,
-            "text": "\n".join(current_content).strip()
-        })
+            "text": "\n".join(current_content).strip(),
+            "spans": round_spans(current_spans)
+        }
 
-    
+def extract_everything(pdf_path, ocr_pages=None, pages=None):
+    """
+    Extracts EVERYTHING from the PDF: all text, sections, subsections, numbers, tables, and structure.
 
-    return extracted_data
+    Args:
+        pdf_path: Path to the PDF file
+        ocr_pages: Optional mapping of 1-based page number to recognised paragraphs. These
+                   pages use the OCR text instead of their (missing) text layer.
+        pages: Optional 1-based page numbers to parse, all pages by default
+    """
+    # Store everything in a structured order
+    return {"content": list(iter_sections(pdf_path, ocr_pages, pages))}
 
 
 if __name__ == "__main__":
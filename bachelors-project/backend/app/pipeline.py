@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterable, Dict, List, Optional, Tuple
+
+from app.step1.llm_sections import budget_report, iter_section_results
+from app.step2.parse_sections import build_calculation_order, parse_evaluation_components, resolve_component_conflict
+from app.step2.reduce_components import reduce_components, rename_duplicate_ids
+
+# Matching sections are handed to component extraction in micro-batches of this size ...
+PIPELINE_BATCH_SIZE = int(os.environ.get("PIPELINE_BATCH_SIZE", "4"))
+
+# ... or once the oldest matching section has waited this long (seconds)
+PIPELINE_BATCH_TIMEOUT = float(os.environ.get("PIPELINE_BATCH_TIMEOUT", "2.0"))
+
+
+async def merge_components(batch_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the component extraction results of several micro-batches.
+
+    Components are merged as in map-reduce mode (see reduce_components): variants of the same
+    question with the same rule are merged, variants with differing rules are resolved by the
+    LLM, and distinct components that chose the same id are renamed.
+
+    Args:
+        batch_results: Results of parse_evaluation_components, in batch order
+
+    Returns:
+        Dictionary in the format of parse_evaluation_components
+    """
+    errors = []
+    for result in batch_results:
+        if not result.get("success"):
+            errors.append(result.get("message", "Unknown error"))
+        errors.extend(result.get("errors", []))
+
+    components, conflicts = reduce_components(
+        [{"components": result["questions"]} for result in batch_results if result.get("success")]
+    )
+    resolved = iter(await asyncio.gather(*(resolve_component_conflict(variants) for variants in conflicts)))
+    questions = [component if component is not None else next(resolved) for component in components]
+    # A resolved conflict may take the id of another question
+    rename_duplicate_ids(questions)
+
+    if not questions:
+        return {
+            "success": False,
+            "message": errors[0] if errors else "No components found in the matching sections",
+            "questions": []
+        }
+
+    merged = {
+        "success": True,
+        "questions": questions,
+        "calculationOrder": build_calculation_order(questions),
+        "reduce": {"batches": len(batch_results), "conflicts": len(conflicts)}
+    }
+    if errors:
+        merged["errors"] = errors
+    return merged
+
+
+async def run_pipelined(
+    sections: AsyncIterable[Dict[str, Any]],
+    batch_size: int = PIPELINE_BATCH_SIZE,
+    batch_timeout: float = PIPELINE_BATCH_TIMEOUT,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    map_reduce: bool = False
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Run section analysis and component extraction as a pipeline.
+
+    Matching sections flow into component extraction in micro-batches while the remaining
+    sections are still being classified, so the end-to-end latency approaches
+    max(step 1, step 2) instead of their sum. Each batch is extracted as
+    parse_evaluation_components does (template rules first, map-reduce if asked for) and
+    the batches are merged once step 1 drains.
+
+    Args:
+        sections: Async stream of parsed sections, e.g. stream_sections_with_ocr(...)
+        batch_size: Number of matching sections per component extraction call
+        batch_timeout: Maximum time a matching section waits for its batch to fill up
+        semaphore: Optional semaphore bounding the step 1 LLM calls in flight
+        map_reduce: Extract per section and merge the results within each batch
+
+    Returns:
+        The analysis results (as analyze_section_stream) and the component results
+        (as parse_evaluation_components, plus a 'pipeline' timing report)
+    """
+    start = time.perf_counter()
+    results_queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def classify():
+        try:
+            async for result in iter_section_results(sections, semaphore):
+                await results_queue.put(result)
+        finally:
+            await results_queue.put(done)
+
+    classifier = asyncio.create_task(classify())
+    extraction_tasks: List[asyncio.Task] = []
+    results: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+    batch_deadline = None
+
+    def flush():
+        nonlocal batch, batch_deadline
+        if batch:
+            # Keep document order within the batch
+            ordered = sorted(batch, key=lambda result: result["index"])
+            extraction_tasks.append(asyncio.create_task(
+                parse_evaluation_components({"matching_sections": ordered}, map_reduce)
+            ))
+        batch, batch_deadline = [], None
+
+    try:
+        while True:
+            timeout = None if batch_deadline is None else max(batch_deadline - time.monotonic(), 0)
+            try:
+                result = await asyncio.wait_for(results_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                flush()
+                continue
+
+            if result is done:
+                break
+            results.append(result)
+            if result["meets_criteria"]:
+                batch.append(result)
+                if batch_deadline is None:
+                    batch_deadline = time.monotonic() + batch_timeout
+                if len(batch) >= batch_size:
+                    flush()
+
+        # Surface errors from step 1
+        await classifier
+        step1_seconds = time.perf_counter() - start
+        flush()
+        batch_results = await asyncio.gather(*extraction_tasks)
+    finally:
+        # On cancellation or a step 1 error, stop the extractions still making LLM calls and
+        # retrieve their outcome, so failures are not reported as never retrieved
+        tasks = [classifier, *extraction_tasks]
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    results.sort(key=lambda result: result["index"])
+    results = [{key: value for key, value in result.items() if key != "index"} for result in results]
+    matching_sections = [result for result in results if result["meets_criteria"]]
+
+    if results:
+        analysis_results = {
+            "status": "success",
+            "total_sections": len(results),
+            "matching_count": len(matching_sections),
+            "all_sections": results,
+            "matching_sections": matching_sections,
+            **budget_report(results)
+        }
+    else:
+        analysis_results = {
+            "status": "error",
+            "message": "No sections found in the parsed PDF data",
+            "matching_sections": []
+        }
+
+    if matching_sections:
+        components_results = await merge_components(list(batch_results))
+    else:
+        components_results = {
+            "success": False,
+            "message": "No matching sections found in the analysis results",
+            "questions": []
+        }
+
+    total_seconds = time.perf_counter() - start
+    components_results["pipeline"] = {
+        "batches": len(extraction_tasks),
+        "step1_seconds": round(step1_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "step2_tail_seconds": round(total_seconds - step1_seconds, 3)
+    }
+    return analysis_results, components_results
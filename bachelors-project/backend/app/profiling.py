@@ -0,0 +1,275 @@
+"""
+Opt-in profiling of single requests.
+
+A request carrying the header `X-Profile: <PROFILE_TOKEN>` is profiled while it runs:
+
+- a sampling CPU profile of all threads (the event loop and the parser / LLM worker
+  threads), written in folded-stack format for flamegraph tools (cpu.folded)
+- wall time, tracemalloc peak and top allocations per pipeline stage (summary.json)
+
+The artefacts are stored under PROFILE_DIR/<profile id>; the id is returned in the
+`X-Profile-Id` response header and the artefacts can be downloaded from /profiles/<id>.
+
+Without PROFILE_TOKEN profiling is disabled. When a request is not profiled, profile_stage
+costs a single context variable lookup and the sampler and tracemalloc are not running.
+
+tracemalloc and the CPU sampler are process-wide, so requests running concurrently with a
+profiled one show up in its profile as well.
+"""
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Shared secret that trusted callers send in the X-Profile header; unset disables profiling
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "app/profiles")
+
+# Seconds between two samples of the CPU sampler
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+# Number of allocation sites reported per stage
+PROFILE_TOP_ALLOCATIONS = 10
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+
+# tracemalloc is started by the first active profile and stopped by the last one
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Whether the given header value matches the configured profiling token."""
+    if not PROFILE_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def profile_path(profile_id: str, filename: str) -> Optional[str]:
+    """Path of a stored profile artefact, or None if the id is malformed or the file does not exist."""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id, filename)
+    return path if os.path.isfile(path) else None
+
+
+class CpuSampler:
+    """
+    Samples the stacks of all threads at a fixed interval from a background thread.
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Dict[str, int] = {}
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+            self.sample_count += 1
+
+    def folded(self) -> str:
+        """The samples in folded-stack format ('frame;frame;frame count' per line)."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+
+class RequestProfile:
+    """
+    Profile of a single request: CPU samples plus timing and memory per stage.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.stages: List[Dict[str, Any]] = []
+        # Peak seen so far by every stage that is still open, since a nested stage resets it
+        self.open_stages: List[Dict[str, int]] = []
+        self.sampler = CpuSampler()
+        self.started = None
+
+    def start(self) -> None:
+        global _tracing_users
+        with _tracing_lock:
+            if _tracing_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _tracing_users += 1
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self) -> float:
+        global _tracing_users
+        self.sampler.stop()
+        with _tracing_lock:
+            _tracing_users -= 1
+            if _tracing_users == 0:
+                tracemalloc.stop()
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Record wall time, peak memory and top allocations of one pipeline stage.
+
+        Tracing is process-wide and stops with the last profiled request, while a stage may
+        outlive its request (e.g. a shared single-flight run); such stages only get the time.
+        """
+        if not tracemalloc.is_tracing():
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.stages.append({"stage": name, "seconds": round(time.perf_counter() - start, 4)})
+            return
+
+        _, peak_so_far = tracemalloc.get_traced_memory()
+        for open_stage in self.open_stages:
+            open_stage["peak"] = max(open_stage["peak"], peak_so_far)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start_current, _ = tracemalloc.get_traced_memory()
+        state = {"peak": start_current}
+        self.open_stages.append(state)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.open_stages.remove(state)
+            if not tracemalloc.is_tracing():
+                # The request finished while this stage was running
+                self.stages.append({"stage": name, "seconds": round(seconds, 4)})
+            else:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, state["peak"])
+                for open_stage in self.open_stages:
+                    open_stage["peak"] = max(open_stage["peak"], peak)
+                after = tracemalloc.take_snapshot()
+                top = after.compare_to(before, "lineno")[:PROFILE_TOP_ALLOCATIONS]
+                self.stages.append({
+                    "stage": name,
+                    "seconds": round(seconds, 4),
+                    "memory_peak_kb": round((peak - start_current) / 1024, 1),
+                    "memory_retained_kb": round((current - start_current) / 1024, 1),
+                    "top_allocations": [
+                        {
+                            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                            "size_diff_kb": round(stat.size_diff / 1024, 1),
+                            "count_diff": stat.count_diff,
+                        }
+                        for stat in top
+                    ],
+                })
+
+    def save(self, seconds: float, status_code: int) -> str:
+        """Write the artefacts to PROFILE_DIR/<profile id> and return the directory."""
+        directory = os.path.join(PROFILE_DIR, self.profile_id)
+        os.makedirs(directory, exist_ok=True)
+        summary = {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": status_code,
+            "seconds": round(seconds, 4),
+            "cpu_samples": self.sampler.sample_count,
+            "sample_interval": self.sampler.interval,
+            "stages": self.stages,
+        }
+        with open(os.path.join(directory, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        with open(os.path.join(directory, "cpu.folded"), "w", encoding="utf-8") as f:
+            f.write(self.sampler.folded())
+        return directory
+
+
+def profile_stage(name: str):
+    """
+    Context manager marking a pipeline stage of the current request.
+
+    A no-op (nullcontext) unless the current request is being profiled. Works in async code
+    and in worker threads started with asyncio.to_thread, which copy the context.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return nullcontext()
+    return profile.stage(name)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: profile the request if it carries a valid X-Profile header.
+
+    Written as plain ASGI rather than with @app.middleware("http"), which wraps the request
+    stream and hides client disconnects from the endpoints.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"x-profile")
+        if not is_authorized(header.decode("latin-1") if header else None):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"x-profile-id", profile.profile_id.encode())]
+                }
+            await send(message)
+
+        profile.start()
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current_profile.reset(token)
+            seconds = profile.stop()
+            try:
+                await asyncio.to_thread(profile.save, seconds, status_code)
+            except OSError as e:
+                logger.warning("Could not store profile %s: %s", profile.profile_id, e)
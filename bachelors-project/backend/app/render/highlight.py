@@ -0,0 +1,105 @@
+import hashlib
+import json
+from typing import List, Optional, Sequence
+
+from app.render.tile_cache import TileCache
+
+# Zoom levels are clamped to this range (1.0 = 72 dpi), low resolution by default
+DEFAULT_ZOOM = 0.5
+MIN_ZOOM = 0.25
+MAX_ZOOM = 2.0
+
+HIGHLIGHT_COLOR = (1.0, 0.85, 0.0)
+HIGHLIGHT_OPACITY = 0.35
+
+_tile_cache = None
+
+
+def get_tile_cache() -> TileCache:
+    global _tile_cache
+    if _tile_cache is None:
+        _tile_cache = TileCache()
+    return _tile_cache
+
+
+def normalize_zoom(zoom: float) -> float:
+    """Clamp and round the zoom so that nearly equal zooms share cache entries."""
+    return round(min(max(zoom, MIN_ZOOM), MAX_ZOOM), 2)
+
+
+def parse_regions(values: Sequence[str]) -> List[List[float]]:
+    """
+    Parse highlight regions given as 'x0,y0,x1,y1' (PDF points, as in the section spans).
+
+    Raises:
+        ValueError: If a region is malformed
+    """
+    regions = []
+    for value in values:
+        parts = [float(part) for part in value.split(",")]
+        if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+            raise ValueError(f"Invalid region '{value}', expected x0,y0,x1,y1")
+        regions.append([round(part, 1) for part in parts])
+    return sorted(regions)
+
+
+def render_page(pdf_path: str, page_num: int, zoom: float, regions: List[List[float]]) -> bytes:
+    """
+    Render one page as PNG with the given regions highlighted.
+
+    The highlights are drawn on the in-memory copy of the page only; the file is not changed.
+
+    Args:
+        pdf_path: Path to the PDF file
+        page_num: 1-based page number
+        zoom: Scale factor (1.0 = 72 dpi)
+        regions: Rectangles in PDF points to highlight
+
+    Returns:
+        The PNG image
+
+    Raises:
+        ValueError: If the page does not exist
+    """
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        if not 1 <= page_num <= doc.page_count:
+            raise ValueError(f"Page {page_num} does not exist, the document has {doc.page_count} pages")
+        page = doc.load_page(page_num - 1)
+        for region in regions:
+            page.draw_rect(
+                fitz.Rect(region),
+                color=None,
+                fill=HIGHLIGHT_COLOR,
+                fill_opacity=HIGHLIGHT_OPACITY,
+                overlay=True
+            )
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return pixmap.tobytes("png")
+
+
+def highlighted_page(
+    document_id: str,
+    pdf_path: str,
+    page_num: int,
+    zoom: float = DEFAULT_ZOOM,
+    regions: Optional[List[List[float]]] = None
+) -> bytes:
+    """
+    Cached render of a page with highlighted regions.
+
+    Tiles are keyed by document hash, page, zoom and the set of regions, so scrolling back
+    and forth through a document renders every page only once.
+    """
+    zoom = normalize_zoom(zoom)
+    regions = regions or []
+    regions_key = hashlib.sha1(json.dumps(regions).encode("utf-8")).hexdigest()[:16] if regions else "none"
+    key = f"{document_id}:{page_num}:{zoom}:{regions_key}"
+
+    cache = get_tile_cache()
+    image = cache.get(key)
+    if image is None:
+        image = render_page(pdf_path, page_num, zoom, regions)
+        cache.put(key, image)
+    return image
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Rendered page tiles, evicted least-recently-used first once the cache exceeds its size
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", "app/store/tiles")
+TILE_CACHE_MAX_BYTES = int(os.environ.get("TILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class TileCache:
+    """
+    On-disk LRU cache of rendered page images.
+
+    Recency is kept in memory and mirrored in the file modification times, so the order
+    survives restarts. Files are written atomically; other workers sharing the directory
+    may evict entries, which is handled as a cache miss.
+    """
+
+    def __init__(self, directory: str = TILE_CACHE_DIR, max_bytes: int = TILE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict] = None
+        self._total_bytes = 0
+
+    def _path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name[:2], f"{name}.png")
+
+    def _load_index(self) -> None:
+        # Rebuild the recency order from the modification times on first use
+        entries = []
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    if not filename.endswith(".png"):
+                        continue
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in entries)
+        self._total_bytes = sum(self._entries.values())
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        The cached image for a key, or None on a miss. A hit marks the entry as recently used.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                # Written by another worker
+                self._entries[path] = len(data)
+                self._total_bytes += len(data)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Store an image and evict the least recently used entries beyond the size limit.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            if self._entries is None:
+                self._load_index()
+            self._total_bytes += len(data) - self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_path, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                try:
+                    os.remove(evicted_path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,360 @@
+import gzip
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from app.search.swedish import tokenize
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.environ.get("SEARCH_INDEX_DIR", "app/store/search_index")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Tiered merging: once this many segments share a size tier they are merged into one
+MERGE_FACTOR = 8
+
+SNIPPET_LENGTH = 300
+
+SECTION_NUMBER_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)\s')
+
+_write_lock = threading.Lock()
+_read_lock = threading.Lock()
+_segment_cache: Dict[str, Dict[str, Any]] = {}
+_manifest_cache: Dict[str, Any] = {"mtime": None, "manifest": None}
+
+
+def manifest_path() -> str:
+    return os.path.join(INDEX_DIR, "manifest.json")
+
+
+def segment_path(name: str) -> str:
+    return os.path.join(INDEX_DIR, f"{name}.json.gz")
+
+
+def read_manifest() -> Dict[str, Any]:
+    """
+    Read the manifest listing the live segments and which segment holds each document.
+    """
+    try:
+        with open(manifest_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"next_segment": 0, "segments": [], "live": {}}
+
+
+def write_json_atomic(path: str, data: Any, compress: bool = False) -> None:
+    """Write JSON to a temporary file and rename it into place, so readers never see partial files."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    opener = gzip.open if compress else open
+    with opener(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_segment(name: str) -> Dict[str, Any]:
+    """
+    Load an immutable segment, caching it in memory for later queries.
+    """
+    with _read_lock:
+        segment = _segment_cache.get(name)
+    if segment is None:
+        with gzip.open(segment_path(name), "rt", encoding="utf-8") as f:
+            segment = json.load(f)
+        with _read_lock:
+            _segment_cache[name] = segment
+    return segment
+
+
+def build_segment(sections: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build an in-memory segment from section metadata and their terms.
+
+    Args:
+        sections: Section entries with metadata and a "terms" list
+
+    Returns:
+        Segment with document entries, their lengths and the postings per term
+    """
+    docs = []
+    postings: Dict[str, List[List[int]]] = {}
+    for index, section in enumerate(sections):
+        term_counts = Counter(section["terms"])
+        docs.append({**{k: v for k, v in section.items() if k != "terms"}, "length": len(section["terms"])})
+        for term, count in term_counts.items():
+            postings.setdefault(term, []).append([index, count])
+    return {"docs": docs, "postings": postings}
+
+
+def merge_segments(segments: List[Dict[str, Any]], names: List[str], live: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Merge segments into one, dropping documents that were re-indexed into a newer segment.
+    """
+    docs = []
+    postings: Dict[str, List[List[int]]] = {}
+    for segment, name in zip(segments, names):
+        remap = {}
+        for index, doc in enumerate(segment["docs"]):
+            if live.get(doc["doc_id"]) == name:
+                remap[index] = len(docs)
+                docs.append(doc)
+        for term, entries in segment["postings"].items():
+            kept = [[remap[index], count] for index, count in entries if index in remap]
+            if kept:
+                postings.setdefault(term, []).extend(kept)
+    return {"docs": docs, "postings": postings}
+
+
+def size_tier(doc_count: int) -> int:
+    return int(math.log(max(doc_count, 1), MERGE_FACTOR))
+
+
+class IndexLock:
+    """
+    Exclusive lock on the index directory, held across threads and worker processes.
+
+    Uses flock where available and msvcrt.locking on Windows (locking the first byte of the
+    lock file).
+    """
+
+    def __enter__(self):
+        _write_lock.acquire()
+        self.file = None
+        try:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            self.file = open(os.path.join(INDEX_DIR, "write.lock"), "w")
+            try:
+                import fcntl
+            except ImportError:
+                import msvcrt
+                while True:
+                    try:
+                        # Retries for about 10 seconds before raising
+                        msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            else:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        except BaseException:
+            if self.file is not None:
+                self.file.close()
+            _write_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+        _write_lock.release()
+
+
+def maybe_merge(manifest: Dict[str, Any]) -> None:
+    """
+    Merge segments of the same size tier once there are MERGE_FACTOR of them.
+
+    Must be called with the index lock held. Merges cascade, so the number of segments
+    stays logarithmic in the number of indexed documents.
+    """
+    while True:
+        tiers: Dict[int, List[Dict[str, Any]]] = {}
+        for entry in manifest["segments"]:
+            tiers.setdefault(size_tier(entry["doc_count"]), []).append(entry)
+        full_tier = next((entries for entries in tiers.values() if len(entries) >= MERGE_FACTOR), None)
+        if full_tier is None:
+            return
+
+        names = [entry["name"] for entry in full_tier]
+        merged = merge_segments([load_segment(name) for name in names], names, manifest["live"])
+        name = f"seg_{manifest['next_segment']:08d}"
+        manifest["next_segment"] += 1
+        write_json_atomic(segment_path(name), merged, compress=True)
+
+        for doc in merged["docs"]:
+            manifest["live"][doc["doc_id"]] = name
+        manifest["segments"] = [entry for entry in manifest["segments"] if entry["name"] not in names]
+        manifest["segments"].append({
+            "name": name,
+            "doc_count": len(merged["docs"]),
+            "total_length": sum(doc["length"] for doc in merged["docs"])
+        })
+        write_json_atomic(manifest_path(), manifest)
+
+        for old_name in names:
+            try:
+                os.remove(segment_path(old_name))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Merged {len(names)} search index segments into {name}")
+
+
+def index_document(doc_id: str, filename: str, sections: List[Dict[str, Any]]) -> int:
+    """
+    Add (or replace) all sections of one document in the on-disk index.
+
+    Each call writes one new immutable segment, then merges small segments as needed.
+    Re-indexing the same document (e.g. once verdicts are known) supersedes the old entries.
+
+    Args:
+        doc_id: Content hash of the document
+        filename: Original filename, kept for display
+        sections: Sections with 'section', 'text' or 'content' and optionally 'meets_criteria'
+
+    Returns:
+        Number of sections indexed
+    """
+    entries = []
+    for position, section in enumerate(sections):
+        title = section.get("section", "")
+        text = section.get("text", section.get("content", "")) or ""
+        number = SECTION_NUMBER_PATTERN.match(title + " ")
+        spans = section.get("spans") or [{}]
+        entries.append({
+            "doc_id": doc_id,
+            "filename": filename,
+            "position": position,
+            "section_number": number.group(1) if number else None,
+            "section": title,
+            "page": spans[0].get("page"),
+            "verdict": section.get("meets_criteria"),
+            "snippet": text[:SNIPPET_LENGTH],
+            "terms": tokenize(f"{title}\n{text}")
+        })
+    if not entries:
+        return 0
+
+    segment = build_segment(entries)
+    with IndexLock():
+        manifest = read_manifest()
+        name = f"seg_{manifest['next_segment']:08d}"
+        manifest["next_segment"] += 1
+        write_json_atomic(segment_path(name), segment, compress=True)
+
+        manifest["live"][doc_id] = name
+        manifest["segments"].append({
+            "name": name,
+            "doc_count": len(segment["docs"]),
+            "total_length": sum(doc["length"] for doc in segment["docs"])
+        })
+        write_json_atomic(manifest_path(), manifest)
+        maybe_merge(manifest)
+    return len(entries)
+
+
+def current_manifest() -> Dict[str, Any]:
+    """Return the manifest, re-reading it only when another writer has changed it."""
+    try:
+        mtime = os.stat(manifest_path()).st_mtime_ns
+    except FileNotFoundError:
+        return read_manifest()
+    with _read_lock:
+        if _manifest_cache["mtime"] == mtime:
+            return _manifest_cache["manifest"]
+    manifest = read_manifest()
+    with _read_lock:
+        _manifest_cache.update({"mtime": mtime, "manifest": manifest})
+        # Segments that were merged away can be dropped from memory
+        live_names = {entry["name"] for entry in manifest["segments"]}
+        for name in list(_segment_cache):
+            if name not in live_names:
+                del _segment_cache[name]
+    return manifest
+
+
+def search(query: str, limit: int = 10, verdict: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Rank indexed sections against a query with BM25.
+
+    Args:
+        query: Free-text query, tokenised like the indexed sections
+        limit: Maximum number of hits to return
+        verdict: If given, only return sections with this step 1 verdict
+
+    Returns:
+        Dictionary with the hits (best first), the number of searched sections and the query time
+    """
+    start = time.perf_counter()
+    manifest = current_manifest()
+    terms = list(dict.fromkeys(tokenize(query)))
+
+    doc_count = sum(entry["doc_count"] for entry in manifest["segments"])
+    total_length = sum(entry["total_length"] for entry in manifest["segments"])
+    if not terms or not doc_count:
+        return {"query": query, "total_sections": doc_count, "hits": [], "took_ms": 0.0}
+    avg_length = total_length / doc_count
+
+    try:
+        segments = [(entry["name"], load_segment(entry["name"])) for entry in manifest["segments"]]
+    except FileNotFoundError:
+        # Another worker merged segments away since the manifest was read
+        _manifest_cache["mtime"] = None
+        manifest = current_manifest()
+        segments = [(entry["name"], load_segment(entry["name"])) for entry in manifest["segments"]]
+
+    # Document frequencies are summed over all segments (superseded entries included, as in Lucene)
+    idf = {}
+    for term in terms:
+        df = sum(len(segment["postings"].get(term, ())) for _, segment in segments)
+        if df:
+            idf[term] = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+    candidates = []
+    for name, segment in segments:
+        docs = segment["docs"]
+        scores: Dict[int, float] = {}
+        for term, term_idf in idf.items():
+            for index, count in segment["postings"].get(term, ()):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * docs[index]["length"] / avg_length)
+                scores[index] = scores.get(index, 0.0) + term_idf * count * (BM25_K1 + 1) / (count + norm)
+        for index, score in scores.items():
+            doc = docs[index]
+            if manifest["live"].get(doc["doc_id"]) != name:
+                continue
+            if verdict is not None and doc["verdict"] is not verdict:
+                continue
+            candidates.append((score, doc))
+
+    top = heapq.nlargest(limit, candidates, key=lambda candidate: candidate[0])
+    return {
+        "query": query,
+        "total_sections": doc_count,
+        "hits": [
+            {**{k: v for k, v in doc.items() if k != "length"}, "score": round(score, 4)}
+            for score, doc in top
+        ],
+        "took_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+def index_file(path: str, filename: str, sections: List[Dict[str, Any]], document_id: Optional[str] = None) -> None:
+    """
+    Index the sections of an uploaded file, keyed by its content hash.
+
+    Pass the document_id if it is known; the file at the path may have been replaced by a
+    later upload in the meantime.
+
+    Meant to run as a background task after the response, so errors are logged instead of raised.
+    """
+    from app.hashing import sha256_file
+
+    try:
+        index_document(document_id or sha256_file(path), filename, sections)
+    except Exception as e:
+        logger.error(f"Failed to index {filename}: {str(e)}")
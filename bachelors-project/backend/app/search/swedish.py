@@ -0,0 +1,123 @@
+import re
+from functools import lru_cache
+from typing import List
+
+TOKEN_PATTERN = re.compile(r"[0-9a-zåäöéü]+")
+
+VOWELS = "aeiouyäåö"
+
+STOPWORDS = {
+    "alla", "allt", "att", "av", "blev", "bli", "blir", "blivit", "de", "dem", "den", "denna",
+    "deras", "dess", "dessa", "det", "detta", "dig", "din", "dina", "ditt", "du", "där", "då",
+    "efter", "ej", "eller", "en", "er", "era", "ert", "ett", "från", "för", "ha", "hade", "han",
+    "hans", "har", "henne", "hennes", "hon", "honom", "hur", "här", "i", "icke", "ingen", "inom",
+    "inte", "jag", "ju", "kan", "kunde", "man", "med", "mellan", "men", "mig", "min", "mina",
+    "mitt", "mot", "mycket", "ni", "nu", "när", "någon", "något", "några", "och", "om", "oss",
+    "på", "samma", "samt", "sedan", "sig", "sin", "sina", "sitta", "själv", "skall", "ska",
+    "skulle", "som", "så", "sådan", "sådana", "sådant", "till", "under", "upp", "ut", "utan",
+    "vad", "var", "vara", "varför", "varit", "varje", "vars", "vem", "vi", "vid", "vilka",
+    "vilkas", "vilken", "vilket", "vår", "våra", "vårt", "än", "är", "åt", "över",
+}
+
+# Suffixes removed by the stemmer, longest first (Snowball Swedish step 1)
+SUFFIXES = sorted([
+    "heterna", "hetens", "anden", "heten", "heter", "arnas", "ernas", "ornas", "andes", "arens",
+    "andet", "arna", "erna", "orna", "ande", "arne", "aste", "aren", "ades", "erns", "ade", "are",
+    "ern", "ens", "het", "ast", "ad", "en", "ar", "er", "or", "as", "es", "at", "et", "a", "e", "s",
+], key=len, reverse=True)
+
+# Letters after which a final "s" is an inflection and may be removed
+S_ENDING = set("bcdfghjklmnoprtvy")
+
+# Compound parts that are common in procurement documents. Compounds are split when
+# they consist of lexicon words, optionally joined by the linking "s" (fogemorfem),
+# e.g. "referenspoäng" -> "referens" + "poäng", "utvärderingsmodell" -> "utvärdering" + "modell".
+COMPOUND_LEXICON = [
+    "anbud", "avdrag", "avtal", "belopp", "beslut", "betyg", "bedömning", "bilaga", "certifiering",
+    "ersättning", "erfarenhet", "fråga", "grund", "jämförelse", "kapacitet", "kompetens", "konsult",
+    "kostnad", "krav", "kriterie", "kriterium", "kvalitet", "leverans", "lista", "metod", "miljö",
+    "modell", "mervärde", "nivå", "organisation", "period", "person", "poäng", "pris", "procent",
+    "prövning", "referens", "skala", "summa", "tal", "tid", "tilldelning", "tillägg", "tim",
+    "total", "uppdrag", "upphandling", "utvärdering", "villkor", "värde",
+]
+
+MIN_PART_LENGTH = 3
+
+
+def r1_start(word: str) -> int:
+    """
+    Start of the stemmer's R1 region: after the first non-vowel following a vowel, at least 3.
+    """
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return max(i + 1, 3)
+    return len(word)
+
+
+@lru_cache(maxsize=100_000)
+def stem(word: str) -> str:
+    """
+    Light Swedish stemmer that removes inflection suffixes within the R1 region.
+    """
+    r1 = r1_start(word)
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= r1:
+            if suffix == "s" and word[-2] not in S_ENDING:
+                continue
+            return word[:-len(suffix)]
+    return word
+
+
+LEXICON_STEMS = {stem(word) for word in COMPOUND_LEXICON} | set(COMPOUND_LEXICON)
+
+
+def in_lexicon(part: str) -> bool:
+    """True if the part (or the part without a linking 's') is a lexicon word."""
+    if part in LEXICON_STEMS or stem(part) in LEXICON_STEMS:
+        return True
+    return part.endswith("s") and part[:-1] in LEXICON_STEMS
+
+
+@lru_cache(maxsize=100_000)
+def split_compound(word: str) -> List[str]:
+    """
+    Split a compound into lexicon words.
+
+    Returns:
+        The stemmed parts, or an empty list if the word is not a compound of lexicon words
+    """
+    if len(word) < 2 * MIN_PART_LENGTH:
+        return []
+    for i in range(len(word) - MIN_PART_LENGTH, MIN_PART_LENGTH - 1, -1):
+        head, tail = word[:i], word[i:]
+        if not in_lexicon(head):
+            continue
+        head = head[:-1] if head not in LEXICON_STEMS and head.endswith("s") and head[:-1] in LEXICON_STEMS else head
+        if in_lexicon(tail):
+            return [stem(head), stem(tail)]
+        rest = split_compound(tail)
+        if rest:
+            return [stem(head)] + rest
+    return []
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenise Swedish text for indexing and querying.
+
+    Tokens are lower-cased, stop words are dropped and words are stemmed. Compounds
+    produce both the whole word and their parts, so "prisavdrag" matches "avdrag på priset".
+
+    Args:
+        text: The text to tokenise
+
+    Returns:
+        List of index terms in text order
+    """
+    terms = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word in STOPWORDS:
+            continue
+        terms.append(stem(word))
+        terms.extend(split_compound(word))
+    return terms
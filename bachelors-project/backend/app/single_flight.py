@@ -0,0 +1,170 @@
+"""
+Coalescing of identical concurrent requests ("single flight").
+
+When the same document is uploaded to the same endpoint (with the same options) while an
+earlier upload is still being processed, the later requests wait for the running pipeline
+instead of starting their own. Within a worker they await the same task; across workers
+(optional, set SINGLE_FLIGHT_DIR to a directory shared by the workers) they wait on a lock
+file and pick up the result the first worker leaves next to it.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Directory for the cross-worker lock and result files; unset keeps coalescing per worker
+SINGLE_FLIGHT_DIR = os.environ.get("SINGLE_FLIGHT_DIR")
+
+# Seconds between two attempts to take a lock held by another worker
+SINGLE_FLIGHT_POLL_INTERVAL = float(os.environ.get("SINGLE_FLIGHT_POLL_INTERVAL", "0.2"))
+
+# Result files older than this are removed (seconds)
+SINGLE_FLIGHT_RESULT_TTL = float(os.environ.get("SINGLE_FLIGHT_RESULT_TTL", "300"))
+
+single_flight_requests = Counter(
+    "single_flight_requests_total",
+    "Requests by whether they ran the pipeline (leader) or shared another request's result"
+)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one instance of a computation per key at a time.
+
+    The computation is shared by reference count: it is only cancelled when every request
+    waiting for it has been cancelled (e.g. all clients disconnected).
+    """
+
+    def __init__(self, directory: Optional[str] = SINGLE_FLIGHT_DIR):
+        self.directory = directory
+        self._flights: Dict[str, _Flight] = {}
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]], endpoint: str = "") -> Any:
+        """
+        Run factory() for the key, or wait for the identical computation already running.
+
+        Args:
+            key: Identifies identical requests, e.g. endpoint, content hash and options
+            factory: Creates the coroutine computing the result
+            endpoint: Endpoint name used as metrics label
+
+        Returns:
+            The result. Requests that joined a running computation get their own copy.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._lead(key, factory, endpoint)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            is_leader = True
+        else:
+            single_flight_requests.inc(endpoint=endpoint, role="follower")
+            is_leader = False
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        flight.waiters -= 1
+        return result if is_leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Retrieved by the waiters; avoids "exception was never retrieved" if all left
+            flight.task.exception()
+
+    async def _lead(self, key: str, factory: Callable[[], Awaitable[Any]], endpoint: str) -> Any:
+        if not self.directory:
+            single_flight_requests.inc(endpoint=endpoint, role="leader")
+            return await factory()
+        return await self._run_across_workers(key, factory, endpoint)
+
+    async def _run_across_workers(self, key: str, factory: Callable[[], Awaitable[Any]], endpoint: str) -> Any:
+        """
+        Take the lock file of the key; if another worker held it, use the result it stored.
+        """
+        import fcntl
+
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        lock_path = os.path.join(self.directory, f"{digest}.lock")
+        result_path = os.path.join(self.directory, f"{digest}.json")
+
+        started = time.time()
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            waited = False
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+            if waited:
+                result = read_result(result_path, newer_than=started)
+                if result is not None:
+                    single_flight_requests.inc(endpoint=endpoint, role="remote_follower")
+                    return result
+                # The other worker failed or was cancelled, run the pipeline here instead
+
+            single_flight_requests.inc(endpoint=endpoint, role="leader")
+            result = await factory()
+            await asyncio.to_thread(write_result, self.directory, result_path, result)
+            return result
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+def read_result(path: str, newer_than: float) -> Optional[Any]:
+    """A result file written after the given time, or None."""
+    try:
+        if os.path.getmtime(path) < newer_than:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_result(directory: str, path: str, result: Any) -> None:
+    """Store a result for the waiting workers and prune expired result files."""
+    try:
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, default=str)
+        os.replace(temporary_path, path)
+
+        expired = time.time() - SINGLE_FLIGHT_RESULT_TTL
+        for filename in os.listdir(directory):
+            if filename.endswith(".json"):
+                result_file = os.path.join(directory, filename)
+                if os.path.getmtime(result_file) < expired:
+                    os.remove(result_file)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not store single-flight result: {str(e)}")
+
+
+single_flight = SingleFlight()
@@ -1,11 +1,16 @@
-from google import generativeai as genai
 import asyncio
-from typing import List, Dict, Any
+import json
 import os
-from dotenv import load_dotenv
+import re
+from typing import List, Dict, Any, Optional, AsyncIterable, AsyncIterator, Tuple
+from app.llm import DEFAULT_MODEL, generate_content, get_api_key
+from app.metrics import Counter
+from app.step1.section_tree import build_section_tree, iter_subtree
+from app.step1.verdict_cache import get_verdict, put_verdict, verdict_key
+from app.token_budget import TokenBudgetExceeded, document_tokens
 
-
-load_dotenv()
+# Maximum number of section classifications in flight at once
+SECTION_MAX_CONCURRENCY = int(os.environ.get("SECTION_MAX_CONCURRENCY", "16"))
 
 SECTION_ANALYSIS_CRITERIA = """
 Evaluera om texten innehåller något av följande:
@@ -32,6 +37,178 @@ Du ska endast analysera om texten innehåller information om poäng, kriterier,
 Svara med YES om det finns något i texten som uppfyller kriterierna, och NO om det inte finns.
 """
 
+# The criteria terms above as plain keywords, e.g. "tilldelningskriterie"
+CRITERIA_TERMS = list(dict.fromkeys(
+    line[2:].replace("(r)", "").strip()
+    for line in SECTION_ANALYSIS_CRITERIA.splitlines()
+    if line.startswith("- ")
+))
+
+# Two-tier classification (CASCADE=1): a cheap first tier answers with a JSON verdict and a
+# confidence, only sections it is unsure about are classified again by the second tier
+CASCADE_FIRST_MODEL = os.environ.get("CASCADE_FIRST_MODEL", "gemini-2.0-flash-lite-001")
+CASCADE_SECOND_MODEL = os.environ.get("CASCADE_SECOND_MODEL", DEFAULT_MODEL)
+CASCADE_CONFIDENCE_THRESHOLD = float(os.environ.get("CASCADE_CONFIDENCE_THRESHOLD", "0.8"))
+
+# The first tier only sees the beginning of long sections
+CASCADE_EXCERPT_LENGTH = int(os.environ.get("CASCADE_EXCERPT_LENGTH", "2000"))
+
+CASCADE_VERDICT_PROMPT = """
+Svara endast med JSON på formatet {"verdict": "YES" eller "NO", "confidence": <tal mellan 0 och 1>},
+där confidence anger hur säker du är på bedömningen.
+"""
+
+section_cascade = Counter("section_cascade_total", "Cascaded section classifications by the tier that decided them")
+
+# Answers accepted as a verdict, in JSON or as the first word of a free-text reply
+VERDICT_WORDS = {"yes": True, "ja": True, "true": True, "no": False, "nej": False, "false": False}
+
+def cascade_enabled() -> bool:
+    """Whether sections are classified by the two-tier cascade (set CASCADE=1 to enable)."""
+    return os.environ.get("CASCADE", "0").lower() in ("1", "true", "yes")
+
+def classifier_name() -> str:
+    """The model (or cascade configuration) behind a verdict, part of the verdict cache key."""
+    if cascade_enabled():
+        return f"cascade:{CASCADE_FIRST_MODEL}>{CASCADE_SECOND_MODEL}@{CASCADE_CONFIDENCE_THRESHOLD}"
+    return DEFAULT_MODEL
+
+def parse_verdict(response_text: str) -> Tuple[Optional[bool], float]:
+    """
+    Read the verdict of a classification reply, either a JSON object with 'verdict' and
+    'confidence' or a free-text reply starting with YES/NO.
+
+    Returns:
+        Whether the section meets the criteria (None if the reply is unreadable) and the
+        confidence between 0 and 1
+    """
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if json_match:
+        try:
+            parsed = json.loads(json_match.group(0))
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, dict):
+            verdict = VERDICT_WORDS.get(str(parsed.get("verdict", "")).strip().lower())
+            if verdict is None:
+                return None, 0.0
+            try:
+                confidence = float(parsed.get("confidence", 0.5))
+            except (TypeError, ValueError):
+                confidence = 0.0
+            return verdict, min(max(confidence, 0.0), 1.0)
+
+    words = re.findall(r'[a-zåäö]+', response_text.lower())
+    if words and words[0] in VERDICT_WORDS:
+        return VERDICT_WORDS[words[0]], 1.0
+    # A verdict somewhere in the reply counts only if it is unambiguous
+    found = {VERDICT_WORDS[word] for word in words if word in VERDICT_WORDS}
+    if len(found) == 1:
+        return found.pop(), 0.5
+    return None, 0.0
+
+CHAPTER_ANALYSIS_PROMPT = """
+Du får rubriken på ett kapitel i ett upphandlingsdokument, början av kapitlets egen text och rubrikerna på alla dess underavsnitt.
+Avgör om något avsnitt i kapitlet kan innehålla information enligt kriterierna.
+
+Svara med exakt ett ord: YES om kapitlet sannolikt innehåller sådan information, NO om inget avsnitt i kapitlet kan innehålla det, och UNSURE om det inte går att avgöra utifrån rubrikerna.
+"""
+
+# Characters of a chapter's own text included in the chapter prompt
+CHAPTER_EXCERPT_LENGTH = 600
+
+# Subtrees with fewer sections than this are classified section by section, a chapter
+# call would not save anything
+MIN_PRUNABLE_SUBTREE = 3
+
+# In conservative mode UNSURE chapters are expanded and chapters whose text mentions a
+# criteria term are never pruned
+HIERARCHY_CONSERVATIVE = os.environ.get("HIERARCHY_CONSERVATIVE", "1").lower() not in ("0", "false", "no")
+
+def section_metadata(section: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extra parser fields of a section (e.g. 'document') that are carried through to the results.
+    """
+    return {key: value for key, value in section.items() if key not in ("section", "text")}
+
+async def ask_section_verdict(
+    section: Dict[str, Any],
+    model_name: str = DEFAULT_MODEL,
+    first_tier: bool = False
+) -> Tuple[Optional[bool], float, str]:
+    """
+    Ask one model whether a section meets the criteria.
+
+    Args:
+        section: Dictionary containing 'section' (title) and 'text' (content)
+        model_name: The model to ask
+        first_tier: Use the cheap cascade prompt (excerpt, short JSON answer) instead of the full one
+
+    Returns:
+        The verdict and confidence (see parse_verdict) and the raw response
+    """
+    system_prompt = "Språk: Svenska. Du är en expert dokumentanalysator. Utvärdera om följande dokumentavsnitt uppfyller något av kriterierna."
+    if first_tier:
+        generation_config = {
+            "temperature": 0.0,
+            "max_output_tokens": 32,
+            "response_mime_type": "application/json",
+        }
+        user_message = (
+            f"Kriterier: {SECTION_ANALYSIS_CRITERIA}\n{CASCADE_VERDICT_PROMPT}\n"
+            f"Avsnitt: {section['section']}\n\nInnehåll: {section['text'][:CASCADE_EXCERPT_LENGTH]}"
+        )
+    else:
+        generation_config = {
+            "temperature": 0.2,
+            "top_p": 0.95,
+            "max_output_tokens": 1024,
+        }
+        user_message = f"Kriterier: {SECTION_ANALYSIS_CRITERIA}\n\nAvsnitt: {section['section']}\n\nInnehåll: {section['text']}"
+
+    # Send the message directly without starting a chat
+    response_text = await generate_content(
+        f"{system_prompt}\n\n{user_message}",
+        generation_config,
+        model_name
+    )
+    meets_criteria, confidence = parse_verdict(response_text)
+    return meets_criteria, confidence, response_text
+
+async def classify_section(section: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """
+    Ask the LLM whether a section meets the criteria and cache the verdict, unless the
+    answer could not be parsed.
+
+    With CASCADE=1 the cheap first tier decides when it is confident enough, otherwise the
+    section escalates to the second tier with the full prompt.
+    
+    Returns:
+        Dictionary with 'meets_criteria' and 'analysis' (the raw response), and for cascaded
+        classifications the deciding 'tier' and its 'confidence'
+    """
+    if cascade_enabled():
+        meets_criteria, confidence, response_text = await ask_section_verdict(section, CASCADE_FIRST_MODEL, first_tier=True)
+        tier = 1
+        if meets_criteria is None or confidence < CASCADE_CONFIDENCE_THRESHOLD:
+            meets_criteria, confidence, response_text = await ask_section_verdict(section, CASCADE_SECOND_MODEL)
+            tier = 2
+        section_cascade.inc(tier=str(tier))
+        verdict = {
+            "meets_criteria": bool(meets_criteria),
+            "analysis": response_text,
+            "tier": tier,
+            "confidence": confidence
+        }
+    else:
+        meets_criteria, _, response_text = await ask_section_verdict(section)
+        verdict = {"meets_criteria": bool(meets_criteria), "analysis": response_text}
+
+    # An answer without a verdict counts as not meeting the criteria, but is asked again next time
+    if meets_criteria is not None:
+        await asyncio.to_thread(put_verdict, key, verdict)
+    return verdict
+
 async def process_pdf_section(section: Dict[str, str]) -> Dict[str, Any]:
     """
     Process a single PDF section with the LLM and check if it meets criteria.
@@ -44,65 +221,86 @@ async def process_pdf_section(section: Dict[str, str]) -> Dict[str, Any]:
     """
     try:
         # Get API key from environment
-        api_key = os.environ.get("GOOGLE_API_KEY")
+        api_key = get_api_key()
         if not api_key:
             return {
                 "section": section["section"],
                 "content": section["text"],
                 "meets_criteria": False,
-                "analysis": "Error: GOOGLE_API_KEY environment variable not set. Make sure to add it to your .env file and install python-dotenv."
+                "analysis": "Error: GOOGLE_API_KEY environment variable not set. Make sure to add it to your .env file and install python-dotenv.",
+                **section_metadata(section)
             }
-            
-        # Configure the API with the key
-        genai.configure(api_key=api_key)
-        
-        # Set up the model
-        generation_config = {
-            "temperature": 0.2,
-            "top_p": 0.95,
-            "max_output_tokens": 1024,
-        }
-        
-        # Create the model
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-001", 
-            generation_config=generation_config
-        )
-        
-        system_prompt = "Språk: Svenska. Du är en expert dokumentanalysator. Utvärdera om följande dokumentavsnitt uppfyller något av kriterierna."
-        user_message = f"Kriterier: {SECTION_ANALYSIS_CRITERIA}\n\nAvsnitt: {section['section']}\n\nInnehåll: {section['text']}"
-        
-        # Send the message directly without starting a chat
-        response = await asyncio.to_thread(
-            model.generate_content,
-            f"{system_prompt}\n\n{user_message}"
-        )
         
-        response_text = response.text
-        
-        # Check if criteria is met
-        meets_criteria = "yes" in response_text.lower() or "true" in response_text.lower()
+        # Sections classified before (e.g. by a request that was cancelled) are not sent again
+        key = verdict_key(classifier_name(), SECTION_ANALYSIS_CRITERIA, section["section"], section["text"])
+        verdict = await asyncio.to_thread(get_verdict, key)
+        if verdict is None:
+            # Once the call is made, let it finish and cache its verdict even if the request
+            # is cancelled meanwhile, since the quota is spent either way. Sections of a
+            # bundle are also booked on the token budget of their own document.
+            with document_tokens(section.get("document")):
+                call = asyncio.ensure_future(classify_section(section, key))
+            call.add_done_callback(lambda task: task.cancelled() or task.exception())
+            verdict = await asyncio.shield(call)
         
         return {
             "section": section["section"],
             "content": section["text"],
-            "meets_criteria": meets_criteria,
-            "analysis": response_text
+            "meets_criteria": verdict["meets_criteria"],
+            "analysis": verdict["analysis"],
+            **{field: verdict[field] for field in ("tier", "confidence") if field in verdict},
+            **section_metadata(section)
+        }
+    except TokenBudgetExceeded as e:
+        # Not classified; the analysis is returned as partial
+        return {
+            "section": section["section"],
+            "content": section["text"],
+            "meets_criteria": False,
+            "analysis": f"Skipped: {str(e)}",
+            "skipped": True,
+            **section_metadata(section)
         }
     except Exception as e:
         return {
             "section": section["section"],
             "content": section["text"],
             "meets_criteria": False,
-            "analysis": f"Error: {str(e)}"
+            "analysis": f"Error: {str(e)}",
+            **section_metadata(section)
         }
 
-async def process_pdf_sections(parsed_pdf_data: Dict[str, Any]) -> Dict[str, Any]:
+def failed_sections(analysis_results: Dict[str, Any]) -> List[str]:
+    """
+    Titles of the sections whose classification failed (e.g. an LLM error); their verdict
+    is unknown, so results built on the analysis are incomplete.
+    """
+    return [
+        result["section"] for result in analysis_results.get("all_sections", [])
+        if str(result.get("analysis", "")).startswith("Error:")
+    ]
+
+def budget_report(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Marks analysis results as partial when sections were skipped because a token budget
+    was exhausted.
+    """
+    skipped = sum(1 for result in results if result.get("skipped"))
+    if not skipped:
+        return {}
+    return {"partial": True, "skipped_sections": skipped}
+
+async def process_pdf_sections(
+    parsed_pdf_data: Dict[str, Any],
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Dict[str, Any]:
     """
     Process PDF sections in parallel and extract those that meet criteria.
     
     Args:
         parsed_pdf_data: The output from pdfParser containing sections
+        semaphore: Optional semaphore bounding the LLM calls in flight. Pass the same
+                   semaphore to several calls to share one budget between them.
         
     Returns:
         Dictionary with all sections and matching sections that meet criteria
@@ -116,8 +314,15 @@ async def process_pdf_sections(parsed_pdf_data: Dict[str, Any]) -> Dict[str, Any
             "matching_sections": []
         }
     
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(SECTION_MAX_CONCURRENCY)
+
+    async def process_bounded(section):
+        async with semaphore:
+            return await process_pdf_section(section)
+
     # Create tasks for processing each section in parallel
-    tasks = [process_pdf_section(section) for section in sections]
+    tasks = [process_bounded(section) for section in sections]
     results = await asyncio.gather(*tasks)
     
     # Filter sections that meet criteria
@@ -128,24 +333,263 @@ async def process_pdf_sections(parsed_pdf_data: Dict[str, Any]) -> Dict[str, Any
         "total_sections": len(sections),
         "matching_count": len(matching_sections),
         "all_sections": results,
-        "matching_sections": matching_sections
+        "matching_sections": matching_sections,
+        **budget_report(results)
     }
 
-async def analyze_pdf_sections(parsed_pdf_data: Dict[str, Any]) -> Dict[str, Any]:
+async def iter_section_results(
+    sections: AsyncIterable[Dict[str, Any]],
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Classify sections while they are still being parsed.
+
+    A new section is only pulled from the stream once a slot in the semaphore is free, so a
+    slow LLM holds back the parser instead of sections piling up in memory.
+
+    Args:
+        sections: Async stream of parsed sections, e.g. stream_sections_with_ocr(...)
+        semaphore: Optional semaphore bounding the LLM calls in flight
+
+    Yields:
+        Results as returned by process_pdf_section, with an 'index' giving the section's
+        position in the document, in order of completion
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(SECTION_MAX_CONCURRENCY)
+
+    async def process_indexed(index, section):
+        try:
+            result = await process_pdf_section(section)
+        finally:
+            semaphore.release()
+        return {"index": index, **result}
+
+    pending = set()
+    try:
+        index = 0
+        async for section in sections:
+            await semaphore.acquire()
+            pending.add(asyncio.create_task(process_indexed(index, section)))
+            index += 1
+
+            # Hand out whatever finished in the meantime
+            finished = {task for task in pending if task.done()}
+            pending -= finished
+            for task in finished:
+                yield task.result()
+
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def analyze_section_stream(
+    sections: AsyncIterable[Dict[str, Any]],
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Dict[str, Any]:
+    """
+    Streaming counterpart of analyze_pdf_sections: classification starts on the first
+    section instead of after the whole document has been parsed.
+    
+    Args:
+        sections: Async stream of parsed sections, e.g. stream_sections_with_ocr(...)
+        semaphore: Optional semaphore bounding the LLM calls in flight
+        
+    Returns:
+        Analysis results in the same format as analyze_pdf_sections
+    """
+    try:
+        results = [result async for result in iter_section_results(sections, semaphore)]
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error processing PDF sections: {str(e)}",
+            "matching_sections": []
+        }
+
+    if not results:
+        return {
+            "status": "error",
+            "message": "No sections found in the parsed PDF data",
+            "matching_sections": []
+        }
+
+    # Restore document order
+    results.sort(key=lambda result: result["index"])
+    results = [{key: value for key, value in result.items() if key != "index"} for result in results]
+    matching_sections = [result for result in results if result["meets_criteria"]]
+
+    return {
+        "status": "success",
+        "total_sections": len(results),
+        "matching_count": len(matching_sections),
+        "all_sections": results,
+        "matching_sections": matching_sections,
+        **budget_report(results)
+    }
+
+async def analyze_pdf_sections(
+    parsed_pdf_data: Dict[str, Any],
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Dict[str, Any]:
     """
     Main entry point to analyze PDF sections from parser output.
     
     Args:
         parsed_pdf_data: The output from pdfParser
+        semaphore: Optional semaphore bounding the LLM calls in flight
         
     Returns:
         Analysis results with matching sections
     """
     try:
-        return await process_pdf_sections(parsed_pdf_data)
+        return await process_pdf_sections(parsed_pdf_data, semaphore)
     except Exception as e:
         return {
             "status": "error",
             "message": f"Error processing PDF sections: {str(e)}",
             "matching_sections": []
         }
+
+def mentions_criteria(node: Dict[str, Any]) -> bool:
+    """True if any section in the subtree mentions one of the criteria terms."""
+    for descendant in iter_subtree(node):
+        text = f"{descendant['section']['section']}\n{descendant['section']['text']}".lower()
+        if any(term in text for term in CRITERIA_TERMS):
+            return True
+    return False
+
+async def classify_chapter(node: Dict[str, Any]) -> str:
+    """
+    Ask the LLM whether a chapter as a whole can contain relevant information.
+
+    Returns:
+        "YES", "NO" or "UNSURE" (also on errors, so that nothing is pruned by mistake)
+    """
+    try:
+        if not get_api_key():
+            return "UNSURE"
+
+        section = node["section"]
+        child_titles = "\n".join(
+            f"- {descendant['section']['section']}"
+            for descendant in iter_subtree(node) if descendant is not node
+        )
+        prompt = (
+            "Språk: Svenska. Du är en expert dokumentanalysator.\n\n"
+            f"Kriterier: {SECTION_ANALYSIS_CRITERIA}\n{CHAPTER_ANALYSIS_PROMPT}\n"
+            f"Kapitel: {section['section']}\n\n"
+            f"Början av kapitlet: {section['text'][:CHAPTER_EXCERPT_LENGTH]}\n\n"
+            f"Underavsnitt:\n{child_titles}"
+        )
+        response_text = await generate_content(prompt, {
+            "temperature": 0.0,
+            "max_output_tokens": 8,
+        })
+        verdict = response_text.strip().upper()
+        if verdict.startswith("YES"):
+            return "YES"
+        if verdict.startswith("NO"):
+            return "NO"
+        return "UNSURE"
+    except Exception:
+        return "UNSURE"
+
+async def analyze_pdf_sections_hierarchical(
+    parsed_pdf_data: Dict[str, Any],
+    conservative: Optional[bool] = None,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Dict[str, Any]:
+    """
+    Analyze PDF sections top-down along the section numbering.
+
+    Chapters are judged first and only the sub-points of chapters that are relevant (or,
+    in conservative mode, uncertain) are classified. The sections of a pruned chapter are
+    reported as not meeting the criteria without an LLM call each.
+
+    Args:
+        parsed_pdf_data: The output from pdfParser
+        conservative: Expand UNSURE chapters and never prune chapters that mention a
+                      criteria term. Defaults to HIERARCHY_CONSERVATIVE.
+        semaphore: Optional semaphore bounding the LLM calls in flight
+
+    Returns:
+        Analysis results in the same format as analyze_pdf_sections, plus a 'hierarchy'
+        report with the number of LLM calls made and saved
+    """
+    sections = parsed_pdf_data.get("subsections", {}).get("content", [])
+    if not sections:
+        return {
+            "status": "error",
+            "message": "No sections found in the parsed PDF data",
+            "matching_sections": []
+        }
+
+    if conservative is None:
+        conservative = HIERARCHY_CONSERVATIVE
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(SECTION_MAX_CONCURRENCY)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(sections)
+    stats = {"llm_calls": 0, "chapter_calls": 0, "pruned_sections": 0}
+
+    async def call(coroutine_function, *args):
+        async with semaphore:
+            stats["llm_calls"] += 1
+            return await coroutine_function(*args)
+
+    async def classify_own(node):
+        results[node["index"]] = await call(process_pdf_section, node["section"])
+
+    async def visit(node):
+        subtree = list(iter_subtree(node))
+        if len(subtree) >= MIN_PRUNABLE_SUBTREE:
+            stats["chapter_calls"] += 1
+            verdict = await call(classify_chapter, node)
+            expand = verdict == "YES" or (conservative and (verdict == "UNSURE" or mentions_criteria(node)))
+            if not expand:
+                for descendant in subtree:
+                    section = descendant["section"]
+                    results[descendant["index"]] = {
+                        "section": section["section"],
+                        "content": section["text"],
+                        "meets_criteria": False,
+                        "analysis": f"Pruned: chapter '{node['section']['section']}' judged irrelevant ({verdict})",
+                        **section_metadata(section)
+                    }
+                stats["pruned_sections"] += len(subtree)
+                return
+
+        await asyncio.gather(classify_own(node), *(visit(child) for child in node["children"]))
+
+    try:
+        await asyncio.gather(*(visit(root) for root in build_section_tree(sections)))
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Error processing PDF sections: {str(e)}",
+            "matching_sections": []
+        }
+
+    matching_sections = [result for result in results if result["meets_criteria"]]
+
+    return {
+        "status": "success",
+        "total_sections": len(sections),
+        "matching_count": len(matching_sections),
+        "all_sections": results,
+        "matching_sections": matching_sections,
+        **budget_report(results),
+        "hierarchy": {
+            "mode": "conservative" if conservative else "aggressive",
+            "llm_calls": stats["llm_calls"],
+            "chapter_calls": stats["chapter_calls"],
+            "flat_calls": len(sections),
+            "calls_saved": len(sections) - stats["llm_calls"],
+            "pruned_sections": stats["pruned_sections"]
+        }
+    }
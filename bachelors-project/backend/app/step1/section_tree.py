@@ -0,0 +1,54 @@
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+# Same numbering as the headings recognised by extract_everything: "1", "1.5", "1.5.1", ...
+SECTION_NUMBER_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)\s')
+
+
+def section_number(title: str) -> Optional[str]:
+    """
+    The heading number of a section title, e.g. '4.3.2' for '4.3.2 Leveransvillkor'.
+    """
+    match = SECTION_NUMBER_PATTERN.match(title + " ")
+    return match.group(1) if match else None
+
+
+def build_section_tree(sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Build a section tree from the heading numbers of a flat section list.
+
+    A section is placed under the closest preceding section whose number is a prefix of its
+    own ('4.3.2.1' under '4.3.2', or under '4.3' if there is no '4.3.2'). Unnumbered sections
+    and sections without a parent become roots.
+
+    Args:
+        sections: Parsed sections with 'section' (title) and 'text', in document order
+
+    Returns:
+        List of root nodes. Each node has 'index' (position in the flat list), 'number',
+        'section' (the parsed section) and 'children'.
+    """
+    roots = []
+    by_number: Dict[str, Dict[str, Any]] = {}
+    for index, section in enumerate(sections):
+        number = section_number(section["section"])
+        node = {"index": index, "number": number, "section": section, "children": []}
+
+        parent = None
+        if number:
+            parts = number.split(".")
+            for depth in range(len(parts) - 1, 0, -1):
+                parent = by_number.get(".".join(parts[:depth]))
+                if parent:
+                    break
+            by_number[number] = node
+
+        (parent["children"] if parent else roots).append(node)
+    return roots
+
+
+def iter_subtree(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yields a node and all of its descendants in document order."""
+    yield node
+    for child in node["children"]:
+        yield from iter_subtree(child)
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Step 1 verdicts by section content, so a retried or re-uploaded document only sends the
+# sections to the LLM that were not classified before
+VERDICT_CACHE_DIR = os.environ.get("VERDICT_CACHE_DIR", "app/store/verdicts")
+
+# Days a verdict is kept after it was last used; older ones count as misses and are removed
+# by prune_verdicts (at startup, or run python -m app.step1.verdict_cache)
+VERDICT_CACHE_MAX_AGE_DAYS = float(os.environ.get("VERDICT_CACHE_MAX_AGE_DAYS", "30"))
+
+verdict_cache_lookups = Counter("verdict_cache_lookups_total", "Step 1 verdict cache lookups by result")
+
+
+def verdict_cache_enabled() -> bool:
+    """Whether step 1 verdicts are cached (set VERDICT_CACHE=0 to disable)."""
+    return os.environ.get("VERDICT_CACHE", "1").lower() not in ("0", "false", "no")
+
+
+def verdict_key(model_name: str, criteria: str, title: str, text: str) -> str:
+    """Cache key of a verdict: everything that goes into the prompt, plus the model."""
+    payload = json.dumps([model_name, criteria, title, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path(key: str) -> str:
+    return os.path.join(VERDICT_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def get_verdict(key: str) -> Optional[Dict[str, Any]]:
+    """
+    The cached verdict for a key ('meets_criteria' and 'analysis'), or None. A hit counts as
+    a use for the age limit. Blocking, run it in a worker thread.
+    """
+    if not verdict_cache_enabled():
+        return None
+    path = _path(key)
+    try:
+        if time.time() - os.stat(path).st_mtime > VERDICT_CACHE_MAX_AGE_DAYS * 86400:
+            raise FileNotFoundError(path)
+        with open(path, "r", encoding="utf-8") as f:
+            verdict = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        verdict_cache_lookups.inc(result="miss")
+        return None
+    verdict_cache_lookups.inc(result="hit")
+    return verdict
+
+
+def put_verdict(key: str, verdict: Dict[str, Any]) -> None:
+    """
+    Store a verdict. Failures are logged, the cache is only an optimisation. Blocking, run it
+    in a worker thread.
+    """
+    if not verdict_cache_enabled():
+        return
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per write: identical sections (e.g. boilerplate) store the same key at once
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=os.path.dirname(path), suffix=".tmp", delete=False
+        ) as f:
+            json.dump(verdict, f, ensure_ascii=False)
+        os.replace(f.name, path)
+    except OSError as e:
+        logger.warning(f"Could not cache verdict {key}: {str(e)}")
+
+
+def prune_verdicts(max_age_days: float = VERDICT_CACHE_MAX_AGE_DAYS) -> int:
+    """
+    Remove the verdicts not used for max_age_days, and leftover temporary files. Blocking,
+    run it in a worker thread.
+
+    Returns:
+        Number of removed files
+    """
+    if not os.path.isdir(VERDICT_CACHE_DIR):
+        return 0
+    now = time.time()
+    removed = 0
+    for root, _, files in os.walk(VERDICT_CACHE_DIR):
+        for filename in files:
+            path = os.path.join(root, filename)
+            # Temporary files younger than an hour may still be written
+            max_age = 3600 if filename.endswith(".tmp") else max_age_days * 86400
+            try:
+                if now - os.stat(path).st_mtime > max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    if removed:
+        logger.info(f"Pruned {removed} cached verdicts from {VERDICT_CACHE_DIR}")
+    return removed
+
+
+if __name__ == "__main__":
+    print(f"Removed {prune_verdicts()} files")
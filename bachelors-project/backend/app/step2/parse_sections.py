@@ -1,11 +1,16 @@
-from google import generativeai as genai
 import asyncio
 import os
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Optional
+from app.llm import generate_content, get_api_key
+from app.step2.reduce_components import reduce_components, rename_duplicate_ids, same_question
+from app.step2.rule_extractor import extract_components_with_rules
 
+# Maximum number of per-section component extraction calls in flight (map-reduce mode)
+COMPONENT_MAX_CONCURRENCY = int(os.environ.get("COMPONENT_MAX_CONCURRENCY", "8"))
 
-load_dotenv()
+def rule_extraction_enabled() -> bool:
+    """Whether the template rules run before the LLM (set RULE_EXTRACTION=0 to disable)."""
+    return os.environ.get("RULE_EXTRACTION", "1").lower() not in ("0", "false", "no")
 
 COMPONENT_CLASSIFICATION_PROMPT = """
 Analysera texten och identifiera vilka komponenter som bäst passar för att representera informationen i utvärderingsmodellen.
@@ -93,6 +98,27 @@ För ja/nej-frågor:
 Svara med exakt JSON-format för alla komponenter du hittar i texten. Om flera komponenter identifieras, lägg dem i en array. Utelämna allt annat i ditt svar.
 """
 
+def build_calculation_order(components: List[Dict[str, Any]]) -> List[str]:
+    """
+    Generate a simple calculationOrder (order of questions based on their type).
+    
+    Args:
+        components: The extracted components
+        
+    Returns:
+        Component ids with the base components first
+    """
+    calculation_order = []
+    # Always put base components first
+    for component in components:
+        if component.get("evaluation", {}).get("operation") == "base":
+            calculation_order.append(component["id"])
+    # Then add the rest
+    for component in components:
+        if component["id"] not in calculation_order:
+            calculation_order.append(component["id"])
+    return calculation_order
+
 async def process_section_for_components(section: Dict[str, Any]) -> Dict[str, Any]:
     """
     Process a single matching section with the LLM to identify evaluation components.
@@ -105,15 +131,12 @@ async def process_section_for_components(section: Dict[str, Any]) -> Dict[str, A
     """
     try:
         # Get API key from environment
-        api_key = os.environ.get("GOOGLE_API_KEY")
+        api_key = get_api_key()
         if not api_key:
             return {
                 "section": section["section"],
                 "error": "GOOGLE_API_KEY environment variable not set"
             }
-            
-        # Configure the API with the key
-        genai.configure(api_key=api_key)
         
         # Set up the model
         generation_config = {
@@ -122,23 +145,15 @@ async def process_section_for_components(section: Dict[str, Any]) -> Dict[str, A
             "max_output_tokens": 2048,
         }
         
-        # Create the model
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-001", 
-            generation_config=generation_config
-        )
-        
         system_prompt = "Du är en expert på att analysera utvärderingsmodeller i offentliga upphandlingar och omvandla dem till interaktiva komponenter."
         user_message = f"Här är texten från ett avsnitt i en utvärderingsmodell:\n\nAvsnitt: {section['section']}\n\nInnehåll: {section['content']}\n\n{COMPONENT_CLASSIFICATION_PROMPT}"
         
         # Send the message directly without starting a chat
-        response = await asyncio.to_thread(
-            model.generate_content,
-            f"{system_prompt}\n\n{user_message}"
+        response_text = await generate_content(
+            f"{system_prompt}\n\n{user_message}",
+            generation_config
         )
         
-        response_text = response.text
-        
         # Clean up response - try to extract just the JSON part
         import json
         import re
@@ -197,16 +212,13 @@ async def parse_matching_sections(analysis_results: Dict[str, Any]) -> Dict[str,
     
     try:
         # Get API key from environment
-        api_key = os.environ.get("GOOGLE_API_KEY")
+        api_key = get_api_key()
         if not api_key:
             return {
                 "success": False,
                 "message": "GOOGLE_API_KEY environment variable not set",
                 "questions": []
             }
-            
-        # Configure the API with the key
-        genai.configure(api_key=api_key)
         
         # Set up the model
         generation_config = {
@@ -215,12 +227,6 @@ async def parse_matching_sections(analysis_results: Dict[str, Any]) -> Dict[str,
             "max_output_tokens": 2048,
         }
         
-        # Create the model
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-001", 
-            generation_config=generation_config
-        )
-        
         # Combine all section content into a single text
         combined_sections = ""
         for section in matching_sections:
@@ -230,13 +236,11 @@ async def parse_matching_sections(analysis_results: Dict[str, Any]) -> Dict[str,
         user_message = f"Här är texten från alla relevanta avsnitt i en utvärderingsmodell:\n{combined_sections}\n\n{COMPONENT_CLASSIFICATION_PROMPT}\n\nViktigt: Identifiera varje unikt komponent ENDAST EN GÅNG, även om samma information förekommer i flera avsnitt."
         
         # Send the message directly without starting a chat
-        response = await asyncio.to_thread(
-            model.generate_content,
-            f"{system_prompt}\n\n{user_message}"
+        response_text = await generate_content(
+            f"{system_prompt}\n\n{user_message}",
+            generation_config
         )
         
-        response_text = response.text
-        
         # Clean up response - try to extract just the JSON part
         import json
         import re
@@ -252,21 +256,10 @@ async def parse_matching_sections(analysis_results: Dict[str, Any]) -> Dict[str,
                 if not isinstance(components, list):
                     components = [components]
                 
-                # Generate a simple calculationOrder (order of questions based on their type)
-                calculation_order = []
-                # Always put base components first
-                for component in components:
-                    if component.get("evaluation", {}).get("operation") == "base":
-                        calculation_order.append(component["id"])
-                # Then add the rest
-                for component in components:
-                    if component["id"] not in calculation_order:
-                        calculation_order.append(component["id"])
-                
                 return {
                     "success": True,
                     "questions": components,
-                    "calculationOrder": calculation_order
+                    "calculationOrder": build_calculation_order(components)
                 }
             except json.JSONDecodeError:
                 return {
@@ -290,17 +283,223 @@ async def parse_matching_sections(analysis_results: Dict[str, Any]) -> Dict[str,
             "questions": []
         }
 
-async def parse_evaluation_components(analysis_results: Dict[str, Any]) -> Dict[str, Any]:
+async def resolve_component_conflict(variants: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Ask the LLM to merge variants of the same component that disagree on the evaluation rule.
+    
+    Args:
+        variants: The conflicting variants, in document order
+        
+    Returns:
+        The merged component, or the first variant if the LLM response is unusable
+    """
+    import json
+    import re
+
+    generation_config = {
+        "temperature": 0.2,
+        "top_p": 0.95,
+        "max_output_tokens": 1024,
+    }
+    
+    system_prompt = "Du är en expert på att analysera utvärderingsmodeller i offentliga upphandlingar och omvandla dem till interaktiva komponenter."
+    user_message = (
+        "Följande komponenter har extraherats ur olika avsnitt av samma utvärderingsmodell och beskriver "
+        "samma fråga, men med olika utvärdering. Slå ihop dem till EN komponent med korrekt utvärdering, "
+        "i samma JSON-format. Svara endast med JSON-objektet.\n\n"
+        + json.dumps(variants, ensure_ascii=False, indent=2)
+    )
+    
+    try:
+        response_text = await generate_content(f"{system_prompt}\n\n{user_message}", generation_config)
+        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        if json_match:
+            component = json.loads(json_match.group(0))
+            if isinstance(component, dict) and component.get("id"):
+                return component
+    except Exception:
+        pass
+    return variants[0]
+
+async def parse_matching_sections_map_reduce(
+    analysis_results: Dict[str, Any],
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> Dict[str, Any]:
+    """
+    Extract evaluation components section by section in parallel (map), then merge duplicates
+    deterministically (reduce). The LLM is only called again for components whose variants
+    disagree on the evaluation rule.
+    
+    Unlike parse_matching_sections, the output size per call is bounded by one section, so
+    large evaluation models are not truncated.
+    
+    Args:
+        analysis_results: The output from analyze_pdf_sections
+        semaphore: Optional semaphore bounding the LLM calls in flight
+        
+    Returns:
+        Dictionary with evaluation components for all matching sections
+    """
+    matching_sections = analysis_results.get("matching_sections", [])
+    
+    if not matching_sections:
+        return {
+            "success": False,
+            "message": "No matching sections found in the analysis results",
+            "questions": []
+        }
+    
+    if not get_api_key():
+        return {
+            "success": False,
+            "message": "GOOGLE_API_KEY environment variable not set",
+            "questions": []
+        }
+    
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(COMPONENT_MAX_CONCURRENCY)
+    
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+    
+    section_results = await asyncio.gather(
+        *(bounded(process_section_for_components(section)) for section in matching_sections)
+    )
+    errors = [
+        {"section": result["section"], "error": result["error"]}
+        for result in section_results if "error" in result
+    ]
+    
+    components, conflicts = reduce_components(section_results)
+    resolved = iter(await asyncio.gather(
+        *(bounded(resolve_component_conflict(variants)) for variants in conflicts)
+    ))
+    components = [component if component is not None else next(resolved) for component in components]
+    # A resolved conflict may take the id of another question
+    rename_duplicate_ids(components)
+    
+    if not components:
+        return {
+            "success": False,
+            "message": errors[0]["error"] if errors else "No components found in the matching sections",
+            "questions": []
+        }
+    
+    results = {
+        "success": True,
+        "questions": components,
+        "calculationOrder": build_calculation_order(components),
+        "reduce": {
+            "sections": len(matching_sections),
+            "conflicts": len(conflicts)
+        }
+    }
+    if errors:
+        results["errors"] = errors
+    return results
+
+async def parse_matching_sections_with_rules(
+    analysis_results: Dict[str, Any],
+    map_reduce: bool = False
+) -> Dict[str, Any]:
+    """
+    Extract evaluation components with the template rules first, and only send the sections
+    the rules could not cover to the LLM.
+    
+    Args:
+        analysis_results: The output from analyze_pdf_sections
+        map_reduce: Use map-reduce instead of one combined call for the uncovered sections
+        
+    Returns:
+        Dictionary with evaluation components for all matching sections
+    """
+    matching_sections = analysis_results.get("matching_sections", [])
+    
+    if not matching_sections:
+        return {
+            "success": False,
+            "message": "No matching sections found in the analysis results",
+            "questions": []
+        }
+    
+    rule_results = [extract_components_with_rules(section) for section in matching_sections]
+    if any(result["components"] for result in rule_results):
+        uncovered = [
+            section for section, result in zip(matching_sections, rule_results) if not result["covered"]
+        ]
+    else:
+        # Not one of the known templates, leave the whole model to the LLM
+        uncovered = matching_sections
+    
+    # Where the rules disagree with themselves, the first section wins
+    components, conflicts = reduce_components(
+        [{"components": result["components"]} for result in rule_results if result["covered"]]
+    )
+    resolved = iter(conflicts)
+    components = [component if component is not None else next(resolved)[0] for component in components]
+    
+    errors = []
+    if uncovered:
+        llm_results = await (
+            parse_matching_sections_map_reduce if map_reduce else parse_matching_sections
+        )({"matching_sections": uncovered})
+        if llm_results.get("success"):
+            for component in llm_results["questions"]:
+                if isinstance(component, dict) and component.get("id") and not any(
+                    same_question(existing, component) for existing in components
+                ):
+                    components.append(component)
+        else:
+            errors.append(llm_results.get("message", "Unknown error"))
+    # A resolved conflict or an LLM component may take the id of another question
+    rename_duplicate_ids(components)
+    
+    if not components:
+        return {
+            "success": False,
+            "message": errors[0] if errors else "No components found in the matching sections",
+            "questions": []
+        }
+    
+    covered_results = [result for result in rule_results if result["covered"] and result["components"]]
+    results = {
+        "success": True,
+        "questions": components,
+        "calculationOrder": build_calculation_order(components),
+        "rules": {
+            "covered_sections": len(matching_sections) - len(uncovered),
+            "llm_sections": len(uncovered),
+            "confidence": min((result["confidence"] for result in covered_results), default=None)
+        }
+    }
+    if errors:
+        results["errors"] = errors
+    return results
+
+async def parse_evaluation_components(
+    analysis_results: Dict[str, Any],
+    map_reduce: bool = False,
+    rules: Optional[bool] = None
+) -> Dict[str, Any]:
     """
     Main entry point to parse evaluation components from matching sections.
     
     Args:
         analysis_results: The output from analyze_pdf_sections
+        map_reduce: Extract per section and merge the results instead of one combined call
+        rules: Try the template rules before the LLM, defaults to RULE_EXTRACTION
         
     Returns:
         Dictionary with evaluation components
     """
     try:
+        if rules is None:
+            rules = rule_extraction_enabled()
+        if rules:
+            return await parse_matching_sections_with_rules(analysis_results, map_reduce)
+        if map_reduce:
+            return await parse_matching_sections_map_reduce(analysis_results)
         return await parse_matching_sections(analysis_results)
     except Exception as e:
         return {
@@ -0,0 +1,129 @@
+import json
+import re
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Tuple
+
+# Components whose headings are at least this similar are considered the same question
+CONTENT_SIMILARITY_THRESHOLD = 0.85
+
+
+def normalize_content(content: str) -> str:
+    """Lowercased heading with punctuation and repeated whitespace removed."""
+    content = re.sub(r'[^\w\s]', ' ', (content or "").lower())
+    return " ".join(content.split())
+
+
+def content_similarity(first: str, second: str) -> float:
+    """Similarity ratio (0-1) between two component headings."""
+    return SequenceMatcher(None, normalize_content(first), normalize_content(second)).ratio()
+
+
+def rule_key(component: Dict[str, Any]) -> str:
+    """
+    Canonical form of a component's evaluation rule, so that equal rules compare equal
+    regardless of key order or number formatting (-600000 vs -600000.0).
+    """
+    def canonical(value):
+        if isinstance(value, dict):
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [canonical(item) for item in value]
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    return json.dumps(canonical(component.get("evaluation", {})), sort_keys=True, ensure_ascii=False)
+
+
+def same_question(first: Dict[str, Any], second: Dict[str, Any]) -> bool:
+    """
+    Whether two extracted components describe the same question: the same heading (by
+    similarity) with the same type of operation, or the same id with either of them. Per
+    section extraction may give distinct questions a generic id (e.g. 'avdrag'); with
+    differing headings and operations they are kept apart and renamed by reduce_components.
+    """
+    same_operation = (
+        first.get("evaluation", {}).get("operation") == second.get("evaluation", {}).get("operation")
+    )
+    similar_content = (
+        content_similarity(first.get("content", ""), second.get("content", "")) >= CONTENT_SIMILARITY_THRESHOLD
+    )
+    if first.get("id") and first.get("id") == second.get("id"):
+        return same_operation or similar_content
+    return same_operation and similar_content
+
+
+def merge_variants(variants: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge components with equal evaluation rules into one. The first variant wins, the
+    alternatives of all variants are kept in order of appearance.
+    """
+    merged = dict(variants[0])
+    alternatives = []
+    for variant in variants:
+        for alternative in variant.get("alternatives", []):
+            if alternative not in alternatives:
+                alternatives.append(alternative)
+    if alternatives or "alternatives" in merged:
+        merged["alternatives"] = alternatives
+    return merged
+
+
+def reduce_components(
+    section_results: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+    """
+    Deterministically merge the components extracted per section.
+
+    Components describing the same question (see same_question) are grouped. A group whose
+    variants all share the same evaluation rule is merged; a group with differing rules is a
+    conflict that needs to be resolved (e.g. by the LLM).
+
+    Args:
+        section_results: Results of process_section_for_components, in document order
+
+    Returns:
+        The merged components (None as placeholder where a conflict is to be resolved) and
+        the conflicts, each a list of variants with the same position as its placeholder
+    """
+    groups: List[List[Dict[str, Any]]] = []
+    for result in section_results:
+        for component in result.get("components", []):
+            if not isinstance(component, dict) or not component.get("id"):
+                continue
+            for group in groups:
+                if any(same_question(member, component) for member in group):
+                    group.append(component)
+                    break
+            else:
+                groups.append([component])
+
+    components = []
+    conflicts = []
+    for group in groups:
+        distinct_rules = {}
+        for variant in group:
+            distinct_rules.setdefault(rule_key(variant), []).append(variant)
+
+        if len(distinct_rules) == 1:
+            components.append(merge_variants(group))
+        else:
+            # One representative per distinct rule, in order of appearance
+            components.append(None)
+            conflicts.append([merge_variants(variants) for variants in distinct_rules.values()])
+
+    # Components that ended up in different groups may still share an id
+    rename_duplicate_ids(components)
+    return components, conflicts
+
+
+def rename_duplicate_ids(components: List[Dict[str, Any]]) -> None:
+    """Give repeated ids a suffix ('avdrag', 'avdrag_2', ...), skipping None placeholders."""
+    seen_ids = {}
+    for component in components:
+        if component is None:
+            continue
+        count = seen_ids.get(component["id"], 0)
+        seen_ids[component["id"]] = count + 1
+        if count:
+            component["id"] = f"{component['id']}_{count + 1}"
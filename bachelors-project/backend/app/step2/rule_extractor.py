@@ -0,0 +1,269 @@
+"""
+Rule-based extraction of evaluation components from the common Swedish templates:
+
+- point ranges mapped to krona or percent deductions/additions
+  ("55 - 64 poäng; avdrag med 600 000")                          -> slider
+- single point levels mapped to deductions
+  ("3 poäng 20% avdrag på anbudspriset")                          -> radio
+- Ja/Nej criteria with a fixed deduction/addition
+  ("Ja: avdrag 50 000 kr")                                        -> yesno
+- mervärde tables, one criterion per row with a percent deduction
+  ("Miljöcertifiering enligt ISO 14001   5 %")                    -> yesno
+
+The output uses the same component schema as COMPONENT_CLASSIFICATION_PROMPT. A section is
+'covered' when the rules found components in it and every line that states an evaluation
+effect was understood; only uncovered sections need to be sent to the LLM.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+# Sections whose rule result is less certain than this are sent to the LLM as well
+RULE_CONFIDENCE_THRESHOLD = 0.8
+
+# Swedish number formatting: space (also no-break/narrow no-break) or dot as thousands
+# separator and comma as decimal separator, e.g. "1 200 000", "600.000", "12,5"
+NUMBER_PATTERN = r'\d{1,3}(?:[ \u00a0\u202f.]\d{3})+(?:,\d+)?|\d+(?:,\d+)?'
+
+UNIT_PATTERN = r'%|procent|kr(?:onor)?\b|sek\b|tkr\b|mkr\b|tusen\b|miljoner\b'
+
+DIRECTION_SIGN = {"avdrag": -1, "reduktion": -1, "tillägg": 1, "påslag": 1}
+DIRECTION_PATTERN = r'avdrag|reduktion|tillägg|påslag'
+
+EFFECT_PATTERN = re.compile(
+    rf'(?:(?P<direction_before>{DIRECTION_PATTERN})\w*[^\d\n]{{0,20}}?'
+    rf'(?P<amount_before>{NUMBER_PATTERN})\s*(?P<unit_before>{UNIT_PATTERN})?)'
+    rf'|(?:(?P<amount_after>{NUMBER_PATTERN})\s*(?P<unit_after>{UNIT_PATTERN})?[^\d\n]{{0,20}}?'
+    rf'(?P<direction_after>{DIRECTION_PATTERN}))',
+    re.IGNORECASE
+)
+
+RANGE_PATTERN = re.compile(r'^(?P<min>\d+)\s*[-–—]\s*(?P<max>\d+)\s*(?:poäng|p\b)\W*(?P<rest>.*)$', re.IGNORECASE)
+POINTS_PATTERN = re.compile(r'^(?P<points>\d+)\s*(?:poäng|p\b)\W*(?P<rest>.*)$', re.IGNORECASE)
+YES_NO_PATTERN = re.compile(r'^(?:om\s+)?(?P<answer>ja|nej)\b\W*(?P<rest>.*)$', re.IGNORECASE)
+PERCENT_ROW_PATTERN = re.compile(rf'^(?P<label>[^\W\d_][^%]{{2,}}?)\s+(?P<amount>{NUMBER_PATTERN})\s*(?:%|procent)\s*$', re.IGNORECASE)
+
+REJECTION_PATTERN = re.compile(r'förkastas|diskvalificeras|utesluts', re.IGNORECASE)
+
+# A line states an evaluation effect if it has an amount next to a direction, or a percentage
+SIGNAL_PATTERN = re.compile(
+    rf'(?:{DIRECTION_PATTERN})\w*\D{{0,20}}\d|\d[\d \u00a0\u202f.,]*\s*(?:%|procent|kr\b|sek\b)[^\n]{{0,30}}(?:{DIRECTION_PATTERN})'
+    rf'|\d\s*(?:%|procent)',
+    re.IGNORECASE
+)
+
+PRICE_BASE_PATTERN = re.compile(r'anbudspris|anbudssumma|utvärderingspris|utvärderingssumma', re.IGNORECASE)
+
+
+def parse_swedish_number(text: str) -> float:
+    """
+    Parse a number in Swedish formatting ('1 200 000', '600.000', '12,5').
+    """
+    text = text.replace("\u00a0", " ").replace("\u202f", " ").strip()
+    if re.fullmatch(r'\d{1,3}(?:[ .]\d{3})+(?:,\d+)?', text):
+        text = text.replace(" ", "").replace(".", "")
+    return float(text.replace(" ", "").replace(",", "."))
+
+
+def parse_effect(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse the evaluation effect stated in a piece of text, e.g. 'avdrag med 600 000 kr' or
+    '20% avdrag på anbudspriset'.
+
+    Returns:
+        Dictionary with 'operation' ('adjust' for amounts, 'percent' for percentages) and the
+        signed 'value', or None if the text states no effect
+    """
+    match = EFFECT_PATTERN.search(text)
+    if not match:
+        return None
+    direction = (match.group("direction_before") or match.group("direction_after")).lower()
+    amount = parse_swedish_number(match.group("amount_before") or match.group("amount_after"))
+    unit = (match.group("unit_before") or match.group("unit_after") or "").lower()
+
+    sign = DIRECTION_SIGN[direction]
+    if unit in ("%", "procent"):
+        if amount > 100:
+            return None
+        return {"operation": "percent", "value": round(sign * amount / 100, 6) or 0}
+    if unit in ("tkr", "tusen"):
+        amount *= 1000
+    elif unit in ("mkr", "miljoner"):
+        amount *= 1000000
+    value = sign * amount
+    return {"operation": "adjust", "value": int(value) if value.is_integer() else value}
+
+
+def slugify(text: str) -> str:
+    """Component id from a heading: lowercase ASCII letters and digits, no spaces."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r'[^a-z0-9]', '', text)
+
+
+def section_name(title: str) -> str:
+    """A section title without its heading number."""
+    return re.sub(r'^\d+(?:\.\d+)*\s*', '', title.replace("\u00a0", " ")).strip() or title
+
+
+def lines_of(text: str) -> List[str]:
+    return [" ".join(line.replace("\u00a0", " ").split()) for line in text.splitlines() if line.strip()]
+
+
+def range_component(rows: List[Tuple[int, int, Dict[str, Any]]], name: str) -> Tuple[Dict[str, Any], float]:
+    """Slider over point ranges, e.g. referenspoäng -> avdrag/tillägg."""
+    operations = {effect["operation"] for _, _, effect in rows}
+    confidence = 1.0
+    if len(operations) > 1:
+        confidence -= 0.4
+    ordered = sorted(rows, key=lambda row: row[0])
+    for (_, previous_max, _), (next_min, _, _) in zip(ordered, ordered[1:]):
+        if next_min <= previous_max:
+            confidence -= 0.3  # overlapping ranges
+        elif next_min != previous_max + 1:
+            confidence -= 0.1  # gap between ranges
+    if len(rows) == 1:
+        confidence -= 0.3
+
+    component = {
+        "id": slugify(name),
+        "content": name,
+        "type": "slider",
+        "alternatives": [f"{low} - {high}" for low, high, _ in rows],
+        "evaluation": {
+            "operation": operations.pop() if len(operations) == 1 else "adjust",
+            "valueType": "range",
+            "ranges": [{"min": low, "max": high, "value": effect["value"]} for low, high, effect in rows]
+        }
+    }
+    return component, max(confidence, 0.0)
+
+
+def mapping_component(
+    rows: List[Tuple[str, Dict[str, Any]]],
+    name: str,
+    component_type: str
+) -> Tuple[Dict[str, Any], float]:
+    """Radio (point levels) or yesno component mapping each alternative to its effect."""
+    operations = {effect["operation"] for _, effect in rows}
+    confidence = 1.0 if len(operations) == 1 else 0.6
+    if len(rows) == 1 and component_type == "radio":
+        confidence -= 0.3
+
+    mapping = {label: effect["value"] for label, effect in rows}
+    if component_type == "yesno":
+        mapping.setdefault("Ja", 0)
+        mapping.setdefault("Nej", 0)
+        alternatives = ["Ja", "Nej"]
+    else:
+        alternatives = [label for label, _ in rows]
+
+    component = {
+        "id": slugify(name),
+        "content": name,
+        "type": component_type,
+        "alternatives": alternatives,
+        "evaluation": {
+            "operation": operations.pop() if len(operations) == 1 else "adjust",
+            "valueType": "map",
+            "mapping": mapping
+        }
+    }
+    return component, max(confidence, 0.0)
+
+
+def extract_components_with_rules(section: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract evaluation components from one section with the template rules.
+
+    Args:
+        section: Dictionary containing 'section' (title) and 'content' (text)
+
+    Returns:
+        Dictionary with 'section', the 'components' found, the overall 'confidence' (0-1),
+        'covered' (whether the LLM can be skipped for this section) and the
+        'unmatched_lines' that state an effect the rules did not understand
+    """
+    name = section_name(section["section"])
+    text = section.get("content", section.get("text", "")) or ""
+    lines = lines_of(text)
+    mentions_references = "referenspoäng" in text.lower()
+
+    ranges: List[Tuple[int, int, Dict[str, Any]]] = []
+    points: List[Tuple[str, Dict[str, Any]]] = []
+    answers: List[Tuple[str, Dict[str, Any]]] = []
+    percent_rows: List[Tuple[str, Dict[str, Any]]] = []
+    unmatched = []
+    is_merit_model = "mervärde" in text.lower()
+
+    for line in lines:
+        range_match = RANGE_PATTERN.match(line)
+        points_match = POINTS_PATTERN.match(line)
+        answer_match = YES_NO_PATTERN.match(line)
+        percent_match = PERCENT_ROW_PATTERN.match(line) if is_merit_model else None
+
+        if range_match:
+            effect = parse_effect(range_match.group("rest"))
+            if effect:
+                ranges.append((int(range_match.group("min")), int(range_match.group("max")), effect))
+                continue
+        elif points_match:
+            effect = parse_effect(points_match.group("rest"))
+            if effect:
+                points.append((f"{points_match.group('points')} poäng", effect))
+                continue
+            if REJECTION_PATTERN.search(points_match.group("rest")):
+                # A level that rejects the tender has no price effect to model
+                continue
+        elif answer_match:
+            effect = parse_effect(answer_match.group("rest"))
+            if effect:
+                answers.append((answer_match.group("answer").capitalize(), effect))
+                continue
+        elif percent_match:
+            amount = parse_swedish_number(percent_match.group("amount"))
+            if amount <= 100:
+                # Mervärde rows give a deduction when the criterion is fulfilled
+                percent_rows.append((percent_match.group("label").strip(" .:;-"), {"operation": "percent", "value": -amount / 100}))
+                continue
+
+        if SIGNAL_PATTERN.search(line):
+            unmatched.append(line)
+
+    scored: List[Tuple[Dict[str, Any], float]] = []
+    if ranges:
+        scored.append(range_component(ranges, "Referenspoäng" if mentions_references else name))
+    if points:
+        scored.append(mapping_component(points, name, "radio"))
+    if answers:
+        scored.append(mapping_component(answers, name, "yesno"))
+    for label, effect in percent_rows:
+        component, confidence = mapping_component([("Ja", effect)], label, "yesno")
+        scored.append((component, confidence - 0.1))
+
+    if scored and any(PRICE_BASE_PATTERN.search(line) for line in lines):
+        scored.insert(0, ({
+            "id": "anbudspris",
+            "content": "Anbudspris",
+            "type": "inputbox",
+            "alternatives": [""],
+            "evaluation": {"operation": "base", "valueType": "direct"}
+        }, 0.9))
+
+    components = []
+    for component, confidence in scored:
+        component["confidence"] = round(confidence, 2)
+        component["source"] = "rules"
+        components.append(component)
+
+    confidence = min((component["confidence"] for component in components), default=0.0)
+    if unmatched:
+        confidence = min(confidence, 0.5)
+    return {
+        "section": section["section"],
+        "components": components,
+        "confidence": confidence,
+        # A section the rules found nothing in is left to the LLM, it may state its rules in prose
+        "covered": bool(components) and not unmatched and confidence >= RULE_CONFIDENCE_THRESHOLD,
+        "unmatched_lines": unmatched
+    }
@@ -0,0 +1,248 @@
+"""
+Token accounting and budgets for the LLM calls of a request.
+
+Every LLM call made while handling a request is booked on the ledgers in the context of the
+calling task: the request, the document being analysed (for bundles, each document has its
+own) and the API key of the caller. Ledgers are kept in a context variable, so they follow
+the request into the tasks it starts.
+
+Before a call is sent, its worst case (estimated prompt plus max_output_tokens) is reserved
+on every ledger, and replaced by the reported usage once the call returns. A call that could
+exceed a budget is refused with TokenBudgetExceeded and nothing is sent; the pipeline then
+stops fanning out and returns what it has, marked as partial.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.metrics import Counter
+
+# Budgets in tokens (prompt + output); 0 disables the budget
+TOKEN_BUDGET_PER_REQUEST = int(os.environ.get("TOKEN_BUDGET_PER_REQUEST", "1000000"))
+TOKEN_BUDGET_PER_DOCUMENT = int(os.environ.get("TOKEN_BUDGET_PER_DOCUMENT", "500000"))
+
+# Tokens an API key may use per TOKEN_BUDGET_WINDOW seconds (per worker); 0 disables it
+TOKEN_BUDGET_PER_API_KEY = int(os.environ.get("TOKEN_BUDGET_PER_API_KEY", "0"))
+TOKEN_BUDGET_WINDOW = float(os.environ.get("TOKEN_BUDGET_WINDOW", "86400"))
+
+# Callers without an X-API-Key header share this key
+ANONYMOUS_API_KEY = "anonymous"
+
+api_key_tokens = Counter("llm_api_key_tokens_total", "LLM tokens by API key fingerprint and kind (prompt, output)")
+budget_refusals = Counter("token_budget_refusals_total", "LLM calls refused by scope (request, document, api_key)")
+
+_lock = threading.Lock()
+
+
+class TokenBudgetExceeded(Exception):
+    """An LLM call was refused because it could exceed a token budget."""
+
+    def __init__(self, scope: str, name: str, budget: int):
+        super().__init__(f"Token budget of {scope} {name} ({budget} tokens) exhausted")
+        self.scope = scope
+        self.name = name
+        self.budget = budget
+
+
+class TokenLedger:
+    """Token usage and budget of one scope (a request, a document or an API key)."""
+
+    def __init__(self, scope: str, name: str, budget: int = 0):
+        self.scope = scope
+        self.name = name
+        self.budget = budget
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.reserved = 0
+        # Calls refused in this scope, and whether this scope's own budget refused them
+        self.refused_calls = 0
+        self.exceeded = False
+        self.waiters: List[asyncio.Future] = []
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self.documents: Dict[str, "TokenLedger"] = {}
+        self.api_key: Optional["TokenLedger"] = None
+
+    @property
+    def used(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether calls in this scope were refused, by its own or an enclosing budget."""
+        return self.refused_calls > 0
+
+    def fits(self, tokens: int) -> bool:
+        return not self.budget or self.used + self.reserved + tokens <= self.budget
+
+    def book(self, model_name: str, usage: Dict[str, int]) -> None:
+        self.calls += 1
+        self.prompt_tokens += usage["prompt_tokens"]
+        self.output_tokens += usage["output_tokens"]
+        model = self.by_model.setdefault(model_name, {"calls": 0, "prompt_tokens": 0, "output_tokens": 0})
+        model["calls"] += 1
+        model["prompt_tokens"] += usage["prompt_tokens"]
+        model["output_tokens"] += usage["output_tokens"]
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "total_tokens": self.used,
+            "budget": self.budget or None,
+            "refused_calls": self.refused_calls,
+            "exhausted": self.exhausted,
+            "exceeded": self.exceeded,
+        }
+        if self.by_model:
+            summary["by_model"] = self.by_model
+        if self.documents:
+            summary["documents"] = {name: ledger.summary() for name, ledger in self.documents.items()}
+        if self.api_key:
+            summary["api_key"] = {
+                "key": self.api_key.name,
+                "total_tokens": self.api_key.used,
+                "budget": self.api_key.budget or None,
+                "exceeded": self.api_key.exceeded,
+            }
+        return summary
+
+
+_ledgers: ContextVar[Tuple[TokenLedger, ...]] = ContextVar("token_ledgers", default=())
+
+# API key ledgers, restarted every TOKEN_BUDGET_WINDOW seconds
+_api_key_ledgers: Dict[str, TokenLedger] = {}
+_window_started = time.monotonic()
+
+
+def api_key_fingerprint(api_key: Optional[str]) -> str:
+    """Short hash identifying an API key in metrics and responses without revealing it."""
+    if not api_key:
+        return ANONYMOUS_API_KEY
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+def _api_key_ledger(fingerprint: str) -> TokenLedger:
+    global _window_started
+    with _lock:
+        if time.monotonic() - _window_started >= TOKEN_BUDGET_WINDOW:
+            _api_key_ledgers.clear()
+            _window_started = time.monotonic()
+        if fingerprint not in _api_key_ledgers:
+            _api_key_ledgers[fingerprint] = TokenLedger("api_key", fingerprint, TOKEN_BUDGET_PER_API_KEY)
+        return _api_key_ledgers[fingerprint]
+
+
+@contextmanager
+def _push(*ledgers: TokenLedger) -> Iterator[None]:
+    token = _ledgers.set(_ledgers.get() + ledgers)
+    try:
+        yield
+    finally:
+        _ledgers.reset(token)
+
+
+@contextmanager
+def request_tokens(api_key: Optional[str] = None, document: Optional[str] = None) -> Iterator[TokenLedger]:
+    """
+    Account the LLM calls made in the block to a request.
+
+    Args:
+        api_key: API key of the caller (X-API-Key header), None for anonymous callers
+        document: Name of the document if the request analyses a single one
+
+    Yields:
+        The request ledger; its summary() is the usage report of the response
+    """
+    request = TokenLedger("request", "request", TOKEN_BUDGET_PER_REQUEST)
+    request.api_key = _api_key_ledger(api_key_fingerprint(api_key))
+    ledgers = [request, request.api_key]
+    if document:
+        request.documents[document] = TokenLedger("document", document, TOKEN_BUDGET_PER_DOCUMENT)
+        ledgers.append(request.documents[document])
+    with _push(*ledgers):
+        yield request
+
+
+@contextmanager
+def document_tokens(document: Optional[str]) -> Iterator[None]:
+    """
+    Account the LLM calls made in the block also to one document of the current request,
+    e.g. a section of one document in a tender bundle.
+    """
+    requests = [ledger for ledger in _ledgers.get() if ledger.scope == "request"]
+    if not document or not requests:
+        yield
+        return
+    request = requests[-1]
+    if document not in request.documents:
+        request.documents[document] = TokenLedger("document", document, TOKEN_BUDGET_PER_DOCUMENT)
+    with _push(request.documents[document]):
+        yield
+
+
+def budget_exhausted() -> bool:
+    """Whether LLM calls in the current context have been refused, e.g. to mark results as partial."""
+    return any(ledger.exhausted for ledger in _ledgers.get())
+
+
+class Reservation:
+    """Tokens held for one LLM call on the ledgers of its context."""
+
+    def __init__(self, tokens: int, ledgers: Tuple[TokenLedger, ...]):
+        self.tokens = tokens
+        self.ledgers = ledgers
+
+    def settle(self, model_name: str, usage: Optional[Dict[str, int]]) -> None:
+        """Release the reservation and book the actual usage (None if the call failed)."""
+        with _lock:
+            for ledger in self.ledgers:
+                ledger.reserved -= self.tokens
+                if usage is not None:
+                    ledger.book(model_name, usage)
+                    if ledger.scope == "api_key":
+                        api_key_tokens.inc(usage["prompt_tokens"], api_key=ledger.name, kind="prompt")
+                        api_key_tokens.inc(usage["output_tokens"], api_key=ledger.name, kind="output")
+                # Calls waiting for reserved tokens may fit now
+                waiters, ledger.waiters = ledger.waiters, []
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+
+async def reserve_tokens(tokens: int) -> Reservation:
+    """
+    Reserve the worst-case tokens of an LLM call on every ledger of the current context.
+
+    A call that would exceed a budget even without the calls in flight is refused. One that
+    only exceeds it together with the reservations of the calls in flight waits for them to
+    settle, since they usually use far less than their max_output_tokens.
+
+    Raises:
+        TokenBudgetExceeded: If the call could exceed a budget
+    """
+    ledgers = tuple(dict.fromkeys(_ledgers.get()))
+    while True:
+        with _lock:
+            exceeded = next((ledger for ledger in ledgers if ledger.budget and ledger.used + tokens > ledger.budget), None)
+            if exceeded:
+                for ledger in ledgers:
+                    ledger.refused_calls += 1
+                exceeded.exceeded = True
+                budget_refusals.inc(scope=exceeded.scope)
+                raise TokenBudgetExceeded(exceeded.scope, exceeded.name, exceeded.budget)
+
+            blocking = next((ledger for ledger in ledgers if not ledger.fits(tokens)), None)
+            if blocking is None:
+                for ledger in ledgers:
+                    ledger.reserved += tokens
+                return Reservation(tokens, ledgers)
+            waiter = asyncio.get_running_loop().create_future()
+            blocking.waiters.append(waiter)
+        await waiter
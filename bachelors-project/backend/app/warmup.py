@@ -0,0 +1,38 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Heavy third-party modules that the parsers and LLM steps import on first use
+WARM_UP_MODULES = [
+    "fitz",
+    "docx",
+    "google.generativeai",
+]
+
+
+def warm_up() -> dict:
+    """
+    Import the heavy parser and LLM dependencies ahead of the first request.
+
+    Modules that are not installed are skipped, so a worker without for example
+    python-docx still starts.
+
+    Returns:
+        Dictionary mapping each module name to its import time in milliseconds,
+        or None if the module could not be imported
+    """
+    import importlib
+
+    timings = {}
+    for module_name in WARM_UP_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            timings[module_name] = round((time.perf_counter() - start) * 1000, 1)
+        except ImportError as e:
+            logger.warning(f"Warm-up could not import {module_name}: {str(e)}")
+            timings[module_name] = None
+
+    logger.info(f"Warm-up finished: {timings}")
+    return timings
@@ -0,0 +1,84 @@
+from app.step2.reduce_components import reduce_components, rename_duplicate_ids, same_question
+
+
+def slider(component_id, content, ranges, alternatives=None):
+    return {
+        "id": component_id,
+        "content": content,
+        "type": "slider",
+        "alternatives": alternatives or [f"{low} - {high}" for low, high, _ in ranges],
+        "evaluation": {
+            "operation": "adjust",
+            "valueType": "range",
+            "ranges": [{"min": low, "max": high, "value": value} for low, high, value in ranges],
+        },
+    }
+
+
+def yesno(component_id, content, operation, value):
+    return {
+        "id": component_id,
+        "content": content,
+        "type": "yesno",
+        "alternatives": ["Ja", "Nej"],
+        "evaluation": {"operation": operation, "valueType": "map", "mapping": {"Ja": value, "Nej": 0}},
+    }
+
+
+def test_equal_rules_are_merged():
+    first = slider("referenspoang", "Referenspoäng", [(55, 64, -600000), (35, 54, -300000)])
+    # Same question from another section: other id, similar heading, number formatting differs
+    second = slider("referenspoang_tabell", "Referenspoäng:", [(55, 64, -600000.0), (35, 54, -300000.0)],
+                    alternatives=["35 - 54", "55 - 64", "0 - 34"])
+
+    components, conflicts = reduce_components([{"components": [first]}, {"components": [second]}])
+
+    assert conflicts == []
+    [merged] = components
+    assert merged["id"] == "referenspoang"
+    assert merged["alternatives"] == ["55 - 64", "35 - 54", "0 - 34"]
+    assert merged["evaluation"] == first["evaluation"]
+
+
+def test_differing_rules_are_a_conflict():
+    first = slider("referenspoang", "Referenspoäng", [(55, 64, -600000)])
+    second = slider("referenspoang", "Referenspoäng", [(55, 64, -500000)])
+    price = {"id": "anbudspris", "content": "Anbudspris", "type": "inputbox", "alternatives": [""],
+             "evaluation": {"operation": "base", "valueType": "direct"}}
+
+    components, conflicts = reduce_components([
+        {"components": [price, first]},
+        {"components": [second]},
+        {"components": [first]},
+    ])
+
+    assert components == [price, None]
+    # One variant per distinct rule, in order of appearance
+    assert conflicts == [[first, second]]
+
+
+def test_same_id_for_different_questions_is_renamed():
+    delivery = yesno("avdrag", "Försenad leverans", "adjust", 50000)
+    environment = yesno("avdrag", "Miljöcertifiering enligt ISO 14001", "percent", -0.05)
+
+    assert not same_question(delivery, environment)
+    components, conflicts = reduce_components([{"components": [delivery]}, {"components": [environment]}])
+
+    assert conflicts == []
+    assert [component["id"] for component in components] == ["avdrag", "avdrag_2"]
+    assert [component["content"] for component in components] == ["Försenad leverans", "Miljöcertifiering enligt ISO 14001"]
+
+
+def test_same_id_with_the_same_operation_is_the_same_question():
+    first = yesno("miljobil", "Miljöbil", "adjust", -20000)
+    second = yesno("miljobil", "Fordon som uppfyller miljökrav", "adjust", -20000)
+
+    assert same_question(first, second)
+    components, _ = reduce_components([{"components": [first]}, {"components": [second]}])
+    assert [component["id"] for component in components] == ["miljobil"]
+
+
+def test_rename_duplicate_ids_skips_placeholders():
+    components = [{"id": "avdrag"}, None, {"id": "avdrag"}, {"id": "avdrag"}]
+    rename_duplicate_ids(components)
+    assert components == [{"id": "avdrag"}, None, {"id": "avdrag_2"}, {"id": "avdrag_3"}]
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from app.step2 import parse_sections
+from app.step2.rule_extractor import extract_components_with_rules, parse_effect, parse_swedish_number
+
+REFERENCE_TABLE = """Referenspoäng ger avdrag eller tillägg enligt följande:
+55 - 64 poäng; avdrag med 600 000 kr
+35 - 54 poäng; avdrag med 300 000 kr
+15 - 34 poäng; tillägg med 300 000 kr
+0 - 14 poäng; tillägg med 600 000 kr"""
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1 200 000", 1200000),
+    ("600.000", 600000),
+    ("12,5", 12.5),
+    ("1 500", 1500),
+])
+def test_parse_swedish_number(text, expected):
+    assert parse_swedish_number(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("avdrag med 1,5 mkr", {"operation": "adjust", "value": -1500000}),
+    ("tillägg med 250 tkr", {"operation": "adjust", "value": 250000}),
+    ("20% avdrag på anbudspriset", {"operation": "percent", "value": -0.2}),
+    ("avdrag med 600 000 kr", {"operation": "adjust", "value": -600000}),
+    ("ingen påverkan på priset", None),
+])
+def test_parse_effect(text, expected):
+    assert parse_effect(text) == expected
+
+
+def test_reference_range_table_is_a_slider():
+    result = extract_components_with_rules({"section": "4.2 Referenser", "content": REFERENCE_TABLE})
+
+    assert result["covered"]
+    [component] = result["components"]
+    assert component["id"] == "referenspoang"
+    assert component["type"] == "slider"
+    assert component["evaluation"] == {
+        "operation": "adjust",
+        "valueType": "range",
+        "ranges": [
+            {"min": 55, "max": 64, "value": -600000},
+            {"min": 35, "max": 54, "value": -300000},
+            {"min": 15, "max": 34, "value": 300000},
+            {"min": 0, "max": 14, "value": 600000},
+        ],
+    }
+
+
+def test_yes_no_merit():
+    content = "Mervärde ges för miljöbilar.\nJa: avdrag 50 000 kr\nNej: inget avdrag"
+    result = extract_components_with_rules({"section": "5 Miljöbilar", "content": content})
+
+    assert result["covered"]
+    [component] = result["components"]
+    assert component["type"] == "yesno"
+    assert component["alternatives"] == ["Ja", "Nej"]
+    assert component["evaluation"]["mapping"] == {"Ja": -50000, "Nej": 0}
+
+
+def test_percent_row_of_a_merit_table():
+    content = "Mervärden som ger avdrag:\nMiljöcertifiering enligt ISO 14001   5 %"
+    result = extract_components_with_rules({"section": "6 Mervärden", "content": content})
+
+    [component] = result["components"]
+    assert component["id"] == "miljocertifieringenligtiso14001"
+    assert component["type"] == "yesno"
+    assert component["evaluation"] == {"operation": "percent", "valueType": "map", "mapping": {"Ja": -0.05, "Nej": 0}}
+    assert component["confidence"] == 0.9
+    assert result["covered"]
+
+
+def test_unmatched_effect_is_not_covered():
+    content = "Vid försenad leverans görs avdrag med 10 000 kr per vecka."
+    result = extract_components_with_rules({"section": "7 Avdrag", "content": content})
+
+    assert result["components"] == []
+    assert result["unmatched_lines"] == [content]
+    assert not result["covered"]
+
+
+def test_section_without_components_goes_to_the_llm(monkeypatch):
+    sections = [
+        {"section": "4.2 Referenser", "content": REFERENCE_TABLE},
+        # Mentions an evaluation, but states its rules in prose the templates do not cover
+        {"section": "5 Kvalitet", "content": "Kvaliteten bedöms av en expertgrupp utifrån anbudets helhet."},
+    ]
+    sent = []
+
+    async def fake_llm(analysis_results):
+        sent.extend(section["section"] for section in analysis_results["matching_sections"])
+        return {"success": True, "questions": [{
+            "id": "kvalitet", "content": "Kvalitet", "type": "radio", "alternatives": ["Hög", "Låg"],
+            "evaluation": {"operation": "adjust", "valueType": "map", "mapping": {"Hög": -100000, "Låg": 0}},
+        }]}
+
+    monkeypatch.setattr(parse_sections, "parse_matching_sections", fake_llm)
+    results = asyncio.run(parse_sections.parse_matching_sections_with_rules({"matching_sections": sections}))
+
+    assert sent == ["5 Kvalitet"]
+    assert [question["id"] for question in results["questions"]] == ["referenspoang", "kvalitet"]
+    assert results["rules"]["covered_sections"] == 1
+    assert results["rules"]["llm_sections"] == 1
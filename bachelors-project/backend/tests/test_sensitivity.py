@@ -0,0 +1,84 @@
+import pytest
+
+from app.analysis.sensitivity import analyze_sensitivity, calculate_total
+
+QUESTIONS = [
+    {"id": "pris", "evaluation": {"operation": "base", "valueType": "direct"}},
+    {"id": "referenser", "evaluation": {"operation": "adjust", "valueType": "range", "ranges": [
+        {"min": 55, "max": 64, "value": -600000},
+        {"min": 35, "max": 54, "value": -300000},
+        {"min": 0, "max": 14, "value": 600000},
+    ]}},
+    {"id": "miljo", "evaluation": {"operation": "adjust", "valueType": "map", "mapping": {
+        "Ja": -200000, "Nej": 0, "1": -50000, "true": -10000,
+    }}},
+    {"id": "avtal", "evaluation": {"operation": "percent", "valueType": "map", "mapping": {"Ja": -0.05, "Nej": 0.1}}},
+    {"id": "reservpris", "evaluation": {"operation": "base", "valueType": "direct"}},
+]
+ORDER = ["pris", "referenser", "miljo", "avtal", "reservpris"]
+
+
+# Totals computed with calculateTotalSum from frontend/src/lib/client.tsx
+@pytest.mark.parametrize("responses, expected", [
+    ({"pris": 4200000, "referenser": 60, "miljo": "Ja", "avtal": "Ja"}, 3230000),
+    ({"pris": "4200000", "referenser": "40", "miljo": "Nej", "avtal": "Nej"}, 4290000),
+    # parseFloat stops at the first character that is not part of a number
+    ({"pris": "4 200 000", "referenser": 20}, 4),
+    # Above, between and below the ranges no adjustment applies
+    ({"pris": 4200000, "referenser": 70}, 4200000),
+    ({"pris": 4200000, "referenser": 14.5}, 4200000),
+    ({"pris": 4200000, "referenser": -1}, 4200000),
+    ({"pris": "3.5e6 kr", "referenser": "54"}, 3200000),
+    # Unparseable numbers count as 0, unknown choices add nothing
+    ({"pris": "abc", "referenser": "", "miljo": "Kanske"}, 600000),
+    ({"pris": 4200000, "miljo": 1, "avtal": "Ja"}, 3942500),
+    ({"pris": 4200000, "miljo": True}, 4190000),
+    # The last answered base question sets the base
+    ({"pris": 4200000, "reservpris": "3900000", "referenser": 0}, 4500000),
+    ({"referenser": 64, "avtal": "Nej"}, -660000),
+    ({"pris": ".5e6", "referenser": "55abc"}, -100000),
+])
+def test_calculate_total_matches_frontend(responses, expected):
+    by_id = {question["id"]: question for question in QUESTIONS}
+    assert calculate_total(by_id, ORDER, responses) == pytest.approx(expected)
+
+
+def test_range_outcomes_include_gaps():
+    bids = {
+        "a": {"pris": 4200000, "referenser": 20},
+        "b": {"pris": 4000000},
+    }
+    criterion = analyze_sensitivity(QUESTIONS, ORDER, bids, ["a"])["bids"]["a"]["criteria"]["referenser"]
+
+    assert [(r["min"], r["max"], r["in_range"], r["total"]) for r in criterion["ranges"]] == [
+        (None, 0, False, 4200000),
+        (0, 14, True, 4800000),
+        (14, 35, False, 4200000),
+        (35, 54, True, 3900000),
+        (54, 55, False, 4200000),
+        (55, 64, True, 3600000),
+        (64, None, False, 4200000),
+    ]
+    assert [(b["at"], b["inclusive"], b["rank_below"], b["rank_above"]) for b in criterion["breakpoints"]] == [
+        (35, True, 2, 1),
+        (54, False, 1, 2),
+        (55, True, 2, 1),
+        (64, False, 1, 2),
+    ]
+    assert criterion["to_win"]["value"] == 35
+    assert criterion["to_win"]["change"] == 15
+    assert criterion["to_win"]["inclusive"]
+    assert not criterion["to_win"]["already_winning"]
+
+
+def test_range_to_win_can_be_a_gap():
+    bids = {
+        "a": {"pris": 4200000, "referenser": 10},
+        "b": {"pris": 4500000},
+    }
+    to_win = analyze_sensitivity(QUESTIONS, ORDER, bids, ["a"])["bids"]["a"]["criteria"]["referenser"]["to_win"]
+
+    # Leaving the range 0-14 drops its 600000 surcharge
+    assert to_win["range"]["in_range"] is False
+    assert (to_win["value"], to_win["inclusive"], to_win["change"]) == (14, False, 4)
+    assert to_win["total"] == 4200000
@@ -28,6 +28,7 @@ export interface ParsedEvaluationResponse {
   success: boolean;
   questions: ApiQuestion[];
   calculationOrder: string[];
+  model_id?: string; // ID of the stored evaluation model, see getEvaluationModel
 }
 
 export class ApiClient {
@@ -67,6 +68,40 @@ export class ApiClient {
     }
   }
 
+  /**
+   * Fetches an evaluation model stored by an earlier parseEvaluationComponents call.
+   * Models never change, so the browser serves repeated requests from its HTTP cache.
+   * Returns null if the backend no longer has the model.
+   */
+  async getEvaluationModel(modelId: string): Promise<ParsedEvaluationResponse | null> {
+    const response = await fetch(`${this.baseUrl}/evaluation-models/${modelId}`, {
+      method: 'GET',
+      mode: 'cors',
+      headers: {
+        'Accept': 'application/json',
+      },
+    });
+
+    if (response.status === 404) {
+      return null;
+    }
+    if (!response.ok) {
+      throw new Error('Failed to fetch evaluation model');
+    }
+
+    return await response.json();
+  }
+
+  /**
+   * SHA-256 of a file as hex (the document ID the backend uses for it)
+   */
+  async hashFile(file: File): Promise<string> {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+      .map(byte => byte.toString(16).padStart(2, '0'))
+      .join('');
+  }
+
   /**
    * Convert API questions to local format
    */
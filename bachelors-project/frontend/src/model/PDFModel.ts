@@ -24,8 +24,18 @@ export class PDFModel {
 
   static async evaluatePDF(file: File): Promise<PDFUploadResponse> {
     try {
-      // Use the API client to send the file and get evaluation components
-      this.evaluationData = await this.apiClient.parseEvaluationComponents(file);
+      // Reopening a PDF that was evaluated before only fetches its stored evaluation model
+      const cacheKey = await this.evaluationModelKey(file);
+      const modelId = cacheKey ? localStorage.getItem(cacheKey) : null;
+      this.evaluationData = modelId ? await this.apiClient.getEvaluationModel(modelId) : null;
+
+      if (!this.evaluationData) {
+        // Use the API client to send the file and get evaluation components
+        this.evaluationData = await this.apiClient.parseEvaluationComponents(file);
+        if (cacheKey && this.evaluationData.model_id) {
+          localStorage.setItem(cacheKey, this.evaluationData.model_id);
+        }
+      }
       
       return {
         success: true,
@@ -41,6 +51,17 @@ export class PDFModel {
     }
   }
 
+  // localStorage key of the evaluation model of a file, null if the file cannot be hashed
+  // (crypto.subtle is only available in secure contexts)
+  private static async evaluationModelKey(file: File): Promise<string | null> {
+    try {
+      return `evaluationModel:${await this.apiClient.hashFile(file)}`;
+    } catch (error) {
+      console.warn('Could not hash file, evaluation model cache disabled:', error);
+      return null;
+    }
+  }
+
   static getApiQuestions(): ApiQuestion[] {
     if (!this.evaluationData) {
       return [];